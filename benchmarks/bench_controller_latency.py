@@ -0,0 +1,156 @@
+"""
+Command-to-air latency of MiLightController against a simulated radio.
+
+Compares the event driven run loop with the previous 100 ms polling loop:
+
+    python benchmarks/bench_controller_latency.py -n 1000
+"""
+import argparse
+import queue
+import statistics
+import tempfile
+import threading
+import time
+
+from pymilight.milight_control import MiLightController
+from pymilight.radio import SimulatedRF24
+
+
+# Bulb states are persisted as in the gateway, removed when the benchmark exits.
+STATE_DIR = tempfile.TemporaryDirectory()
+
+
+class TimedController(MiLightController):
+    """Records when the first copy of each command goes on air."""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedController, self).__init__(*args, **kwargs)
+        self.first_sent = []
+        self._pending_first = False
+        self._awaiting = set()
+
+    def process_command(self, command):
+        self._pending_first = True
+        super(TimedController, self).process_command(command)
+
+    def write(self, packet, repeats=None):
+        if self._pending_first:
+            self._awaiting.add(bytes(packet))
+            self._pending_first = False
+        super(TimedController, self).write(packet, repeats)
+
+    def on_air(self, packet):
+        if packet in self._awaiting:
+            self._awaiting.discard(packet)
+            self.first_sent.append(time.perf_counter())
+
+
+class PollingController(TimedController):
+    """The run loop as it was before it blocked on the inbound queue."""
+
+    def run(self):
+        self.begin()
+        while True:
+            if self.shutdown_event.is_set():
+                return
+            try:
+                command = self.inbound_queue.get(block=False)
+                self.process_command(command)
+                # Every repeat was sent before the next command was read.
+                self.flush()
+                self.inbound_queue.task_done()
+            except queue.Empty:
+                pass
+            self.modules[0].receive()
+            time.sleep(0.1)
+
+
+def build_controller(cls):
+    controller = cls(
+        queue.Queue(), queue.Queue(), threading.Event(), False,
+        rf=SimulatedRF24(), state_dir=STATE_DIR.name, daemon=True
+    )
+    for radio in controller.modules[0].radios.values():
+        write = radio.write
+
+        def timed_write(packet, write=write):
+            controller.on_air(packet)
+            return write(packet)
+        radio.write = timed_write
+    return controller
+
+
+def command(index):
+    return ("rgb_cct", 0x1000 + index % 64, 1 + index % 4, {"brightness": index % 256})
+
+
+def run_burst(cls, count):
+    controller = build_controller(cls)
+    controller.start()
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    for index in range(count):
+        controller.inbound_queue.put(command(index))
+    controller.inbound_queue.join()
+    while controller.busy():
+        time.sleep(0.0001)
+    elapsed = time.perf_counter() - start
+
+    controller.stop()
+    controller.join()
+    return elapsed, [sent - start for sent in controller.first_sent]
+
+
+def run_spaced(cls, count):
+    controller = build_controller(cls)
+    controller.start()
+    time.sleep(0.2)
+
+    latencies = []
+    for index in range(count):
+        queued = time.perf_counter()
+        controller.inbound_queue.put(command(index))
+        controller.inbound_queue.join()
+        while len(controller.first_sent) <= index:
+            time.sleep(0.0001)
+        latencies.append(controller.first_sent[-1] - queued)
+
+    controller.stop()
+    controller.join()
+    return latencies
+
+
+def report(name, values):
+    values = sorted(values)
+    print("  {:<22} p50 {:9.3f} ms  p99 {:9.3f} ms  max {:9.3f} ms".format(
+        name,
+        statistics.median(values) * 1000,
+        values[int(len(values) * 0.99) - 1] * 1000,
+        values[-1] * 1000,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", "-n", type=int, default=1000,
+                        help="Number of commands in the burst")
+    parser.add_argument("--skip-polling", action="store_true",
+                        help="Only measure the event driven loop")
+    args = parser.parse_args()
+
+    loops = [("event driven", TimedController)]
+    if not args.skip_polling:
+        loops.insert(0, ("polling (before)", PollingController))
+
+    for name, cls in loops:
+        print(name)
+        elapsed, first_sent = run_burst(cls, args.count)
+        print("  burst of {} drained in {:.3f} s ({:.0f} commands/s)".format(
+            args.count, elapsed, args.count / elapsed))
+        report("burst time to air", first_sent)
+        report("idle time to air", run_spaced(cls, min(args.count, 100)))
+
+
+if __name__ == "__main__":
+    main()
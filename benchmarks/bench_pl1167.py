@@ -0,0 +1,135 @@
+"""
+Frames per second through PL1167_nRF24.transmit and internal_receive.
+
+Compares the per-bit CRC/bit reversal loops this module used to have with
+the table driven Python helpers and the compiled pl1167_frames extension:
+
+    python benchmarks/bench_pl1167.py
+"""
+import argparse
+import importlib
+import sys
+import time
+from unittest import mock
+
+from pymilight.radio import pl1167_nrf24
+
+
+class NullRadio(object):
+    """Just enough of RF24 to transmit and receive without hardware."""
+
+    def __init__(self):
+        self.frame = b""
+
+    def write(self, frame):
+        self.frame = frame
+        return True
+
+    def read(self, length):
+        return self.frame[:length]
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def legacy_calc_crc(data):
+    state = 0
+    for cur_byte in data:
+        for _ in range(8):
+            if (cur_byte ^ state) & 0x01:
+                state = (state >> 1) ^ pl1167_nrf24.CRC_POLY
+            else:
+                state = state >> 1
+            cur_byte = cur_byte >> 1
+    return state
+
+
+def legacy_reverse_bits(data):
+    result = 0
+    for _ in range(8):
+        result <<= 1
+        result |= data & 1
+        data >>= 1
+    return result
+
+
+def legacy_encode_frame(packet, crc, out):
+    tmp = []
+    if crc:
+        crc = legacy_calc_crc(packet)
+    for inp in range(len(packet) + (crc and 2) + 1):
+        if inp < len(packet):
+            tmp += [legacy_reverse_bits(packet[inp])]
+        elif crc and inp < len(packet) + 2:
+            tmp += [legacy_reverse_bits((crc >> ((inp - len(packet)) * 8)) & 0xff)]
+    out[:len(tmp)] = bytes(tmp)
+    return len(tmp)
+
+
+def legacy_decode_frame(frame, crc, out):
+    tmp = bytearray(legacy_reverse_bits(bval) for bval in frame)
+    if crc:
+        if len(tmp) < 2 or legacy_calc_crc(tmp[:-2]) != ((tmp[-1] << 8) | tmp[-2]):
+            return -1
+        tmp = tmp[:-2]
+    out[:len(tmp)] = tmp
+    return len(tmp)
+
+
+def python_helpers():
+    # The pure Python versions are shadowed when the extension is built.
+    with mock.patch.dict(sys.modules, {"pymilight.radio.pl1167_frames": None}):
+        module = importlib.reload(pl1167_nrf24)
+        helpers = module.encode_frame, module.decode_frame
+    importlib.reload(pl1167_nrf24)
+    return helpers
+
+
+def run(encode, decode, count):
+    pl1167_nrf24.encode_frame = encode
+    pl1167_nrf24.decode_frame = decode
+
+    pl1167 = pl1167_nrf24.PL1167_nRF24(NullRadio())
+    pl1167._crc = True
+    pl1167._maxPacketLength = 10
+    # Skip the re-open after each receive, it is not what is measured here.
+    pl1167.open = lambda: 0
+    packet = bytearray(b"\x09\x00\xdb\xe1\x21\x66\xd1\xba\x66\xcc")
+
+    start = time.perf_counter()
+    for _ in range(count):
+        pl1167.writeFIFO(packet)
+        pl1167.transmit(0)
+    transmit = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        pl1167.internal_receive()
+    receive = count / (time.perf_counter() - start)
+    return transmit, receive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", "-n", type=int, default=100000,
+                        help="Frames to transmit and receive per implementation")
+    args = parser.parse_args()
+
+    implementations = [
+        ("per-bit loops", legacy_encode_frame, legacy_decode_frame),
+        ("lookup tables", ) + python_helpers(),
+    ]
+    try:
+        from pymilight.radio import pl1167_frames
+    except ImportError:
+        print("pl1167_frames extension not built, skipping compiled run")
+    else:
+        implementations.append(("compiled", pl1167_frames.encode_frame, pl1167_frames.decode_frame))
+
+    for name, encode, decode in implementations:
+        transmit, receive = run(encode, decode, args.count)
+        print("{:<14} transmit {:>9.0f} frames/s   receive {:>9.0f} frames/s".format(name, transmit, receive))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Time to first copy for a multi-bulb scene, on the simulated radio's clock.
+
+Compares sending every repeat of a packet back to back, as
+MiLightController.write used to, with the interleaving TransmitScheduler.
+Both send every repeat: the airtime budget would otherwise cut the
+interleaved scene's repeats short and flatter it.
+
+    python benchmarks/bench_scheduler.py --bulbs 8
+"""
+import argparse
+import queue
+import statistics
+import threading
+
+from pymilight.airtime import AirtimeBudget
+from pymilight.milight_control import MiLightController
+from pymilight.radio import SimulatedRF24
+
+
+class SceneController(MiLightController):
+    """Records which bulb each packet is for and when it goes on air."""
+
+    def __init__(self, *args, **kwargs):
+        super(SceneController, self).__init__(*args, **kwargs)
+        self.packet_bulbs = {}
+        self.on_air = []
+
+    def begin(self):
+        super(SceneController, self).begin()
+        for radio in self.modules[0].radios.values():
+            write = radio.write
+
+            def recording_write(packet, write=write):
+                self.on_air.append((self.rf.clock, self.packet_bulbs[bytes(packet)]))
+                return write(packet)
+            radio.write = recording_write
+
+    def write(self, packet, repeats=None):
+        self.packet_bulbs[bytes(packet)] = self.current_bulb
+        super(SceneController, self).write(packet, repeats)
+
+
+class BackToBackController(SceneController):
+    def write(self, packet, repeats=None):
+        self.packet_bulbs[bytes(packet)] = self.current_bulb
+        if repeats is None:
+            repeats = self.base_resend_count
+        module = self.modules[0]
+        # Admitted like MiLightController.write, so both pay the same.
+        repeats = module.admit(self.current_radio, repeats, self.packet_repeat_minimum)
+        self.current_resend_count = repeats
+        for _ in range(repeats):
+            module.radios[self.current_radio].write(packet)
+
+
+def run(cls, bulbs):
+    rf = SimulatedRF24()
+    controller = cls(queue.Queue(), queue.Queue(), threading.Event(), False, rf=rf)
+    controller.begin()
+    controller.repeat_timeout = None
+    controller.modules[0].airtime = AirtimeBudget(burst=1e9)
+    rf.reset()
+    start = rf.clock
+
+    for index in range(bulbs):
+        controller.process_command((
+            "rgb_cct", 0x1000 + index // 4, index % 4 + 1,
+            {"state": "ON", "brightness": 200, "hue": index * 40}
+        ))
+    controller.flush()
+
+    first_copy = {}
+    for when, bulb in controller.on_air:
+        first_copy.setdefault(bulb, when - start)
+    return sorted(first_copy.values()), rf.clock - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bulbs", type=int, default=8,
+                        help="Bulbs in the scene, each sent three packets")
+    args = parser.parse_args()
+
+    for name, cls in (("back to back", BackToBackController), ("interleaved", SceneController)):
+        first_copy, total = run(cls, args.bulbs)
+        print("{:<13} first copy mean {:6.1f} ms  last {:6.1f} ms   scene on air {:6.1f} ms".format(
+            name, statistics.mean(first_copy) * 1000, first_copy[-1] * 1000, total * 1000))
+
+
+if __name__ == "__main__":
+    main()
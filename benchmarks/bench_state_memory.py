@@ -0,0 +1,77 @@
+"""
+Memory used by the states of many bulbs.
+
+Compares the slotted State with the previous dict backed State, which also
+kept its own list of field names:
+
+    python benchmarks/bench_state_memory.py -n 100000
+"""
+import argparse
+import tracemalloc
+
+from pymilight.state import State
+
+
+class DictState(object):
+    """State's attributes as they were before it had __slots__."""
+
+    def __init__(self):
+        self._state = None
+        self._brightness = None
+        self._brightness_color = None
+        self._brightness_mode = None
+        self._hue = None
+        self._saturation = None
+        self._mode = None
+        self._bulb_mode = None
+        self._white_val = None
+        self._night_mode = None
+
+        self._dirty = 1
+        self._mqtt_dirty = 0
+
+        self._data_fields = [
+            "_state",
+            "_brightness",
+            "_brightness_color",
+            "_brightness_mode",
+            "_hue",
+            "_saturation",
+            "_mode",
+            "_bulb_mode",
+            "_white_val",
+            "_night_mode",
+            "_dirty",
+            "_mqtt_dirty",
+        ]
+
+
+def measure(state_class, count, groups=4):
+    """Bytes allocated for count bulbs, keyed the way StateStore keys them."""
+    tracemalloc.start()
+    states = {}
+    for index in range(count):
+        state = state_class()
+        state._state = True
+        state._brightness = index % 256
+        state._hue = index % 360
+        states[("rgb_cct", 0x1000 + index // groups, index % groups + 1)] = state
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", "-n", type=int, default=100000,
+                        help="Number of bulbs (remote and group combinations)")
+    args = parser.parse_args()
+
+    for name, state_class in (("dict", DictState), ("slots", State)):
+        size = measure(state_class, args.count)
+        print("{:<6} {:>7.1f} MiB  {:>5.0f} bytes/bulb".format(
+            name, size / 1048576.0, size / float(args.count)))
+
+
+if __name__ == "__main__":
+    main()
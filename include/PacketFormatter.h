@@ -26,9 +26,42 @@ struct PacketStream {
   size_t currentPacket;
 };
 
+// Fields decoded from a received packet. Only the fields flagged in
+// `fields` are set.
+enum ParsedPacketField {
+  PARSED_STATE       = 1 << 0,
+  PARSED_COMMAND     = 1 << 1,
+  PARSED_HUE         = 1 << 2,
+  PARSED_COLOR_TEMP  = 1 << 3,
+  PARSED_BRIGHTNESS  = 1 << 4,
+  PARSED_SATURATION  = 1 << 5,
+  PARSED_MODE        = 1 << 6,
+  PARSED_BUTTON      = 1 << 7
+};
+
+struct ParsedPacket {
+  ParsedPacket();
+
+  uint16_t fields;
+  MiLightStatus state;
+  const char* command;
+  uint16_t hue;
+  uint16_t colorTemp;
+  uint8_t brightness;
+  uint8_t saturation;
+  uint8_t mode;
+  uint8_t buttonId;
+  uint8_t argument;
+
+  void toJson(JsonObject& result) const;
+};
+
 class PacketFormatter {
 public:
   PacketFormatter(const size_t packetLength, const size_t maxPackets = 1);
+  // packetStream points into this instance's own buffer.
+  PacketFormatter(const PacketFormatter&) = delete;
+  PacketFormatter& operator=(const PacketFormatter&) = delete;
 
   typedef void (PacketFormatter::*StepFunction)();
 
@@ -74,6 +107,7 @@ public:
   virtual void prepare(uint16_t deviceId, uint8_t groupId);
   virtual void format(uint8_t const* packet, char* buffer);
 
+  virtual BulbId decodePacket(const uint8_t* packet, ParsedPacket& result);
   virtual BulbId parsePacket(const uint8_t* packet, JsonObject& result, GroupStateStore* stateStore);
 
   static void formatV1Packet(uint8_t const* packet, char* buffer);
@@ -89,6 +123,9 @@ protected:
   size_t numPackets;
   bool held;
   PacketStream packetStream;
+  // Each formatter builds into its own buffer, so formatters can be used
+  // from different threads at once.
+  uint8_t packetBuffer[PACKET_FORMATTER_BUFFER_SIZE];
 
   void pushPacket();
   void valueByStepFunction(StepFunction increase, StepFunction decrease, uint8_t numSteps, uint8_t value);
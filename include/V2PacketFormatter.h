@@ -9,6 +9,7 @@
 #define V2_PROTOCOL_ID_INDEX 1
 #define V2_COMMAND_INDEX 4
 #define V2_ARGUMENT_INDEX 5
+#define V2_SEQUENCE_INDEX 6
 
 class V2PacketFormatter : public PacketFormatter {
 public:
@@ -24,6 +25,9 @@ public:
 
   virtual void finalizePacket(uint8_t* packet);
 
+  // Encode a copy of a decoded packet with the next sequence number.
+  void restampPacket(const uint8_t* decoded, uint8_t* packet);
+
   uint8_t groupCommandArg(MiLightStatus status, uint8_t groupId);
 
 protected:
@@ -1,12 +1,21 @@
 import argparse
+import asyncio
 import json
 import logging
 import queue
+import signal
 import threading
 import time
 
-from pymilight.milight_control import MiLightController
+from pymilight.aio_mqtt_client import AsyncMqttClient, ThreadsafeQueueWriter
+from pymilight.metrics import REGISTRY, start_http_server
+from pymilight.milight_control import MiLightController, create_modules
 from pymilight.mqtt_client import MqttClient
+from pymilight.trace import TRACE, install_signal_handler
+
+
+# Where bulb states are persisted unless the config has a "state_dir".
+DEFAULT_STATE_DIR = "tmp"
 
 
 def get_parser():
@@ -17,9 +26,78 @@ def get_parser():
     parser.add_argument("--interactive", "-i",
                         help="Run in interactive mode",
                         action="store_true")
+    parser.add_argument("--asyncio",
+                        help="Run the MQTT side on an asyncio event loop",
+                        action="store_true")
+    parser.add_argument("--stats",
+                        help="Print the gateway metrics periodically",
+                        action="store_true")
+    parser.add_argument("--stats-interval",
+                        help="Seconds between --stats dumps",
+                        type=float,
+                        default=60)
     return parser
 
 
+def dump_stats(interval):
+    while True:
+        time.sleep(interval)
+        print(REGISTRY.render(), flush=True)
+
+
+async def async_main(config, interactive):
+    loop = asyncio.get_running_loop()
+
+    mqtt_client = AsyncMqttClient(config, loop)
+    await mqtt_client.connect()
+
+    inbound = queue.Queue()
+    outbound = asyncio.Queue()
+    shutdown = threading.Event()
+
+    controller = MiLightController(
+        inbound, ThreadsafeQueueWriter(loop, outbound), shutdown, False,
+        modules=create_modules(config), state_dir=config.get("state_dir", DEFAULT_STATE_DIR)
+    )
+    controller.start()
+
+    async def forward_commands():
+        while True:
+            command = await mqtt_client.commands.get()
+            inbound.put(command)
+
+    async def mqtt_publish():
+        while True:
+            dtype, did, gid, value = await outbound.get()
+            await mqtt_client.send_update(dtype, did, gid, value)
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    def wait_for_quit():
+        while True:
+            key = input("Press q to quit:")
+            if key.lower().startswith("q"):
+                loop.call_soon_threadsafe(stop.set)
+                return
+
+    if interactive:
+        threading.Thread(target=wait_for_quit, daemon=True).start()
+
+    tasks = [
+        loop.create_task(forward_commands()),
+        loop.create_task(mqtt_publish()),
+    ]
+    await stop.wait()
+
+    for task in tasks:
+        task.cancel()
+    controller.stop()
+    await loop.run_in_executor(None, controller.join)
+    mqtt_client.disconnect()
+
+
 def main(args=None):
     if args is None:
         args = get_parser().parse_args()
@@ -35,6 +113,20 @@ def main(args=None):
 
     logging.basicConfig(level=logging.DEBUG)
 
+    # kill -USR1 dumps the frames recently sent and received.
+    install_signal_handler(TRACE, config.get("trace_file", "pymilight-trace.bin"))
+
+    if config.get("metrics_port") is not None:
+        start_http_server(config["metrics_port"], config.get("metrics_host", "127.0.0.1"))
+    if args.stats:
+        threading.Thread(target=dump_stats, args=(args.stats_interval,), daemon=True).start()
+
+    if args.asyncio:
+        asyncio.run(async_main(config, interactive))
+        if args.stats:
+            print(REGISTRY.render())
+        return True
+
     inbound = queue.Queue()
     outbound = queue.Queue()
     shutdown = threading.Event()
@@ -48,14 +140,17 @@ def main(args=None):
                 break
             try:
                 dtype, did, gid, value = outbound.get(timeout=2)
-                mqtt_client.send_update(dtype, did, gid, json.dumps(value))
+                mqtt_client.send_update(dtype, did, gid, value)
                 outbound.task_done()
             except queue.Empty:
                 pass
 
     mqtt_client = MqttClient(config, mqtt_to_queue)
 
-    controller = MiLightController(inbound, outbound, shutdown, False)
+    controller = MiLightController(
+        inbound, outbound, shutdown, False,
+        modules=create_modules(config), state_dir=config.get("state_dir", DEFAULT_STATE_DIR)
+    )
     controller.start()
     controller.set_current_radio("rgb_cct")
 
@@ -66,11 +161,14 @@ def main(args=None):
         if interactive:
             key = input("Press q to quit:")
             if key.lower().startswith("q"):
-                shutdown.set()
+                controller.stop()
                 controller.join()
                 break
         time.sleep(1)
 
+    if args.stats:
+        print(REGISTRY.render())
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+"""
+asyncio variant of MqttClient.
+
+The paho client is driven from the event loop's socket callbacks instead
+of its own network thread. Received commands are put on an asyncio.Queue
+and publishing can be awaited. Connecting blocks on DNS and TCP, so it
+runs in the default executor, and a lost connection is retried with an
+exponential backoff like paho's own loop does.
+"""
+import asyncio
+import logging
+import socket
+
+import paho.mqtt.client as mqtt
+
+from pymilight.mqtt_client import MqttClient
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ThreadsafeQueueWriter(object):
+    """Lets a thread put() onto an asyncio.Queue owned by an event loop."""
+
+    def __init__(self, loop, async_queue):
+        self.loop = loop
+        self.queue = async_queue
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def qsize(self):
+        # Items still being handed over to the loop are not counted yet.
+        return self.queue.qsize()
+
+
+class AsyncMqttClient(MqttClient):
+    # Seconds to wait before reconnecting, doubled after every failure.
+    RECONNECT_MIN_DELAY = 1
+    RECONNECT_MAX_DELAY = 120
+
+    def __init__(self, config, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.commands = asyncio.Queue()
+        self.reconnect_min_delay = self.RECONNECT_MIN_DELAY
+        self.reconnect_max_delay = self.RECONNECT_MAX_DELAY
+        self.reconnects = 0
+        self._misc_task = None
+        self._reconnect_task = None
+        self._closed = asyncio.Event()
+        self._stopping = False
+        self._published = {}
+        super(AsyncMqttClient, self).__init__(config, self._queue_command)
+
+    def _queue_command(self, device_type, device_id, group_id, msg):
+        self.commands.put_nowait((device_type, device_id, group_id, msg))
+
+    def _connect(self):
+        self._mqtt = mqtt.Client()
+        self._mqtt.on_message = self.message_callback
+        self._mqtt.on_connect = self.connect_callback
+        self._mqtt.on_publish = self.publish_callback
+        self._mqtt.on_socket_open = self.socket_open_callback
+        self._mqtt.on_socket_close = self.socket_close_callback
+        self._mqtt.on_socket_register_write = self.socket_register_write_callback
+        self._mqtt.on_socket_unregister_write = self.socket_unregister_write_callback
+
+    async def connect(self):
+        """Connect, and keep reconnecting until disconnect()."""
+        LOGGER.info("Connecting to: %s", self.mqtt_host)
+        self._stopping = False
+        self._mqtt.connect_async(self.mqtt_host, self.mqtt_port, 60)
+        if not await self._try_connect():
+            self._closed.set()
+        self._reconnect_task = self.loop.create_task(self._reconnect_loop())
+
+    def disconnect(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._mqtt.disconnect()
+
+    async def _try_connect(self):
+        try:
+            await self.loop.run_in_executor(None, self._mqtt.reconnect)
+        except (OSError, ValueError) as err:
+            LOGGER.warning("Failed to connect to %s: %s", self.mqtt_host, err)
+            return False
+        return True
+
+    async def _reconnect_loop(self):
+        delay = self.reconnect_min_delay
+        while True:
+            await self._closed.wait()
+            if self._stopping:
+                return
+            LOGGER.info("Reconnecting to %s in %s s", self.mqtt_host, delay)
+            await asyncio.sleep(delay)
+            self.reconnects += 1
+            if await self._try_connect():
+                delay = self.reconnect_min_delay
+            else:
+                delay = min(delay * 2, self.reconnect_max_delay)
+
+    def _on_loop(self, callback, *args):
+        # paho calls the socket callbacks from the executor while connecting.
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def socket_open_callback(self, client, userdata, sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+        self._on_loop(self._socket_opened, client, sock.fileno())
+
+    def _socket_opened(self, client, fd):
+        self._closed.clear()
+        self.loop.add_reader(fd, client.loop_read)
+        if self._misc_task is None or self._misc_task.done():
+            self._misc_task = self.loop.create_task(self._misc_loop())
+
+    def socket_close_callback(self, client, userdata, sock):
+        # The socket is closed once this returns, so its fd is passed on.
+        self._on_loop(self._socket_closed, sock.fileno())
+
+    def _socket_closed(self, fd):
+        self.loop.remove_reader(fd)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        # paho drops QoS 0 messages still queued without calling on_publish.
+        for future in self._published.values():
+            if future is not True and not future.done():
+                future.set_result(None)
+        self._published.clear()
+        self._closed.set()
+
+    def socket_register_write_callback(self, client, userdata, sock):
+        self._on_loop(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def socket_unregister_write_callback(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_writer, sock.fileno())
+
+    async def _misc_loop(self):
+        # Keepalives and retries, which paho's own thread would otherwise do.
+        while self._mqtt.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def publish_callback(self, client, userdata, mid, *args):
+        future = self._published.pop(mid, None)
+        if future is None:
+            # Sent before publish() got to wait for it.
+            self._published[mid] = True
+        elif not future.done():
+            future.set_result(mid)
+
+    async def send_update(self, device_type, device_id, group_id, update):
+        await self._publish(
+            self.mqtt_update_topic_pattern,
+            device_type,
+            device_id,
+            group_id,
+            update
+        )
+
+    async def send_state(self, device_type, device_id, group_id, update):
+        await self._publish(
+            self.mqtt_state_topic_pattern,
+            device_type,
+            device_id,
+            group_id,
+            update,
+            True
+        )
+
+    async def _publish(self, topic, device_type, device_id, group_id, message, retain=False):
+        if not topic:
+            return
+
+        info = super(AsyncMqttClient, self)._publish(topic, device_type, device_id, group_id, message, retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            LOGGER.warning("Failed to publish to %s: %s", topic, mqtt.error_string(info.rc))
+            return
+        if self._published.pop(info.mid, None) is True:
+            return
+        future = self.loop.create_future()
+        self._published[info.mid] = future
+        if await future is None:
+            LOGGER.warning("Connection lost before publishing to %s", topic)
@@ -0,0 +1,71 @@
+"""
+Share a radio's airtime between the packets sent through it.
+
+Each repeat of a packet is one frame on every channel of its remote type,
+so a command for a busy radio can easily wait behind thousands of frames.
+AirtimeBudget is a token bucket of frames: it fills at rate frames per
+second, up to burst, and each packet takes the frames of its repeats. A
+packet gets all the repeats it asks for while there is room, fewer when
+the bucket runs low or frames are still waiting to be sent, but never
+fewer than the minimum. The minimum may overdraw the bucket, so later
+packets get less until the radio catches up.
+"""
+import time
+
+from pymilight.metrics import REGISTRY
+
+
+REPEATS = REGISTRY.histogram(
+    "pymilight_airtime_repeats", "Repeats granted to each packet", buckets=(1, 2, 3, 5, 10, 20)
+)
+REPEATS_THROTTLED = REGISTRY.counter(
+    "pymilight_airtime_repeats_throttled_total", "Repeats withheld from packets to stay within the airtime budget"
+)
+FRAMES_ADMITTED = REGISTRY.counter("pymilight_airtime_frames_total", "Frames admitted by the airtime budget")
+
+
+class AirtimeBudget(object):
+    # Frames per second one radio sends, each about 300 us on air plus SPI.
+    DEFAULT_RATE = 2000
+    # Frames that may be queued at once, a tenth of a second.
+    DEFAULT_BURST = 200
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.admitted = 0
+        self.throttled = 0
+        self._updated = clock()
+
+    def available(self, backlog=0):
+        """
+        Frames that can be sent without waiting. backlog is the frames
+        known to be queued, which the bucket may not have caught up with.
+        """
+        tokens = self.tokens + (self.clock() - self._updated) * self.rate
+        return min(tokens, self.burst - backlog, self.burst)
+
+    def admit(self, repeats, minimum, channels, backlog=0):
+        """
+        Return how many of repeats to send a packet with, each repeat being
+        one frame on each of channels. Never less than minimum, unless
+        fewer repeats were asked for.
+        """
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        affordable = int(max(0, min(self.tokens, self.burst - backlog)) // channels)
+        granted = min(repeats, max(minimum, affordable))
+        # The minimum is sent regardless, but an overdraft is kept to one burst.
+        self.tokens = max(self.tokens - granted * channels, -self.burst)
+
+        self.admitted += granted * channels
+        self.throttled += repeats - granted
+        REPEATS.observe(granted)
+        FRAMES_ADMITTED.inc(granted * channels)
+        if granted < repeats:
+            REPEATS_THROTTLED.inc(repeats - granted)
+        return granted
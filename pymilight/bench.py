@@ -0,0 +1,283 @@
+"""
+Load generator for the MQTT to radio pipeline.
+
+Feeds MQTT messages into MqttClient.message_callback at a fixed rate, runs
+them through a MiLightController and a simulated radio, and reports the
+throughput, queue depths and latency from message arrival to the last
+repeat going on air. The controller empties the inbound queue at once, so
+the radio modules' request queues and the repeats their schedulers still
+have to send are sampled too. Runs entirely in-process:
+
+    python -m pymilight.bench --devices 20 --groups 4 --rate 200 --duration 10
+"""
+import argparse
+import collections
+import json
+import logging
+import queue
+import random
+import tempfile
+import threading
+import time
+
+from pymilight.milight_control import MiLightController
+from pymilight.mqtt_client import MqttClient
+from pymilight.radio import SimulatedRF24
+
+
+TOPIC_PATTERN = "milight/commands/:device_id/:device_type/:group_id"
+
+FakeMessage = collections.namedtuple("FakeMessage", ["topic", "payload"])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="pymilight load generator")
+    parser.add_argument("--devices", type=int, default=10,
+                        help="Number of simulated remotes (device ids)")
+    parser.add_argument("--groups", type=int, default=4,
+                        help="Groups per remote")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="MQTT messages per second, across all bulbs")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="Seconds to generate messages for")
+    parser.add_argument("--drain-timeout", type=float, default=60,
+                        help="Seconds to wait for the backlog once generation stops")
+    parser.add_argument("--sample-interval", type=float, default=0.1,
+                        help="Seconds between queue depth samples")
+    parser.add_argument("--virtual-airtime", action="store_true",
+                        help="Do not sleep for each frame's airtime")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON")
+    return parser
+
+
+class StubBroker(object):
+    """Takes the place of the paho client, counting what is published."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload, retain=False):
+        self.published += 1
+
+    def subscribe(self, topic):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class StubbedMqttClient(MqttClient):
+    def _connect(self):
+        self._mqtt = StubBroker()
+
+
+class LatencyTracker(object):
+    """Matches message arrival times with when their command finished sending."""
+
+    def __init__(self):
+        self.latencies = []
+        self.completed = 0
+        self._arrivals = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+    def arrived(self, key):
+        with self._lock:
+            self._arrivals[key].append(time.perf_counter())
+
+    def sent(self, key, started):
+        """Record that everything for key that arrived before started is on air."""
+        now = time.perf_counter()
+        with self._lock:
+            arrivals = self._arrivals[key]
+            while arrivals and arrivals[0] <= started:
+                self.latencies.append(now - arrivals.popleft())
+            self.completed += 1
+
+
+class TrackedController(MiLightController):
+    def __init__(self, tracker, *args, **kwargs):
+        super(TrackedController, self).__init__(*args, **kwargs)
+        self.tracker = tracker
+
+    def process_command(self, command):
+        started = time.perf_counter()
+        super(TrackedController, self).process_command(command)
+        key = tuple(command[:3])
+        self.notify_sent(key, lambda: self.tracker.sent(key, started))
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[index]
+
+
+def generate(mqtt_client, args):
+    rand = random.Random(args.seed)
+    bulbs = [
+        (0x1000 + device, group)
+        for device in range(args.devices)
+        for group in range(1, args.groups + 1)
+    ]
+
+    start = time.perf_counter()
+    count = int(args.rate * args.duration)
+    for index in range(count):
+        # Open loop: keep to the schedule however far behind the gateway is.
+        delay = start + index / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        device_id, group_id = rand.choice(bulbs)
+        topic = "milight/commands/0x{:x}/rgb_cct/{}".format(device_id, group_id)
+        payload = {"state": "ON", "brightness": rand.randrange(256)}
+        if rand.random() < 0.5:
+            payload["hue"] = rand.randrange(360)
+        mqtt_client.message_callback(None, None, FakeMessage(topic, json.dumps(payload).encode("utf-8")))
+    return count
+
+
+# The queues sampled, in the order of each sample's depths.
+QUEUES = ("inbound", "requests", "repeats")
+
+
+def sample_queue(inbound, modules, interval, samples, stop):
+    start = time.perf_counter()
+    while not stop.wait(interval):
+        samples.append((
+            time.perf_counter() - start,
+            inbound.qsize(),
+            sum(module.requests.qsize() for module in modules),
+            sum(module.scheduler.queued_repeats for module in modules),
+        ))
+
+
+def summarize_depths(samples, index):
+    depths = [sample[index] for sample in samples]
+    return {
+        "max": max(depths) if depths else 0,
+        "mean": sum(depths) / float(len(depths)) if depths else 0,
+    }
+
+
+def run(args):
+    inbound = queue.Queue()
+    outbound = queue.Queue()
+    shutdown = threading.Event()
+    tracker = LatencyTracker()
+
+    def mqtt_to_queue(device_type, device_id, group_id, msg):
+        tracker.arrived((device_type, device_id, group_id))
+        inbound.put((device_type, device_id, group_id, msg))
+
+    config = {
+        "mqtt_topic_pattern": TOPIC_PATTERN,
+        "mqtt_update_topic_pattern": "",
+        "mqtt_state_topic_pattern": "",
+        "mqtt_host": "localhost",
+        "mqtt_port": 1883,
+    }
+    mqtt_client = StubbedMqttClient(config, mqtt_to_queue)
+
+    rf = SimulatedRF24(realtime=not args.virtual_airtime)
+    # States are persisted as in the gateway, but not into the working directory.
+    state_dir = tempfile.TemporaryDirectory()
+    controller = TrackedController(
+        tracker, inbound, outbound, shutdown, False, rf=rf, state_dir=state_dir.name, daemon=True
+    )
+    controller.start()
+
+    samples = []
+    sampling = threading.Event()
+    sampler = threading.Thread(
+        target=sample_queue,
+        args=(inbound, controller.modules, args.sample_interval, samples, sampling),
+        daemon=True
+    )
+    sampler.start()
+
+    start = time.perf_counter()
+    sent = generate(mqtt_client, args)
+
+    deadline = time.perf_counter() + args.drain_timeout
+    while (inbound.unfinished_tasks or controller.busy()) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    backlog = inbound.unfinished_tasks
+
+    sampling.set()
+    controller.stop()
+    controller.join(1)
+    state_dir.cleanup()
+
+    latencies = tracker.latencies
+    return {
+        "messages_sent": sent,
+        "messages_completed": len(latencies),
+        "commands_sent": tracker.completed,
+        "backlog": backlog,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "frames": len(rf.frames),
+        "airtime": rf.airtime,
+        "latency": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "queue_depth": dict(
+            {name: summarize_depths(samples, index + 1) for index, name in enumerate(QUEUES)},
+            samples=samples
+        ),
+    }
+
+
+def format_seconds(value):
+    if value is None:
+        return "n/a"
+    return "{:.1f} ms".format(value * 1000)
+
+
+def print_report(args, result):
+    print("{} bulbs, {:.0f} messages/s for {:.0f} s".format(
+        args.devices * args.groups, args.rate, args.duration))
+    print("  messages sent       {}".format(result["messages_sent"]))
+    print("  messages completed  {} ({} radio commands after coalescing)".format(
+        result["messages_completed"], result["commands_sent"]))
+    print("  backlog at end      {}".format(result["backlog"]))
+    print("  throughput          {:.1f} messages/s".format(result["throughput"]))
+    print("  frames on air       {} ({:.1f} s of airtime)".format(result["frames"], result["airtime"]))
+    print("  latency             p50 {}  p95 {}  p99 {}  max {}".format(
+        *(format_seconds(result["latency"][key]) for key in ("p50", "p95", "p99", "max"))))
+    for name in QUEUES:
+        depth = result["queue_depth"][name]
+        print("  {:<19s} max {}  mean {:.1f}".format(name + " depth", depth["max"], depth["mean"]))
+
+    # One line per second of the largest depth of each queue.
+    samples = result["queue_depth"]["samples"]
+    print("    {:>5s}  {:>8s}  {:>8s}  {:>8s}".format("", *QUEUES))
+    for second in range(int(samples[-1][0]) + 1 if samples else 0):
+        current = [sample[1:] for sample in samples if second <= sample[0] < second + 1]
+        if current:
+            print("    {:>4d}s  {:>8d}  {:>8d}  {:>8d}".format(second, *(max(depths) for depths in zip(*current))))
+
+
+def main(args=None):
+    if args is None:
+        args = get_parser().parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run(args)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_report(args, result)
+
+
+if __name__ == '__main__':
+    main()
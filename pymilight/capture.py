@@ -0,0 +1,232 @@
+"""
+Capture files of received packets.
+
+A capture is a header followed by fixed-size records, each holding the
+time, the channel and the raw packet, so hours of traffic can be decoded
+later. The reader memory-maps the file and decodes it in chunks with
+PyPacketFormatter.decode_records(), which returns columns rather than an
+object per packet. Print a capture with:
+
+    python -m pymilight.capture capture.bin --device-id 0x1234 --command hue
+"""
+import argparse
+import array
+import collections
+import mmap
+import struct
+import threading
+import time
+
+from pymilight.packet_formatter import COMMAND_NAMES, PARSED_FIELDS
+from pymilight.radio_module import FORMATTERS
+
+
+MAGIC = b"PLCP"
+MAX_BYTES = 9
+# magic, record size, remote type
+HEADER = struct.Struct("<4sH10s")
+# timestamp, channel, packet length, packet. Padded so timestamps stay aligned.
+RECORD = struct.Struct("<dBB{}s5x".format(MAX_BYTES))
+FRAME_OFFSET = 10
+
+CapturedPacket = collections.namedtuple(
+    "CapturedPacket", ["timestamp", "channel", "device_type", "device_id", "group_id", "fields", "raw"]
+)
+
+
+class CaptureWriter(object):
+    """Append received packets of one remote type to a capture file."""
+
+    def __init__(self, path, device_type="rgb_cct", clock=time.time):
+        self.path = path
+        self.device_type = device_type
+        self.clock = clock
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(HEADER.pack(MAGIC, RECORD.size, device_type.encode("ascii")))
+        else:
+            Capture.check_header(path)
+            # Drop a record cut short by a crash, or every record after it is misaligned.
+            records = (size - HEADER.size) // RECORD.size
+            self._file.truncate(HEADER.size + records * RECORD.size)
+
+    def write(self, channel, packet):
+        record = RECORD.pack(self.clock(), channel, min(len(packet), MAX_BYTES), bytes(packet))
+        with self._lock:
+            self._file.write(record)
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Capture(object):
+    """A capture file, memory-mapped for reading."""
+
+    DEFAULT_CHUNK = 65536
+
+    def __init__(self, path):
+        self.path = path
+        self.device_type = self.check_header(path)
+        self.formatter = FORMATTERS[self.device_type]()
+        with open(path, "rb") as fobj:
+            self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def check_header(path):
+        """Return the remote type of the capture at path."""
+        with open(path, "rb") as fobj:
+            header = fobj.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("Not a packet capture: %s" % path)
+        magic, record_size, device_type = HEADER.unpack(header)
+        device_type = device_type.rstrip(b"\0").decode("ascii")
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError("Not a packet capture: %s" % path)
+        if device_type not in FORMATTERS:
+            raise ValueError("No packet formatter for %s captures" % device_type)
+        return device_type
+
+    def __len__(self):
+        # A record cut short by a crash is ignored.
+        return (len(self._mmap) - HEADER.size) // RECORD.size
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def columns(self, start=0, stop=None):
+        """
+        Decode records start to stop. Returns a dict of columns, those of
+        decode_records() plus "timestamp" and "channel".
+        """
+        length = len(self)
+        stop = length if stop is None else min(stop, length)
+        start = min(start, stop)
+        view = memoryview(self._mmap)[HEADER.size + start * RECORD.size:HEADER.size + stop * RECORD.size]
+        try:
+            columns = self.formatter.decode_records(view, RECORD.size, FRAME_OFFSET)
+            columns["timestamp"] = array.array("d", view.cast("d")[::RECORD.size // 8])
+            columns["channel"] = array.array("B", bytes(view[8::RECORD.size]))
+        finally:
+            view.release()
+        return columns
+
+    def chunks(self, chunk=DEFAULT_CHUNK):
+        """Yield (first record index, columns) for every chunk of records."""
+        for start in range(0, len(self), chunk):
+            yield start, self.columns(start, start + chunk)
+
+    def raw(self, index):
+        record = unpack_record(self._mmap, HEADER.size + index * RECORD.size)
+        return record[2]
+
+    def packets(self, device_id=None, group_id=None, command=None, chunk=DEFAULT_CHUNK):
+        """Yield a CapturedPacket for each record matching the filters, see select()."""
+        for start, columns in self.chunks(chunk):
+            for row in select(columns, device_id, group_id, command):
+                yield CapturedPacket(
+                    columns["timestamp"][row],
+                    columns["channel"][row],
+                    self.device_type,
+                    columns["device_id"][row],
+                    columns["group_id"][row],
+                    row_fields(columns, row),
+                    self.raw(start + row)
+                )
+
+
+def unpack_record(buffer, offset=0):
+    """Return (timestamp, channel, packet) for the record at offset."""
+    timestamp, channel, length, packet = RECORD.unpack_from(buffer, offset)
+    return timestamp, channel, packet[:length]
+
+
+def select(columns, device_id=None, group_id=None, command=None):
+    """
+    Indexes of the rows matching every filter given. command is the name
+    of a field, e.g. "hue", or of a command, e.g. "night_mode".
+    """
+    rows = range(len(columns["device_id"]))
+    if device_id is not None:
+        rows = [row for row in rows if columns["device_id"][row] == device_id]
+    if group_id is not None:
+        rows = [row for row in rows if columns["group_id"][row] == group_id]
+    if command in PARSED_FIELDS:
+        flag = 1 << PARSED_FIELDS.index(command)
+        rows = [row for row in rows if columns["fields"][row] & flag]
+    elif command is not None:
+        if command not in COMMAND_NAMES[1:]:
+            raise ValueError("Unknown command: %s" % command)
+        code = COMMAND_NAMES.index(command)
+        rows = [row for row in rows if columns["command"][row] == code]
+    return list(rows)
+
+
+def row_fields(columns, row):
+    """The fields of one row as returned by PyPacketFormatter.parse()."""
+    flags = columns["fields"][row]
+    fields = {}
+    for index, name in enumerate(PARSED_FIELDS):
+        if not flags & (1 << index):
+            continue
+        if name == "state":
+            fields["state"] = "ON" if columns["state"][row] else "OFF"
+        elif name == "command":
+            fields["command"] = COMMAND_NAMES[columns["command"][row]]
+        elif name == "button_id":
+            fields["button_id"] = columns["button_id"][row]
+            fields["argument"] = columns["argument"][row]
+        else:
+            fields[name] = columns[name][row]
+    return fields
+
+
+def format_packet(packet):
+    return "{:.6f} ch {:>3} {} 0x{:04X} {} {} {}".format(
+        packet.timestamp,
+        packet.channel,
+        packet.device_type,
+        packet.device_id,
+        packet.group_id,
+        packet.raw.hex(),
+        " ".join("{}={}".format(name, value) for name, value in packet.fields.items())
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Decode a packet capture")
+    parser.add_argument("path")
+    parser.add_argument("--device-id", type=lambda value: int(value, 0),
+                        help="Only packets for this device id, e.g. 0x1234")
+    parser.add_argument("--group-id", type=int, help="Only packets for this group")
+    parser.add_argument("--command", choices=PARSED_FIELDS + COMMAND_NAMES[1:],
+                        help="Only packets setting this field or sending this command")
+    args = parser.parse_args(args)
+
+    with Capture(args.path) as capture:
+        for packet in capture.packets(args.device_id, args.group_id, args.command):
+            print(format_packet(packet))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Merge queued commands for the same bulb so only the latest state is sent.
+
+Commands are merged field by field with the last writer winning. A command
+is never merged across an on/off change or into a command that steps or
+toggles something (``level_up``, ``pair``, raw button presses, ...), so the
+bulb sees those in the order they were received. Commands with different
+``transition`` times are kept apart too, so a fade only covers the fields
+it was requested for.
+"""
+
+# Fields whose effect depends on how many times they are sent.
+ORDERED_FIELDS = ("command", "commands", "button_id", "argument")
+
+# Different names for the same thing, the last one written wins.
+ALIASES = (
+    ("state", "status"),
+    ("brightness", "level"),
+)
+
+# Fields that put the bulb in a mode. Setting one group replaces the others.
+MODE_GROUPS = (
+    ("hue", "saturation", "color"),
+    ("temperature", "color_temp"),
+    ("effect", "mode"),
+)
+
+
+def get_status(msg):
+    status = msg.get("state", msg.get("status"))
+    if status is None:
+        return None
+    return status.lower() in ("on", "true")
+
+
+def can_merge(pending, msg):
+    if any(field in pending or field in msg for field in ORDERED_FIELDS):
+        return False
+
+    if ("transition" in pending or "transition" in msg) and \
+            pending.get("transition") != msg.get("transition"):
+        return False
+
+    pending_status = get_status(pending)
+    status = get_status(msg)
+    if status is not None and pending_status is not None and status != pending_status:
+        return False
+
+    # Anything after an off would otherwise be sent before it.
+    if pending_status is False and any(
+            field not in ("state", "status") for field in msg):
+        return False
+
+    # A colour sets hue and saturation, and is sent after them.
+    if "color" in pending and "color" not in msg and (
+            "hue" in msg or "saturation" in msg):
+        return False
+
+    # An effect is sent before brightness, which would take the bulb back
+    # out of night mode.
+    if "effect" in msg and ("brightness" in pending or "level" in pending):
+        return False
+
+    return True
+
+
+def merge(pending, msg):
+    for field in msg:
+        for group in ALIASES:
+            if field in group:
+                for other in group:
+                    pending.pop(other, None)
+
+        for group in MODE_GROUPS:
+            if field in group:
+                for other_group in MODE_GROUPS:
+                    if other_group is not group:
+                        for other in other_group:
+                            pending.pop(other, None)
+
+        if field == "color":
+            pending.pop("hue", None)
+            pending.pop("saturation", None)
+
+    pending.update(msg)
+    return pending
+
+
+class CommandCoalescer(object):
+    def __init__(self):
+        self._pending = []
+        self._tails = {}
+        self.merged = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, command):
+        device_type, device_id, group_id, msg = command
+        key = (device_type, device_id, group_id)
+
+        tail = self._tails.get(key)
+        if tail is not None and can_merge(tail[3], msg):
+            merge(tail[3], msg)
+            self.merged += 1
+            return
+
+        entry = [device_type, device_id, group_id, dict(msg)]
+        self._pending.append(entry)
+        self._tails[key] = entry
+
+    def drain(self):
+        """Return the pending commands in arrival order and forget them."""
+        pending = self._pending
+        self._pending = []
+        self._tails = {}
+        return [tuple(entry) for entry in pending]
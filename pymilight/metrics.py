@@ -0,0 +1,219 @@
+"""
+Counters, gauges and histograms for watching the gateway.
+
+Recording is an attribute update, cheap enough for the radio paths.
+Values that already exist elsewhere, like queue depths, are read by a
+function when the metrics are collected instead. Updates are not locked,
+so a count can very occasionally miss an increment made by two threads
+at once.
+
+The registry renders the Prometheus text format, which start_http_server
+serves from a background thread.
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, value) for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    kind = "counter"
+    __slots__ = ("name", "help", "labels", "value", "function")
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+    def samples(self):
+        yield self.name, self.labels, self.get()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram(object):
+    kind = "histogram"
+    __slots__ = ("name", "help", "labels", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # One more for values above the last bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield self.name + "_bucket", self.labels + (("le", format_value(bound)),), cumulative
+        yield self.name + "_sum", self.labels, self.sum
+        yield self.name + "_count", self.labels, self.count
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        labels = tuple(sorted((labels or {}).items()))
+        key = (name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError("%s is already registered as a %s" % (name, metric.kind))
+        return metric
+
+    def counter(self, name, help, labels=None, function=None):
+        """
+        Return the counter name with labels, creating it if needed.
+
+        A function, if given, is called for the value when collecting and
+        replaces any registered before.
+        """
+        counter = self._get(Counter, name, help, labels)
+        if function is not None:
+            counter.function = function
+        return counter
+
+    def gauge(self, name, help, labels=None, function=None):
+        gauge = self._get(Gauge, name, help, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def register(self, metric):
+        """
+        Add metric, replacing any of the same name and labels. For metrics
+        that belong to an object, e.g. read from its attributes by a
+        function, which unregister() when the object is done with.
+        """
+        metric.labels = tuple(sorted(dict(metric.labels).items()))
+        key = (metric.name, metric.labels)
+        with self._lock:
+            existing = self._metrics.get(key)
+            if existing is not None and existing.kind != metric.kind:
+                raise ValueError("%s is already registered as a %s" % (metric.name, existing.kind))
+            self._metrics[key] = metric
+        return metric
+
+    def unregister(self, metric):
+        """Remove metric, unless it has since been replaced."""
+        key = (metric.name, metric.labels)
+        with self._lock:
+            if self._metrics.get(key) is metric:
+                del self._metrics[key]
+
+    def collect(self):
+        """Return {name: value} for every sample, for printing or JSON."""
+        return {
+            name + format_labels(labels): value
+            for metric, samples in self._samples()
+            for name, labels, value in samples
+        }
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for metric, samples in self._samples():
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append("# HELP {} {}".format(metric.name, metric.help))
+                lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for name, labels, value in samples:
+                lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def _samples(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: (metric.name, metric.labels))
+        for metric in metrics:
+            try:
+                yield metric, list(metric.samples())
+            except Exception as err:
+                LOGGER.warning("Failed to collect %s: %s", metric.name, err)
+
+
+# Used by the gateway's own metrics.
+REGISTRY = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve registry on http://host:port/metrics from a daemon thread."""
+    handler = type("BoundMetricsHandler", (MetricsHandler,), {"registry": registry})
+    server = HTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    LOGGER.info("Serving metrics on http://%s:%d/metrics", host, server.server_port)
+    return server
@@ -1,159 +1,444 @@
 """Main controller to send/receive packets."""
+import functools
 import logging
-import math
 import queue
 import time
-import sys
-if sys.platform == "darwin":
-    #TODO: fixme
-    def clock_gettime(clk):
-        return time.clock()
-    time.clock_gettime = clock_gettime
-    time.CLOCK_MONOTONIC_RAW = None
 from threading import Thread
 
-import RF24
-
-from pymilight.radio import NRF24MiLightRadio, MiLightRadioConfig
-from pymilight.packet_formatter import PyRgbCctPacketFormatter
+try:
+    import RF24
+except ImportError:
+    RF24 = None
+
+try:
+    from RPi import GPIO
+except ImportError:
+    GPIO = None
+
+from pymilight.radio import MiLightRadioConfig, SimulatedRF24
+from pymilight.coalescer import CommandCoalescer
+from pymilight.metrics import REGISTRY, Counter, Gauge
+from pymilight.packet_cache import PacketTemplateCache
+from pymilight.packet_formatter import PyV2PacketFormatter
+from pymilight.radio_module import FORMATTERS, RadioModule
 from pymilight.rgb_converter import rgb_to_hsv
 from pymilight.state_store import StateStore
-from pymilight.utils import constrain, rescale, mireds_to_white_val
+from pymilight.transitions import AIRTIME_SHARE, TransitionEngine
+from pymilight.utils import rescale, mireds_to_white_val, white_val_to_mireds
 
 LOGGER = logging.getLogger(__name__)
 ON = True
 OFF = False
 
+# Fields that can be faded with "transition", the packet they are sent
+# with and the packet value for a request value.
+FADE_FIELDS = (
+    ("brightness", "update_brightness", lambda value: rescale(int(value), 100, 255)),
+    ("level", "update_brightness", int),
+    ("hue", "update_hue", int),
+    ("color_temp", "update_temperature", mireds_to_white_val),
+    ("temperature", "update_temperature", int),
+)
+
+
+def get_white_val(state):
+    return None if state.mireds is None else mireds_to_white_val(state.mireds)
+
+
+def set_white_val(state, value):
+    state.mireds = white_val_to_mireds(value)
+
+
+# Reading and writing the packet value of each faded packet in a State.
+FADE_STATE = {
+    "update_brightness": (lambda state: state.brightness, lambda state, value: setattr(state, "brightness", value)),
+    "update_hue": (lambda state: state.hue, lambda state, value: setattr(state, "hue", value)),
+    "update_temperature": (get_white_val, set_white_val),
+}
+
+# Markers put on the inbound queue to wake the controller without a command.
+RADIO_EVENT = object()
+WAKEUP = object()
+
+COMMANDS = REGISTRY.counter("pymilight_commands_total", "Commands sent to the radio, after merging")
+COMMAND_FAILURES = REGISTRY.counter("pymilight_command_failures_total", "Commands that failed")
+RESEND_COUNT = REGISTRY.gauge("pymilight_resend_count", "Repeats the last packet was sent with")
+COMMAND_LATENCY = REGISTRY.histogram(
+    "pymilight_command_latency_seconds", "Time from processing a command to its last repeat on air"
+)
+
+
+def create_rf(backend="rf24", ce_pin=None, csn_pin=None, spi_speed=None):
+    """Create the radio driver named by the "radio_backend" config setting."""
+    if backend == "simulator":
+        return SimulatedRF24(loopback=True)
+    if backend != "rf24":
+        raise ValueError("Unknown radio backend: %s" % backend)
+    if RF24 is None:
+        raise RuntimeError("The RF24 module is needed for the rf24 radio backend")
+    return RF24.RF24(
+        RF24.RPI_V2_GPIO_P1_15 if ce_pin is None else ce_pin,
+        RF24.BCM2835_SPI_CS0 if csn_pin is None else csn_pin,
+        RF24.BCM2835_SPI_SPEED_8MHZ if spi_speed is None else spi_speed
+    )
+
+
+def watch_irq(pin, callback):
+    """Call callback() whenever the nRF24 pulls its IRQ pin, a BCM GPIO number, low."""
+    if GPIO is None:
+        raise RuntimeError("The RPi.GPIO module is needed for irq_pin")
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.add_event_detect(pin, GPIO.FALLING, callback=lambda channel: callback())
+
+
+def create_modules(config):
+    """
+    Create the radio modules listed in the "radios" config setting.
+
+    Each entry can set "backend", "ce_pin", "csn_pin", "irq_pin",
+    "spi_speed", "name", "device_types", "receive" and "receive_only".
+    Without the setting there is one module, using "radio_backend". If no
+    module is set to receive, the first one does. Modules with an
+    "irq_pin", and simulated ones, only read the radio when a frame
+    arrives, the others poll it. Packets received are recorded to
+    "capture_file" if it is set.
+    """
+    backend = config.get("radio_backend", "rf24")
+    module_configs = config.get("radios") or [{}]
+
+    modules = []
+    for index, module_config in enumerate(module_configs):
+        rf = create_rf(
+            module_config.get("backend", backend),
+            module_config.get("ce_pin"),
+            module_config.get("csn_pin"),
+            module_config.get("spi_speed")
+        )
+        module = RadioModule(
+            rf,
+            module_config.get("name", "radio%d" % index),
+            module_config.get("device_types"),
+            module_config.get("receive", False),
+            module_config.get("receive_only", False)
+        )
+        irq_pin = module_config.get("irq_pin")
+        if irq_pin is not None:
+            module.notify_receive(functools.partial(watch_irq, irq_pin))
+        elif isinstance(rf, SimulatedRF24):
+            module.notify_receive(rf.notify_on_receive)
+        modules.append(module)
+
+    if not any(module.receives for module in modules):
+        modules[0].receives = True
+    if config.get("capture_file"):
+        # Imported here so python -m pymilight.capture runs the module once.
+        from pymilight.capture import CaptureWriter
+        capture = CaptureWriter(config["capture_file"])
+        for module in modules:
+            module.capture = capture
+    return modules
+
 
 class MiLightController(Thread):
     DEFAULT_RESEND_COUNT = 10
     RGB_WHITE_BOUNDARY = 40
 
-    def __init__(self, inbound_queue, outbound_queue, shutdown_event, dry_run, *args, **kwargs):
+    def __init__(self, inbound_queue, outbound_queue, shutdown_event, dry_run, *args,
+                 rf=None, modules=None, state_dir=None, **kwargs):
         super(MiLightController, self).__init__(*args, **kwargs)
         self.inbound_queue = inbound_queue
         self.outbound_queue = outbound_queue
         self.shutdown_event = shutdown_event
         self.dry_run = dry_run
-        self.store = StateStore("tmp")
+        # Bulb states are persisted under state_dir, or only kept in memory without one.
+        self.store = StateStore(state_dir)
+        self.coalescer = CommandCoalescer()
+        self.packet_cache = PacketTemplateCache()
+        self.transitions = TransitionEngine()
+        # Fraction of the airtime fades may use, see update_transition_budget().
+        self.fade_airtime_share = AIRTIME_SHARE
 
         self.base_resend_count = MiLightController.DEFAULT_RESEND_COUNT
         self.current_resend_count = self.base_resend_count
         self.current_radio = None
-        self.throttle_threshold = 0.200
-        self.throttle_sensitivity = 0
-        self.throttle_multiplier = 1
+        self.current_bulb = None
+        # The airtime budget of each module never cuts repeats below this.
         self.packet_repeat_minimum = 3
-        self.last_send = 0
-
-        rf = RF24.RF24(RF24.RPI_V2_GPIO_P1_15, RF24.BCM2835_SPI_CS0, RF24.BCM2835_SPI_SPEED_8MHZ)
-        self.radios = {
-            name: NRF24MiLightRadio(rf, radio_config)
-            for name, radio_config in MiLightRadioConfig.ALL_RADIOS.items()
-            if name == 'rgb_cct'
-        }
-
-        formatter = PyRgbCctPacketFormatter()
-        for radio in self.radios.values():
-            radio.formatter = formatter
+        # Seconds a packet's repeats may take before the rest are dropped.
+        self.repeat_timeout = 0.5
+
+        if modules is None:
+            if rf is None:
+                rf = create_rf()
+            modules = [RadioModule(rf, receive=True)]
+        self.modules = modules
+        self.transmitters = [module for module in modules if not module.receive_only]
+        self.rf = modules[0].rf
+        self._shards = {}
+
+        # Packets are built on this thread, one formatter per remote type
+        # serves every module.
+        formatters = {device_type: cls() for device_type, cls in FORMATTERS.items()}
+        for module in modules:
+            module.on_packet = self.handle_packet
+            for device_type, radio in module.radios.items():
+                radio.formatter = formatters[device_type]
+        self.radios = (self.transmitters or modules)[0].radios
+
+        # Read when the metrics are collected, nothing to do per command.
+        # They belong to this controller, so stop() removes them again.
+        self.metrics = [
+            Gauge(name, description, function=queue_.qsize)
+            for name, description, queue_ in (
+                ("pymilight_inbound_queue_depth", "Commands waiting for the controller", inbound_queue),
+                ("pymilight_outbound_queue_depth", "State updates waiting to be published", outbound_queue))
+            if hasattr(queue_, "qsize")
+        ] + [
+            Counter(
+                "pymilight_commands_merged_total", "Commands merged into a later one for the same bulb",
+                function=lambda: self.coalescer.merged
+            ),
+            Counter(
+                "pymilight_packet_cache_hits_total", "Packets replayed from a cached template",
+                function=lambda: self.packet_cache.hits
+            ),
+            Counter(
+                "pymilight_packet_cache_misses_total", "Packets built by the formatter",
+                function=lambda: self.packet_cache.misses
+            ),
+            Gauge(
+                "pymilight_transitions_active", "Fades in progress",
+                function=lambda: len(self.transitions)
+            ),
+            Counter(
+                "pymilight_transition_steps_total", "Intermediate and final fade packets sent",
+                function=lambda: self.transitions.steps
+            ),
+        ]
+        for metric in self.metrics:
+            REGISTRY.register(metric)
 
     def run(self):
         self.begin()
-        while True:
-            # Bail if given event to do so.
-            if self.shutdown_event.is_set():
-                return
+        self.store.load()
+        self.store.start()
+        for module in self.modules:
+            module.start()
 
-            # Handle incoming commands - probably from MQTT.
+        while not self.shutdown_event.is_set():
+            # Wake up for the next fade step if nothing arrives before.
             try:
-                command = self.inbound_queue.get(block=False)
-                self.process_command(command)
-                self.inbound_queue.task_done()
+                item = self.inbound_queue.get(timeout=self.transitions.timeout())
             except queue.Empty:
-                pass
-            except Exception as err:
-                LOGGER.critical("Failed to process command: %s. Error was %s.", command, err)
-
-            # Handle received radio packets.
-            try:
-                self.process_radio()
-            except Exception as err:
-                LOGGER.critical("Error receiveing from radio: %s", err)
-
-            time.sleep(0.1)
+                item = None
+
+            # Take everything else that is already queued so commands for
+            # the same bulb can be merged before they use any airtime.
+            received = 0
+            while item is not None:
+                received += 1
+                if item is RADIO_EVENT:
+                    for module in self.modules:
+                        if module.receives:
+                            module.notify_radio()
+                elif item is not WAKEUP:
+                    try:
+                        self.coalescer.add(item)
+                    except Exception as err:
+                        LOGGER.critical("Failed to queue command: %s. Error was %s.", item, err)
+                try:
+                    item = self.inbound_queue.get(block=False)
+                except queue.Empty:
+                    item = None
 
-    def process_radio(self):
-        radio = self.radios[self.current_radio]
+            # Handle incoming commands - probably from MQTT.
+            for command in self.coalescer.drain():
+                try:
+                    self.process_command(command)
+                except Exception as err:
+                    COMMAND_FAILURES.inc()
+                    LOGGER.critical("Failed to process command: %s. Error was %s.", command, err)
+            for _ in range(received):
+                self.inbound_queue.task_done()
 
-        if radio.available():
-            while radio.available():
-                packet = radio.read(9)
-                parsed = radio.formatter.parse(packet)
-                print(parsed)
-                #self.outbound_queue.put(parsed)
+            self.step_transitions()
+
+        # Modules send what they have left before stopping.
+        for module in self.modules:
+            module.stop()
+        for module in self.modules:
+            module.join()
+        self.store.close()
+
+    def notify_radio(self):
+        """Wake the receiving modules to read the radio, e.g. from an IRQ callback."""
+        self.inbound_queue.put(RADIO_EVENT)
+
+    def stop(self):
+        self.shutdown_event.set()
+        self.inbound_queue.put(WAKEUP)
+        for metric in self.metrics:
+            REGISTRY.unregister(metric)
+
+    def handle_packet(self, device_type, parsed):
+        """Called on a module's thread for every packet received."""
+        print(parsed)
+        #self.outbound_queue.put(parsed)
+
+    def module_for(self, device_type, device_id):
+        """The module that transmits for a remote, spreading remotes across modules."""
+        shard = self._shards.get(device_type)
+        if shard is None:
+            shard = [module for module in self.transmitters if module.handles(device_type)]
+            if not shard:
+                raise Exception("No radio module for %s" % device_type)
+            self._shards[device_type] = shard
+        return shard[device_id % len(shard)]
+
+    def notify_sent(self, key, callback):
+        """Call callback() once every packet queued so far for the bulb key is on air."""
+        self.module_for(key[0], key[1]).notify(key, callback)
+
+    def busy(self):
+        return any(module.busy() for module in self.modules)
+
+    def flush(self):
+        """Send all queued packets from this thread, when the modules are not running."""
+        for module in self.modules:
+            module.flush()
 
     def process_command(self, command):
         device_type, device_id, group_id, msg = command
+        key = (device_type, device_id, group_id)
+        started = time.monotonic()
 
-        self.send_radio_command(device_type, device_id, group_id, msg)
+        # A newer command for the bulb stops a fade in progress.
+        self.stop_transitions(key)
+        radio_msg = self.start_transitions(key, msg)
+
+        self.send_radio_command(device_type, device_id, group_id, radio_msg)
         self.send_state_update(device_type, device_id, group_id, msg)
+        COMMANDS.inc()
+        self.notify_sent(key, lambda: COMMAND_LATENCY.observe(time.monotonic() - started))
+
+    def start_transitions(self, key, msg):
+        """
+        Start fading the fields of msg that can be faded if it has a
+        "transition" in seconds. Returns msg without the faded fields, they
+        are sent by step_transitions(). Turning off is not faded.
+        """
+        duration = msg.get("transition")
+        if not duration or (self.parse_status(msg) == OFF and ("state" in msg or "status" in msg)):
+            return msg
+        state = self.store[key]
+        radio_msg = dict(msg)
+        for field, op, to_value in FADE_FIELDS:
+            if field not in msg:
+                continue
+            start = FADE_STATE[op][0](state)
+            wrap = 360 if op == "update_hue" else None
+            if self.transitions.start(key, op, start, to_value(msg[field]), float(duration), wrap):
+                del radio_msg[field]
+        return radio_msg
+
+    def stop_transitions(self, key):
+        """Stop the fades of the bulb key, leaving its state at the values last sent."""
+        fades = self.transitions.cancel(key)
+        if fades:
+            state = self.store[key]
+            for fade in fades:
+                FADE_STATE[fade.op][1](state, fade.sent)
+            self.store.mark_dirty(key)
+
+    def step_transitions(self):
+        """Send the fade steps that are due. Steps but the last use the minimum repeats."""
+        for step in self.transitions.due():
+            try:
+                self.set_bulb(*step.key)
+                packet = self.build_packet(step.op, step.value)
+                if self.dry_run:
+                    LOGGER.critical(packet.hex())
+                else:
+                    self.write(packet, None if step.final else self.packet_repeat_minimum)
+            except Exception as err:
+                LOGGER.critical("Failed to send fade step %s. Error was %s.", step, err)
 
     def send_radio_command(self, device_type, device_id, group_id, msg):
         self.set_bulb(device_type, device_id, group_id)
         self.update(msg)
 
     def send_state_update(self, device_type, device_id, group_id, msg):
-        state = self.store[(device_type, device_id, group_id)]
+        key = (device_type, device_id, group_id)
+        state = self.store[key]
         state.patch(msg)
-        state_vals = {}
-        state.apply_state(state_vals)
-        self.outbound_queue.put((device_type, device_id, group_id, state_vals))
+        self.store.mark_dirty(key)
+        self.outbound_queue.put((device_type, device_id, group_id, state.render_json()))
 
     def set_bulb(self, device_type, device_id, group_id):
         self.set_current_radio(device_type)
         self.radios[self.current_radio].formatter.prepare(device_id, group_id)
+        self.current_bulb = (device_type, device_id, group_id)
+
+    def build_packet(self, op, *args):
+        """Build a packet for the current bulb, replaying a cached template if possible."""
+        formatter = self.radios[self.current_radio].formatter
+        build = getattr(formatter, op)
+        if not isinstance(formatter, PyV2PacketFormatter):
+            return build(*args)
+        key = self.current_bulb + (op,) + args
+        return self.packet_cache.get(formatter, key, build, *args)
 
     def begin(self):
-        for radio in self.radios.values():
-            radio.begin()
-        self.set_current_radio(list(self.radios.keys())[0])
+        for module in self.modules:
+            module.begin()
+        self.set_current_radio(next(iter(FORMATTERS)))
+        self.update_transition_budget()
+
+    def update_transition_budget(self):
+        """Let fades use fade_airtime_share of the radios, each step sent with the minimum repeats."""
+        rate = sum(
+            module.packet_rate(self.current_radio, self.packet_repeat_minimum)
+            for module in self.transmitters
+        )
+        if rate:
+            self.transitions.budget = self.fade_airtime_share * rate
 
     def set_current_radio(self, device_type):
         if device_type not in self.radios:
+            if device_type in MiLightRadioConfig.ALL_RADIOS:
+                raise Exception("No packet formatter for %s" % device_type)
             raise Exception("Invalid device type")
         if self.current_radio != device_type:
             LOGGER.info("Setting radio for %s.", device_type)
             self.current_radio = device_type
-            self.radios[self.current_radio].configure()
 
     def set_resend_count(self, resend_count):
         self.base_resend_count = resend_count
         self.current_resend_count = resend_count
-        self.throttle_multiplier = math.ceil(
-            (self.throttle_sensitivity / 1000.0) * self.base_resend_count
-        )
-
-    def write(self, packet):
-        LOGGER.info("Sending packet (%d repeats): 0x%s", self.current_resend_count, packet.hex())
 
-        for _ in range(self.current_resend_count):
-            self.radios[self.current_radio].write(packet)
-
-    def update_resend_count(self):
-        now = time.clock_gettime(time.CLOCK_MONOTONIC_RAW)
-        since_last_send = now - self.last_send
-        x = (since_last_send - self.throttle_threshold)
-        delta = x * self.throttle_multiplier
-
-        self.current_resend_count = int(constrain(
-            self.current_resend_count + delta,
-            self.packet_repeat_minimum,
-            self.base_resend_count
-        ))
-        self.last_send = now
+    def write(self, packet, repeats=None):
+        """
+        Queue packet for the current bulb with repeats, the base resend
+        count by default, or fewer if the module's airtime budget is short.
+        """
+        if repeats is None:
+            repeats = self.base_resend_count
+        module = self.module_for(self.current_bulb[0], self.current_bulb[1])
+        repeats = module.admit(self.current_radio, repeats, self.packet_repeat_minimum)
+        self.current_resend_count = repeats
+        RESEND_COUNT.set(repeats)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Queueing packet (%d repeats): 0x%s", repeats, packet.hex())
+        module.submit(
+            self.current_bulb,
+            self.current_radio,
+            packet,
+            repeats,
+            self.repeat_timeout
+        )
 
     def flush_packet(self, packet):
-        self.update_resend_count()
         if self.dry_run:
             LOGGER.critical(packet.hex())
         else:
@@ -169,7 +454,7 @@ class MiLightController(Thread):
 
         # Always turn on first
         if parsed_status == ON:
-            yield formatter.update_status(ON)
+            yield self.build_packet("update_status", ON)
 
         commands = []
         if "command" in request:
@@ -186,10 +471,10 @@ class MiLightController(Thread):
             yield self.handle_effect(request["effect"])
 
         if "hue" in request:
-            yield formatter.update_hue(request["hue"])
+            yield self.build_packet("update_hue", request["hue"])
 
         if "saturation" in request:
-            yield formatter.update_saturation(request["saturation"])
+            yield self.build_packet("update_saturation", request["saturation"])
 
         # Convert RGB to HSV
         if "color" in request:
@@ -202,30 +487,31 @@ class MiLightController(Thread):
             if red > 256 - self.RGB_WHITE_BOUNDARY and \
                green > 256 - self.RGB_WHITE_BOUNDARY and \
                blue > 256 - self.RGB_WHITE_BOUNDARY:
-                yield formatter.update_color_white()
+                yield self.build_packet("update_color_white")
             else:
                 hsv = rgb_to_hsv(red, green, blue)
 
                 hue = int(round(hsv[0] * 360, 0))
                 saturation = int(round(hsv[1] * 100, 0))
 
-                yield formatter.update_hue(hue)
-                yield formatter.update_saturation(saturation)
+                yield self.build_packet("update_hue", hue)
+                yield self.build_packet("update_saturation", saturation)
 
         if "level" in request:
-            yield formatter.update_brightness(request["level"])
+            yield self.build_packet("update_brightness", request["level"])
 
         # HomeAssistant
         if "brightness" in request:
             scaled_brightness = rescale(int(request["brightness"]), 100, 255)
-            yield formatter.update_brightness(scaled_brightness)
+            yield self.build_packet("update_brightness", scaled_brightness)
 
         if "temperature" in request:
-            yield formatter.update_temperature(request["temperature"])
+            yield self.build_packet("update_temperature", request["temperature"])
 
         # HomeAssistant
         if "color_temp" in request:
-            yield formatter.update_temperature(
+            yield self.build_packet(
+                "update_temperature",
                 mireds_to_white_val(request["color_temp"])
             )
 
@@ -238,7 +524,7 @@ class MiLightController(Thread):
 
         # Always turn off last
         if parsed_status == OFF:
-            yield formatter.update_status(OFF)
+            yield self.build_packet("update_status", OFF)
 
     def handle_command(self, command):
         formatter = self.radios[self.current_radio].formatter
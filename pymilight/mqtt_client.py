@@ -105,4 +105,4 @@ class MqttClient(object):
 
         topic = bind_topic_string(topic, device_type, device_id, group_id)
         LOGGER.info("Publishing update to %s", topic)
-        self._mqtt.publish(topic, message, retain=retain)
+        return self._mqtt.publish(topic, message, retain=retain)
@@ -0,0 +1,55 @@
+"""
+LRU cache of encoded packet templates.
+
+A V2 packet for a given bulb and command only differs from the last one
+sent by its sequence number and checksum. Templates are kept decoded, so a
+hit only has to stamp the next sequence number and encode it again.
+"""
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class PacketTemplateCache(object):
+    DEFAULT_MAXSIZE = 1024
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def get(self, formatter, key, build, *args):
+        """
+        Return the packet for key, building it with build(*args) on a miss.
+
+        key should identify the remote type, device id, group, command and
+        argument. formatter must be the PyV2PacketFormatter that build uses,
+        so sequence numbers carry on from the same counter.
+        """
+        template = self._templates.get(key)
+        if template is not None:
+            self._templates.move_to_end(key)
+            self.hits += 1
+            return formatter.restamp(template)
+
+        self.misses += 1
+        packet = build(*args)
+        # Only single packet commands can be replayed from a template.
+        if len(packet) == formatter.packet_length:
+            self._templates[key] = formatter.decode(packet)
+            if len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return packet
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._templates))
+
+    def clear(self):
+        self._templates.clear()
+        self.hits = 0
+        self.misses = 0
@@ -1 +1,2 @@
-from .packet_formatter import PyRgbCctPacketFormatter
+from .packet_formatter import PyRgbCctPacketFormatter, PyV2PacketFormatter
+from .packet_formatter import COMMAND_NAMES, PARSED_FIELDS
@@ -1,5 +1,6 @@
 # distutils: language=c++
 from libcpp cimport bool
+from libcpp.string cimport string
 
 ctypedef unsigned long size_t
 ctypedef unsigned char uint8_t
@@ -11,7 +12,47 @@ cdef extern from "MiLightConstants.h":
         ON,
         OFF
 
-cdef extern from "PacketFormatter.h":
+    cdef enum MiLightRemoteType:
+        REMOTE_TYPE_UNKNOWN,
+        REMOTE_TYPE_RGBW,
+        REMOTE_TYPE_CCT,
+        REMOTE_TYPE_RGB_CCT,
+        REMOTE_TYPE_RGB,
+        REMOTE_TYPE_FUT089
+
+cdef extern from "utils.h":
+    string RemoteToString(MiLightRemoteType remote)
+
+cdef extern from "GroupState.h":
+    cdef cppclass BulbId:
+        uint16_t deviceId
+        uint8_t groupId
+        MiLightRemoteType deviceType
+
+cdef extern from "PacketFormatter.h" nogil:
+    cdef enum ParsedPacketField:
+        PARSED_STATE,
+        PARSED_COMMAND,
+        PARSED_HUE,
+        PARSED_COLOR_TEMP,
+        PARSED_BRIGHTNESS,
+        PARSED_SATURATION,
+        PARSED_MODE,
+        PARSED_BUTTON
+
+    cdef cppclass ParsedPacket:
+        ParsedPacket()
+        uint16_t fields
+        MiLightStatus state
+        const char* command
+        uint16_t hue
+        uint16_t colorTemp
+        uint8_t brightness
+        uint8_t saturation
+        uint8_t mode
+        uint8_t buttonId
+        uint8_t argument
+
     cdef cppclass PacketStream:
         PacketStream()
         uint8_t* next()
@@ -64,5 +105,6 @@ cdef extern from "PacketFormatter.h":
         PacketStream& buildPackets()
         void prepare(uint16_t deviceId, uint8_t groupId)
         void format(const uint8_t *packet, char *buffer)
+        BulbId decodePacket(const uint8_t *packet, ParsedPacket& result)
 
         size_t getPacketLength() const
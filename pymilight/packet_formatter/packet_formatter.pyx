@@ -3,40 +3,203 @@
 from cython.operator import dereference
 from libcpp cimport bool
 from libcpp.string cimport string
+from cpython.buffer cimport PyBuffer_FillInfo
+from cpython.bytearray cimport PyByteArray_FromStringAndSize
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from libcpp.vector cimport vector
 from libc.stdio cimport sprintf
-import json
+from libc.string cimport memcpy, strcmp
+from cpython cimport array
+import array
 
 from .packet_formatter cimport PacketStream as C_PacketStream
-from .packet_formatter cimport MiLightStatus, PacketStream
-from .v2_packet_formatter cimport V2PacketFormatter
+from .packet_formatter cimport MiLightStatus, PacketFormatter, PacketStream, uint8_t, uint16_t
+from .packet_formatter cimport BulbId, MiLightRemoteType, ParsedPacket, RemoteToString
+from .packet_formatter cimport (
+    PARSED_STATE, PARSED_COMMAND, PARSED_HUE, PARSED_COLOR_TEMP, PARSED_BRIGHTNESS,
+    PARSED_SATURATION, PARSED_MODE, PARSED_BUTTON
+)
+from .v2_packet_formatter cimport V2PacketFormatter, V2RFEncoding, V2_PACKET_LEN
 from .rgb_cct_packet_formatter cimport RgbCctPacketFormatter
 
 
-cdef extern from "utils.h":
-    cdef bool ParsePacket(PacketFormatter formatter, unsigned char *packet, string *device_type, int *device_id, int *group_id, string *message)
+# Fields set by parse(), in the order of the PARSED_* flags. Flag 1 << i
+# in the "fields" column of decode_records() means PARSED_FIELDS[i] is set.
+PARSED_FIELDS = ("state", "command", "hue", "color_temp", "brightness", "saturation", "mode", "button_id")
+# Values of the "command" column of decode_records().
+COMMAND_NAMES = (None, "night_mode", "mode_speed_down", "mode_speed_up")
+
+cdef array.array UINT8_COLUMN = array.array("B")
+cdef array.array UINT16_COLUMN = array.array("H")
+
+
+cdef uint8_t command_code(const char* command) noexcept nogil:
+    if command == NULL:
+        return 0
+    if strcmp(command, b"night_mode") == 0:
+        return 1
+    if strcmp(command, b"mode_speed_down") == 0:
+        return 2
+    if strcmp(command, b"mode_speed_up") == 0:
+        return 3
+    return 0
+
+
+REMOTE_TYPE_NAMES = {
+    remote_type: RemoteToString(<MiLightRemoteType>remote_type).decode("ascii")
+    for remote_type in (
+        MiLightRemoteType.REMOTE_TYPE_RGBW,
+        MiLightRemoteType.REMOTE_TYPE_CCT,
+        MiLightRemoteType.REMOTE_TYPE_RGB_CCT,
+        MiLightRemoteType.REMOTE_TYPE_RGB,
+        MiLightRemoteType.REMOTE_TYPE_FUT089,
+    )
+}
+
+
+cdef enum BatchOp:
+    OP_UPDATE_STATUS
+    OP_COMMAND
+    OP_PAIR
+    OP_UNPAIR
+    OP_UPDATE_MODE
+    OP_MODE_SPEED_DOWN
+    OP_MODE_SPEED_UP
+    OP_NEXT_MODE
+    OP_PREVIOUS_MODE
+    OP_UPDATE_HUE
+    OP_UPDATE_COLOR_RAW
+    OP_UPDATE_COLOR_WHITE
+    OP_UPDATE_SATURATION
+    OP_INCREASE_TEMPERATURE
+    OP_DECREASE_TEMPERATURE
+    OP_UPDATE_TEMPERATURE
+    OP_UPDATE_BRIGHTNESS
+    OP_INCREASE_BRIGHTNESS
+    OP_DECREASE_BRIGHTNESS
+    OP_ENABLE_NIGHT_MODE
+
+
+# Operations understood by build_batch, named after the single packet methods.
+BATCH_OPS = {
+    "update_status": OP_UPDATE_STATUS,
+    "command": OP_COMMAND,
+    "pair": OP_PAIR,
+    "unpair": OP_UNPAIR,
+    "update_mode": OP_UPDATE_MODE,
+    "mode_speed_down": OP_MODE_SPEED_DOWN,
+    "mode_speed_up": OP_MODE_SPEED_UP,
+    "next_mode": OP_NEXT_MODE,
+    "previous_mode": OP_PREVIOUS_MODE,
+    "update_hue": OP_UPDATE_HUE,
+    "update_color_raw": OP_UPDATE_COLOR_RAW,
+    "update_color_white": OP_UPDATE_COLOR_WHITE,
+    "update_saturation": OP_UPDATE_SATURATION,
+    "increase_temperature": OP_INCREASE_TEMPERATURE,
+    "decrease_temperature": OP_DECREASE_TEMPERATURE,
+    "update_temperature": OP_UPDATE_TEMPERATURE,
+    "update_brightness": OP_UPDATE_BRIGHTNESS,
+    "increase_brightness": OP_INCREASE_BRIGHTNESS,
+    "decrease_brightness": OP_DECREASE_BRIGHTNESS,
+    "enable_night_mode": OP_ENABLE_NIGHT_MODE,
+}
+
+
+cdef struct BatchCommand:
+    uint16_t device_id
+    uint8_t group_id
+    int op
+    int arg
+    int arg2
+
+
+cdef void apply_op(PacketFormatter* formatter, const BatchCommand* command) noexcept nogil:
+    cdef int op = command.op
+    cdef int arg = command.arg
+    if op == OP_UPDATE_STATUS:
+        formatter.updateStatus(MiLightStatus.ON if arg else MiLightStatus.OFF)
+    elif op == OP_COMMAND:
+        formatter.command(arg, command.arg2)
+    elif op == OP_PAIR:
+        formatter.pair()
+    elif op == OP_UNPAIR:
+        formatter.unpair()
+    elif op == OP_UPDATE_MODE:
+        formatter.updateMode(arg)
+    elif op == OP_MODE_SPEED_DOWN:
+        formatter.modeSpeedDown()
+    elif op == OP_MODE_SPEED_UP:
+        formatter.modeSpeedUp()
+    elif op == OP_NEXT_MODE:
+        formatter.nextMode()
+    elif op == OP_PREVIOUS_MODE:
+        formatter.previousMode()
+    elif op == OP_UPDATE_HUE:
+        formatter.updateHue(arg)
+    elif op == OP_UPDATE_COLOR_RAW:
+        formatter.updateColorRaw(arg)
+    elif op == OP_UPDATE_COLOR_WHITE:
+        formatter.updateColorWhite()
+    elif op == OP_UPDATE_SATURATION:
+        formatter.updateSaturation(arg)
+    elif op == OP_INCREASE_TEMPERATURE:
+        formatter.increaseTemperature()
+    elif op == OP_DECREASE_TEMPERATURE:
+        formatter.decreaseTemperature()
+    elif op == OP_UPDATE_TEMPERATURE:
+        formatter.updateTemperature(arg)
+    elif op == OP_UPDATE_BRIGHTNESS:
+        formatter.updateBrightness(arg)
+    elif op == OP_INCREASE_BRIGHTNESS:
+        formatter.increaseBrightness()
+    elif op == OP_DECREASE_BRIGHTNESS:
+        formatter.decreaseBrightness()
+    elif op == OP_ENABLE_NIGHT_MODE:
+        formatter.enableNightMode()
 
 
 cdef class PyPacketStream:
+    """
+    Read-only buffer over the packets last built by a formatter.
+
+    The memory belongs to the formatter, so the contents are only valid
+    until it builds its next packet.
+    """
     cdef C_PacketStream *c_stream
+    cdef Py_ssize_t length
+    cdef object owner
 
     def __next__(self):
         if self.c_stream[0].hasNext():
             return self.c_stream[0].next()
         raise StopIteration
 
+    def __len__(self):
+        return self.length
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        PyBuffer_FillInfo(buffer, self, self.c_stream[0].packetStream, self.length, 1, flags)
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
+
     def _print_buffer(self):
         for i in range(self.c_stream[0].numPackets):
             print(self.c_stream[0].packetStream[i])
 
 
-cdef PyPacketStream create(C_PacketStream* stream):
+cdef PyPacketStream create(C_PacketStream* stream, object owner):
     obj = PyPacketStream()
     obj.c_stream = stream
+    obj.length = stream[0].numPackets * stream[0].packetLength
+    obj.owner = owner
     return obj
 
 
 cdef class PyPacketFormatter:
     cdef PacketFormatter *c_pf_obj;
+    # When set the command methods return data_view() rather than data().
+    cdef public bint zero_copy
 
     def reset(self):
         self.c_pf_obj[0].reset()
@@ -45,20 +208,87 @@ cdef class PyPacketFormatter:
         self.c_pf_obj[0].prepare(device_id, group_id)
 
     def data(self, reset=True):
-        cdef PacketStream stream
-        stream = self.c_pf_obj[0].buildPackets()
-        res = bytearray([stream.packetStream[i] for i in range(stream.numPackets * stream.packetLength)])
+        cdef PacketStream* stream = &self.c_pf_obj[0].buildPackets()
+        res = PyByteArray_FromStringAndSize(
+            <char*>stream.packetStream,
+            stream.numPackets * stream.packetLength
+        )
+        if reset:
+            self.c_pf_obj[0].reset()
+        return res
+
+    def data_view(self, reset=True):
+        """Like data() but returns a read-only memoryview of the packet buffer."""
+        cdef PacketStream* stream = &self.c_pf_obj[0].buildPackets()
+        res = memoryview(create(stream, self))
         if reset:
             self.c_pf_obj[0].reset()
         return res
 
+    cdef _result(self):
+        if self.zero_copy:
+            return self.data_view()
+        return self.data()
+
+    def build_batch(self, commands):
+        """
+        Build the packets for a sequence of (device_id, group_id, op, arg).
+
+        op is the name of one of the single packet methods, e.g. "update_hue",
+        and arg its argument: None for methods without one, the status for
+        "update_status" and a (command, argument) pair for "command".
+
+        Returns a bytearray with all packets back to back and a list with
+        the offset of each packet in it. The packets are built without
+        holding the GIL.
+        """
+        cdef vector[BatchCommand] batch
+        cdef BatchCommand batch_command
+        for device_id, group_id, op, arg in commands:
+            batch_command.device_id = device_id
+            batch_command.group_id = group_id
+            batch_command.op = BATCH_OPS[op]
+            batch_command.arg = 0
+            batch_command.arg2 = 0
+            if batch_command.op == OP_COMMAND:
+                batch_command.arg, batch_command.arg2 = arg
+            elif arg is not None:
+                batch_command.arg = int(arg)
+            batch.push_back(batch_command)
+
+        cdef vector[uint8_t] buffer
+        cdef vector[size_t] offsets
+        cdef PacketStream* stream
+        cdef size_t length
+        cdef size_t i
+        cdef size_t j
+        with nogil:
+            for i in range(batch.size()):
+                self.c_pf_obj[0].prepare(batch[i].device_id, batch[i].group_id)
+                apply_op(self.c_pf_obj, &batch[i])
+                stream = &self.c_pf_obj[0].buildPackets()
+                length = stream.numPackets * stream.packetLength
+                for j in range(stream.numPackets):
+                    offsets.push_back(buffer.size() + j * stream.packetLength)
+                buffer.insert(buffer.end(), stream.packetStream, stream.packetStream + length)
+            self.c_pf_obj[0].reset()
+
+        res = bytearray(buffer.size())
+        if buffer.size():
+            memcpy(<uint8_t*><char*>res, buffer.data(), buffer.size())
+        return res, list(offsets)
+
+    @property
+    def packet_length(self):
+        return self.c_pf_obj[0].getPacketLength()
+
     def format(self):
         cdef char response[200]
         cdef char* responseBuffer = response
 
         responseBuffer += sprintf(
           responseBuffer,
-          "\n%s packet received (%d bytes):\n",
+          "\n%s packet received (%zu bytes):\n",
           "NAME",
           self.c_pf_obj[0].getPacketLength()
         )
@@ -68,18 +298,119 @@ cdef class PyPacketFormatter:
         self.reset()
         return (<bytes>response).decode('ascii')
 
-    def parse(self, bytearray packet):
-        cdef unsigned char *packet_array = packet
-        cdef string raw_json
-        cdef int device_id
-        cdef int group_id
-        cdef string device_type
-        ParsePacket(self.c_pf_obj[0], packet, &device_type, &device_id, &group_id, &raw_json)
-        return (device_type.decode('utf-8'), device_id, group_id, json.loads(raw_json.decode('utf-8')))
+    def parse(self, const unsigned char[::1] packet):
+        """
+        Decode a received packet.
+
+        Returns (device_type, device_id, group_id, fields) where fields is a
+        dict like {"state": "ON"} or {"hue": 120}.
+        """
+        if packet.shape[0] < <Py_ssize_t>self.c_pf_obj[0].getPacketLength():
+            raise ValueError("Expected a %d byte packet" % self.c_pf_obj[0].getPacketLength())
+        cdef ParsedPacket parsed
+        cdef BulbId bulb = self.c_pf_obj[0].decodePacket(&packet[0], parsed)
+
+        result = {}
+        if parsed.fields & PARSED_STATE:
+            result["state"] = "ON" if parsed.state == MiLightStatus.ON else "OFF"
+        if parsed.fields & PARSED_COMMAND:
+            result["command"] = parsed.command.decode("ascii")
+        if parsed.fields & PARSED_HUE:
+            result["hue"] = parsed.hue
+        if parsed.fields & PARSED_COLOR_TEMP:
+            result["color_temp"] = parsed.colorTemp
+        if parsed.fields & PARSED_BRIGHTNESS:
+            result["brightness"] = parsed.brightness
+        if parsed.fields & PARSED_SATURATION:
+            result["saturation"] = parsed.saturation
+        if parsed.fields & PARSED_MODE:
+            result["mode"] = parsed.mode
+        if parsed.fields & PARSED_BUTTON:
+            result["button_id"] = parsed.buttonId
+            result["argument"] = parsed.argument
+        return (REMOTE_TYPE_NAMES.get(bulb.deviceType, "unknown"), bulb.deviceId, bulb.groupId, result)
+
+    def decode_records(self, const unsigned char[::1] records, Py_ssize_t record_size,
+                       Py_ssize_t frame_offset=0):
+        """
+        Decode the packet in each record_size byte record of records, found
+        frame_offset bytes into the record.
+
+        Returns a dict of array.array columns: "device_id", "group_id",
+        "fields" (flags, see PARSED_FIELDS), "state" (1 for on), "command"
+        (see COMMAND_NAMES), "hue", "color_temp", "brightness",
+        "saturation", "mode", "button_id" and "argument". The records are
+        decoded without holding the GIL.
+        """
+        if record_size <= 0 or frame_offset < 0 or \
+                frame_offset + <Py_ssize_t>self.c_pf_obj[0].getPacketLength() > record_size:
+            raise ValueError("Packet does not fit in a %d byte record" % record_size)
+        cdef Py_ssize_t count = records.shape[0] // record_size
+        cdef Py_ssize_t i
+
+        cdef array.array device_id = array.clone(UINT16_COLUMN, count, False)
+        cdef array.array group_id = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array fields = array.clone(UINT16_COLUMN, count, False)
+        cdef array.array state = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array command = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array hue = array.clone(UINT16_COLUMN, count, False)
+        cdef array.array color_temp = array.clone(UINT16_COLUMN, count, False)
+        cdef array.array brightness = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array saturation = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array mode = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array button_id = array.clone(UINT8_COLUMN, count, False)
+        cdef array.array argument = array.clone(UINT8_COLUMN, count, False)
+
+        cdef uint16_t* device_id_data = device_id.data.as_ushorts
+        cdef uint8_t* group_id_data = group_id.data.as_uchars
+        cdef uint16_t* fields_data = fields.data.as_ushorts
+        cdef uint8_t* state_data = state.data.as_uchars
+        cdef uint8_t* command_data = command.data.as_uchars
+        cdef uint16_t* hue_data = hue.data.as_ushorts
+        cdef uint16_t* color_temp_data = color_temp.data.as_ushorts
+        cdef uint8_t* brightness_data = brightness.data.as_uchars
+        cdef uint8_t* saturation_data = saturation.data.as_uchars
+        cdef uint8_t* mode_data = mode.data.as_uchars
+        cdef uint8_t* button_id_data = button_id.data.as_uchars
+        cdef uint8_t* argument_data = argument.data.as_uchars
+
+        cdef ParsedPacket parsed
+        cdef BulbId bulb
+        with nogil:
+            for i in range(count):
+                parsed = ParsedPacket()
+                bulb = self.c_pf_obj[0].decodePacket(&records[i * record_size + frame_offset], parsed)
+                device_id_data[i] = bulb.deviceId
+                group_id_data[i] = bulb.groupId
+                fields_data[i] = parsed.fields
+                state_data[i] = parsed.state == MiLightStatus.ON
+                command_data[i] = command_code(parsed.command)
+                hue_data[i] = parsed.hue
+                color_temp_data[i] = parsed.colorTemp
+                brightness_data[i] = parsed.brightness
+                saturation_data[i] = parsed.saturation
+                mode_data[i] = parsed.mode
+                button_id_data[i] = parsed.buttonId
+                argument_data[i] = parsed.argument
+
+        return {
+            "device_id": device_id,
+            "group_id": group_id,
+            "fields": fields,
+            "state": state,
+            "command": command,
+            "hue": hue,
+            "color_temp": color_temp,
+            "brightness": brightness,
+            "saturation": saturation,
+            "mode": mode,
+            "button_id": button_id,
+            "argument": argument,
+        }
 
     def command(self, int command, int arg):
         self.c_pf_obj[0].command(command, arg)
-        return self.data()
+        return self._result()
 
     def set_held(self, bool is_held):
         self.c_pf_obj[0].setHeld(is_held)
@@ -95,88 +426,106 @@ cdef class PyPacketFormatter:
             self.c_pf_obj[0].updateStatus(milight_status, group_id)
         else:
             self.c_pf_obj[0].updateStatus(milight_status)
-        return self.data()
+        return self._result()
 
     def pair(self):
         self.c_pf_obj[0].pair()
-        return self.data()
+        return self._result()
 
     def unpair(self):
         self.c_pf_obj[0].unpair()
-        return self.data()
+        return self._result()
         
     # Mode
     def update_mode(self, int value):
         self.c_pf_obj[0].updateMode(value)
-        return self.data()
+        return self._result()
 
     def mode_speed_down(self):
         self.c_pf_obj[0].modeSpeedDown()
-        return self.data()
+        return self._result()
 
     def mode_speed_up(self):
         self.c_pf_obj[0].modeSpeedUp()
-        return self.data()
+        return self._result()
 
     def next_mode(self):
         self.c_pf_obj[0].nextMode()
-        return self.data()
+        return self._result()
 
     def previous_mode(self):
         self.c_pf_obj[0].previousMode()
-        return self.data()
+        return self._result()
 
     # Color
     def update_hue(self, int value):
         self.c_pf_obj[0].updateHue(value)
-        return self.data()
+        return self._result()
 
     def update_color_raw(self, int value):
         self.c_pf_obj[0].updateColorRaw(value)
-        return self.data()
+        return self._result()
 
     def update_color_white(self):
         self.c_pf_obj[0].updateColorWhite()
-        return self.data()
+        return self._result()
 
     def update_saturation(self, int value):
         self.c_pf_obj[0].updateSaturation(value)
-        return self.data()
+        return self._result()
 
     # White temperature
     def increase_temperature(self):
         self.c_pf_obj[0].increaseTemperature()
-        return self.data()
+        return self._result()
 
     def decrease_temperature(self):
         self.c_pf_obj[0].decreaseTemperature()
-        return self.data()
+        return self._result()
 
     def update_temperature(self, int value):
         self.c_pf_obj[0].updateTemperature(value)
-        return self.data()
+        return self._result()
 
     # Brightness
     def update_brightness(self, int value):
         self.c_pf_obj[0].updateBrightness(value)
-        return self.data()
+        return self._result()
 
     def increase_brightness(self):
         self.c_pf_obj[0].increaseBrightness()
-        return self.data()
+        return self._result()
 
     def decrease_brightness(self):
         self.c_pf_obj[0].decreaseBrightness()
-        return self.data()
+        return self._result()
 
     def enable_night_mode(self):
         self.c_pf_obj[0].enableNightMode()
-        return self.data()
+        return self._result()
 
 
 cdef class PyV2PacketFormatter(PyPacketFormatter):
     cdef V2PacketFormatter *c_v2_pf_obj
 
+    @staticmethod
+    def decode(const unsigned char[::1] packet):
+        """Return a decoded copy of a single encoded packet."""
+        if packet.shape[0] != V2_PACKET_LEN:
+            raise ValueError("Expected a %d byte packet" % V2_PACKET_LEN)
+        cdef uint8_t decoded[V2_PACKET_LEN]
+        memcpy(decoded, &packet[0], V2_PACKET_LEN)
+        V2RFEncoding.decodeV2Packet(decoded)
+        return PyBytes_FromStringAndSize(<char*>decoded, V2_PACKET_LEN)
+
+    def restamp(self, const unsigned char[::1] decoded):
+        """Encode a decoded packet again using the next sequence number."""
+        if decoded.shape[0] != V2_PACKET_LEN:
+            raise ValueError("Expected a %d byte packet" % V2_PACKET_LEN)
+        cdef uint8_t packet[V2_PACKET_LEN]
+        self.c_v2_pf_obj[0].restampPacket(&decoded[0], packet)
+        return PyByteArray_FromStringAndSize(<char*>packet, V2_PACKET_LEN)
+
 
 cdef class PyRgbCctPacketFormatter(PyV2PacketFormatter):
     cdef RgbCctPacketFormatter c_formatter      # hold a C++ instance which we're wrapping
@@ -188,10 +537,10 @@ cdef class PyRgbCctPacketFormatter(PyV2PacketFormatter):
     def on(self):
         self.c_formatter.prepare(0x02, 1)
         self.c_formatter.updateStatus(MiLightStatus.ON, 1)
-        return self.data()
+        return self._result()
 
     def off(self):
         self.c_formatter.prepare(0x02, 1)
         self.c_formatter.updateStatus(MiLightStatus.OFF, 1)
-        return self.data()
+        return self._result()
 
@@ -5,6 +5,6 @@ from libcpp.string cimport string
 from .packet_formatter cimport PacketStream, MiLightStatus, size_t
 from .v2_packet_formatter cimport V2PacketFormatter
 
-cdef extern from "RgbCctPacketFormatter.h":
+cdef extern from "RgbCctPacketFormatter.h" nogil:
     cdef cppclass RgbCctPacketFormatter(V2PacketFormatter):
         RgbCctPacketFormatter() except +
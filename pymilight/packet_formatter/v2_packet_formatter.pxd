@@ -1,8 +1,18 @@
 # distutils: language=c++
 from .packet_formatter cimport PacketFormatter, MiLightStatus, size_t, uint8_t
 
-cdef extern from "V2PacketFormatter.h":
+cdef extern from "V2PacketFormatter.h" nogil:
+    cdef enum:
+        V2_PACKET_LEN
+
     cdef cppclass V2PacketFormatter(PacketFormatter):
         V2PacketFormatter(uint8_t protocolId, uint8_t packetLen) except +
         void finalizePacket(uint8_t* packet)
+        void restampPacket(const uint8_t* decoded, uint8_t* packet)
         uint8_t groupCommandArg(MiLightStatus status, uint8_t groupId)
+
+
+cdef extern from "V2RFEncoding.h" nogil:
+    cdef cppclass V2RFEncoding:
+        @staticmethod
+        void decodeV2Packet(uint8_t* packet)
@@ -1,2 +1,3 @@
 from .milight_radio_config import MiLightRadioConfig
 from .nrf24_milight_radio import NRF24MiLightRadio
+from .rf24_simulator import SimulatedRF24
@@ -1,28 +1,87 @@
 """
 Adapated from code from henryk
 """
+import collections
 import logging
+import time
 
+from pymilight.metrics import REGISTRY
 from pymilight.radio.pl1167_nrf24 import PL1167_nRF24
 
 
 LOGGER = logging.getLogger(__name__)
 
+RX_PACKETS = REGISTRY.counter("pymilight_rx_packets_total", "Packets received from remotes")
+RX_DUPLICATES = REGISTRY.counter("pymilight_rx_duplicates_total", "Repeats of packets already received")
+
+ChannelStats = collections.namedtuple(
+    "ChannelStats", ["channel", "packets", "duplicates", "listened", "hit_rate"]
+)
+
 
 def get_packet_id(packet, packet_length):
     return (packet[1] << 8) | packet[packet_length - 1]
 
 
+class DuplicateFilter(object):
+    """
+    Packet ids seen in the last window seconds, at most maxsize of them.
+
+    Remotes repeat every packet many times over all channels. Seeing an id
+    again restarts its window, so a whole burst counts as one packet.
+    """
+
+    def __init__(self, window=1.0, maxsize=64):
+        self.window = window
+        self.maxsize = maxsize
+        self._seen = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def seen(self, packet_id, now):
+        """Record packet_id, returning True if it is a duplicate."""
+        expired = now - self.window
+        while self._seen:
+            oldest = next(iter(self._seen.values()))
+            if oldest > expired:
+                break
+            self._seen.popitem(last=False)
+
+        duplicate = packet_id in self._seen
+        if duplicate:
+            self._seen.move_to_end(packet_id)
+        self._seen[packet_id] = now
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return duplicate
+
+
 class NRF24MiLightRadio(object):
     def __init__(self, rf, config):
         self._pl1167 = PL1167_nRF24(rf)
         self._config = config
         self._prev_packet_id = None
         self._packet = []
-        self._out_packet = []
+        # Length prefixed frame buffer, reused for every write.
+        self._out_packet = bytearray(config.packetLength + 1)
+        self._out_view = memoryview(self._out_packet)
+        self._out_length = 0
         self._waiting = False
         self._dupes_received = 0
 
+        self.clock = time.monotonic
+        # Seconds to listen on each channel before moving to the next, None
+        # stays on the first channel.
+        self.channel_dwell = 0.02
+        self._listen_index = 0
+        self._listen_started = None
+        self._duplicates = DuplicateFilter()
+        channels = config.channels
+        self._packets = dict.fromkeys(channels, 0)
+        self._channel_dupes = dict.fromkeys(channels, 0)
+        self._listened = dict.fromkeys(channels, 0.0)
+
     def begin(self):
         retval = self._pl1167.open()
         if retval < 0:
@@ -61,26 +120,64 @@ class NRF24MiLightRadio(object):
 
         return 0
 
+    @property
+    def listen_channel(self):
+        return self._config.channels[self._listen_index]
+
+    def hop(self, now):
+        """Move to the next channel once the current one has had its turn."""
+        if self._listen_started is None:
+            self._listen_started = now
+            return
+        listened = now - self._listen_started
+        if self.channel_dwell is None or listened < self.channel_dwell:
+            return
+        self._listened[self.listen_channel] += listened
+        self._listen_index = (self._listen_index + 1) % len(self._config.channels)
+        self._listen_started = now
+
+    def channel_stats(self):
+        stats = []
+        for channel in self._config.channels:
+            listened = self._listened[channel]
+            if channel == self.listen_channel and self._listen_started is not None:
+                listened += self.clock() - self._listen_started
+            stats.append(ChannelStats(
+                channel,
+                self._packets[channel],
+                self._channel_dupes[channel],
+                listened,
+                self._packets[channel] / listened if listened else 0.0
+            ))
+        return stats
+
     def available(self):
         if self._waiting:
-            LOGGER.info("_waiting")
+            LOGGER.debug("_waiting")
             return True
 
-        if self._pl1167.receive(self._config.channels[0]) > 0:
-            LOGGER.info("NRF24MiLightRadio - received packet!")
+        now = self.clock()
+        self.hop(now)
+        channel = self.listen_channel
+        if self._pl1167.receive(channel) > 0:
+            LOGGER.debug("NRF24MiLightRadio - received packet!")
             packet_length = self._config.packetLength + 1
             self._packet = self._pl1167.readFIFO(packet_length)
 
-            LOGGER.info("NRF24MiLightRadio - Checking packet length (expecting %d, is %d)", self._packet[0] + 1, packet_length)
+            LOGGER.debug("NRF24MiLightRadio - Checking packet length (expecting %d, is %d)", self._packet[0] + 1, packet_length)
             if packet_length == 0 or packet_length != self._packet[0] + 1:
                 return False
 
             packet_id = get_packet_id(self._packet, packet_length)
-            LOGGER.info("Packet id: %d", packet_id)
-            if packet_id == self._prev_packet_id:
+            LOGGER.debug("Packet id: %d", packet_id)
+            if self._duplicates.seen(packet_id, now):
                 self._dupes_received += 1
+                self._channel_dupes[channel] += 1
+                RX_DUPLICATES.inc()
             else:
                 self._prev_packet_id = packet_id
+                self._packets[channel] += 1
+                RX_PACKETS.inc()
                 self._waiting = True
         return self._waiting
 
@@ -101,15 +198,22 @@ class NRF24MiLightRadio(object):
         return frame
 
     def write(self, frame):
-        self._out_packet = bytearray([len(frame)]) + frame
+        # frame can be any buffer, e.g. a PyPacketFormatter.data_view().
+        frame_length = len(frame)
+        if frame_length + 1 > len(self._out_packet):
+            self._out_packet = bytearray(frame_length + 1)
+            self._out_view = memoryview(self._out_packet)
+        self._out_packet[0] = frame_length
+        self._out_view[1:frame_length + 1] = frame
+        self._out_length = frame_length + 1
 
         retval = self.resend()
         if retval < 0:
             return retval
-        return len(frame)
+        return frame_length
 
     def resend(self):
         for channel in self._config.channels:
-            self._pl1167.writeFIFO(self._out_packet)
+            self._pl1167.writeFIFO(self._out_view[:self._out_length])
             self._pl1167.transmit(channel)
         return 0
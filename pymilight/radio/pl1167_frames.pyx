@@ -0,0 +1,82 @@
+"""
+Compiled versions of the PL1167 frame helpers in pl1167_nrf24.
+
+pl1167_nrf24 falls back to its pure Python implementations when this
+extension is not built.
+"""
+cdef unsigned short CRC_POLY = 0x8408
+cdef unsigned short CRC_TABLE[256]
+cdef unsigned char REVERSE_TABLE[256]
+
+
+cdef void _build_tables():
+    cdef unsigned short crc
+    cdef unsigned char value, reversed_value
+    cdef int i, bit
+    for i in range(256):
+        crc = i
+        value = i
+        reversed_value = 0
+        for bit in range(8):
+            if crc & 0x01:
+                crc = (crc >> 1) ^ CRC_POLY
+            else:
+                crc = crc >> 1
+            reversed_value = (reversed_value << 1) | (value & 1)
+            value >>= 1
+        CRC_TABLE[i] = crc
+        REVERSE_TABLE[i] = reversed_value
+
+_build_tables()
+
+
+cdef inline unsigned short _crc(const unsigned char *data, Py_ssize_t length) nogil:
+    cdef unsigned short state = 0
+    cdef Py_ssize_t i
+    for i in range(length):
+        state = (state >> 8) ^ CRC_TABLE[(state ^ data[i]) & 0xFF]
+    return state
+
+
+def calc_crc(const unsigned char[::1] data):
+    if data.shape[0] == 0:
+        return 0
+    return _crc(&data[0], data.shape[0])
+
+
+def encode_frame(const unsigned char[::1] packet, bint crc, unsigned char[::1] out):
+    """Write the on-air frame for packet into out, returning its length."""
+    cdef Py_ssize_t length = packet.shape[0]
+    cdef Py_ssize_t i
+    cdef unsigned short value
+    if length + 2 * crc > out.shape[0]:
+        raise ValueError("Frame does not fit in buffer")
+
+    for i in range(length):
+        out[i] = REVERSE_TABLE[packet[i]]
+    if crc:
+        value = _crc(&packet[0], length) if length else 0
+        out[length] = REVERSE_TABLE[value & 0xFF]
+        out[length + 1] = REVERSE_TABLE[value >> 8]
+        length += 2
+    return length
+
+
+def decode_frame(const unsigned char[::1] frame, bint crc, unsigned char[::1] out):
+    """Write the packet in a received frame into out, returning its length or -1 on a CRC failure."""
+    cdef Py_ssize_t length = frame.shape[0]
+    cdef Py_ssize_t i
+    cdef unsigned short recv_crc
+    if length > out.shape[0]:
+        raise ValueError("Frame does not fit in buffer")
+
+    for i in range(length):
+        out[i] = REVERSE_TABLE[frame[i]]
+    if crc:
+        if length < 2:
+            return -1
+        length -= 2
+        recv_crc = (out[length + 1] << 8) | out[length]
+        if (_crc(&out[0], length) if length else 0) != recv_crc:
+            return -1
+    return length
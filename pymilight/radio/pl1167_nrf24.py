@@ -11,36 +11,102 @@ Port of PL1167_nRF24 by henryk.
 """
 import logging
 
-import RF24
+from pymilight.metrics import REGISTRY
+from pymilight.trace import RX, TRACE, TX
+
+try:
+    import RF24
+    RF24_PA_MAX = RF24.RF24_PA_MAX
+    RF24_1MBPS = RF24.RF24_1MBPS
+except ImportError:
+    # Values from RF24.h, so the stack can run against a simulated radio.
+    RF24_PA_MAX = 3
+    RF24_1MBPS = 0
 
 
 LOGGER = logging.getLogger(__name__)
 CRC_POLY = 0x8408
+# Longest frame the nRF24 can carry.
+MAX_FRAME_LENGTH = 32
+
+TX_FRAMES = REGISTRY.counter("pymilight_tx_frames_total", "Frames transmitted")
+RX_FRAMES = REGISTRY.counter("pymilight_rx_frames_total", "Frames received, including bad ones")
+CRC_FAILURES = REGISTRY.counter("pymilight_rx_crc_failures_total", "Frames received with a bad CRC")
+
+
+def _crc_byte(value):
+    for _ in range(8):
+        if value & 0x01:
+            value = (value >> 1) ^ CRC_POLY
+        else:
+            value = value >> 1
+    return value
+
+
+def _reverse_byte(value):
+    result = 0
+    for _ in range(8):
+        result <<= 1
+        result |= value & 1
+        value >>= 1
+    return result
+
+
+CRC_TABLE = [_crc_byte(value) for value in range(256)]
+REVERSE_TABLE = bytes(_reverse_byte(value) for value in range(256))
 
 
 def calc_crc(data):
     state = 0
     for cur_byte in data:
-        for _ in range(8):
-            if (cur_byte ^ state) & 0x01:
-                state = (state >> 1) ^ CRC_POLY
-            else:
-                state = state >> 1
-            cur_byte = cur_byte >> 1
+        state = (state >> 8) ^ CRC_TABLE[(state ^ cur_byte) & 0xFF]
     return state
 
+
 def reverse_bits(data):
-    result = 0
-    for _ in range(8):
-        result <<= 1
-        result |= data & 1
-        data >>= 1
-    return result
+    return REVERSE_TABLE[data]
+
+
+def encode_frame(packet, crc, out):
+    """Write the on-air frame for packet into out, returning its length."""
+    length = len(packet)
+    if length + 2 * crc > len(out):
+        raise ValueError("Frame does not fit in buffer")
+    out[:length] = bytes(packet).translate(REVERSE_TABLE)
+    if crc:
+        value = calc_crc(packet)
+        out[length] = REVERSE_TABLE[value & 0xFF]
+        out[length + 1] = REVERSE_TABLE[value >> 8]
+        length += 2
+    return length
+
+
+def decode_frame(frame, crc, out):
+    """Write the packet in a received frame into out, returning its length or -1 on a CRC failure."""
+    length = len(frame)
+    if length > len(out):
+        raise ValueError("Frame does not fit in buffer")
+    out[:length] = bytes(frame).translate(REVERSE_TABLE)
+    if crc:
+        if length < 2:
+            return -1
+        length -= 2
+        recv_crc = (out[length + 1] << 8) | out[length]
+        if calc_crc(memoryview(out)[:length]) != recv_crc:
+            return -1
+    return length
+
+
+try:
+    from pymilight.radio.pl1167_frames import calc_crc, encode_frame, decode_frame
+except ImportError:
+    pass
 
 
 class PL1167_nRF24(object):
-    def __init__(self, radio):
+    def __init__(self, radio, trace=None):
         self._radio = radio
+        self._trace = TRACE if trace is None else trace
         self._crc = False
         self._preambleLength = 1
         self._syncword0 = 0
@@ -50,6 +116,7 @@ class PL1167_nRF24(object):
         self._maxPacketLength = 8
 
         self._channel = 0
+        self._listening = False
 
         self._nrf_pipe = []
 
@@ -59,15 +126,20 @@ class PL1167_nRF24(object):
         self._packet = []
         self._received = False
 
+        self._tx_frame = bytearray(MAX_FRAME_LENGTH)
+        self._tx_view = memoryview(self._tx_frame)
+        self._rx_frame = bytearray(MAX_FRAME_LENGTH)
+
     def open(self):
         self._radio.begin()
         self._radio.setAutoAck(False)
-        self._radio.setPALevel(RF24.RF24_PA_MAX)
-        self._radio.setDataRate(RF24.RF24_1MBPS)
+        self._radio.setPALevel(RF24_PA_MAX)
+        self._radio.setDataRate(RF24_1MBPS)
         self._radio.disableCRC()
 
         self._syncwordLength = 5
         self._radio.setAddressWidth(self._syncwordLength)
+        self._listening = False
 
         return self.recalc_parameters()
 
@@ -90,6 +162,8 @@ class PL1167_nRF24(object):
         self._radio.openReadingPipe(1, bytes(self._nrf_pipe))
 
         self._radio.setChannel(2 + self._channel)
+        # Another PL1167 sharing the radio may have been transmitting.
+        self._listening = False
         return 0
 
     def setPreambleLength(self, preambleLength):
@@ -119,14 +193,16 @@ class PL1167_nRF24(object):
             if retval < 0:
                 return retval
 
-        self._radio.startListening()
+        if not self._listening:
+            self._radio.startListening()
+            self._listening = True
         if self._radio.available():
-            LOGGER.info("Radio is available")
+            LOGGER.debug("Radio is available")
             self.internal_receive()
 
         if self._received:
             if self._packet_length > 0:
-                LOGGER.info("Received packet (len = %d)!", self._packet_length)
+                LOGGER.debug("Received packet (len = %d)!", self._packet_length)
             return self._packet_length
         return 0
 
@@ -157,47 +233,40 @@ class PL1167_nRF24(object):
                 return retval
 
         self._radio.stopListening()
-        tmp = []
-
-        if self._crc:
-            crc = calc_crc(self._packet)
-
-        for inp in range(len(self._packet) + (self._crc * 2) + 1):
-            if inp < len(self._packet):
-                tmp += [reverse_bits(self._packet[inp])]
-            elif self._crc and inp < len(self._packet) + 2:
-                tmp += [reverse_bits((crc >> ((inp - len(self._packet)) * 8)) & 0xff)]
-
-        return self._radio.write(bytes(tmp))
+        self._listening = False
+        length = encode_frame(self._packet, self._crc, self._tx_frame)
+        frame = bytes(self._tx_view[:length])
+        self._trace.record(TX, self._channel, frame, self._packet)
+        TX_FRAMES.inc()
+        return self._radio.write(frame)
+
+    def rearm(self):
+        """
+        Drop whatever is left in the receive FIFO after a bad frame.
+
+        With the nRF24's own CRC disabled noise is received as frames too.
+        Flushing is all it takes to recover, the radio used to be opened
+        again instead, which ran its whole setup and left it deaf for
+        several milliseconds.
+        """
+        self._radio.flush_rx()
 
     def internal_receive(self):
         tmp = self._radio.read(self._maxPacketLength + 2)
-
-        # HACK HACK HACK: Reset radio
-        self.open()
-
-        LOGGER.info("Packet received: ")
-        LOGGER.info("0x" + tmp.hex())
-
-        tmp = bytearray(reverse_bits(bval) for bval in tmp)
-
-        LOGGER.info("Packet transformed: ")
-        LOGGER.info("0x" + tmp.hex())
-
-        if self._crc:
-            if len(tmp) < 2:
-                LOGGER.info("Failed CRC: outp < 2")
-                return 0
-            crc = calc_crc(tmp[:-2])
-            recv_crc = ((tmp[-1] & 0xFF) << 8) | (tmp[-2] & 0xFF)
-            if crc != recv_crc:
-                LOGGER.info("Failed CRC: expected %d, got %d", crc, recv_crc)
-                return 0
-            tmp = tmp[:-2]
-
-        self._packet = tmp
-        self._packet_length = len(tmp)
+        length = decode_frame(tmp, self._crc, self._rx_frame)
+        RX_FRAMES.inc()
+
+        if length < 0:
+            self._trace.record(RX, self._channel, tmp, self._rx_frame[:len(tmp)], False)
+            CRC_FAILURES.inc()
+            LOGGER.debug("Failed CRC")
+            self.rearm()
+            return 0
+
+        self._packet = self._rx_frame[:length]
+        self._packet_length = length
         self._received = True
+        self._trace.record(RX, self._channel, tmp, self._packet)
 
-        LOGGER.info("Successfully parsed packet of length %d", self._packet_length)
+        LOGGER.debug("Successfully parsed packet of length %d", self._packet_length)
         return self._packet_length
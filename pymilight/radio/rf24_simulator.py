@@ -0,0 +1,213 @@
+"""
+In-memory stand in for RF24.RF24.
+
+Implements the part of the RF24 interface that PL1167_nRF24 uses, records
+every transmitted frame with a timestamp and models how long each frame
+keeps the channel busy. With loopback enabled transmitted frames can be
+received again, and inject() simulates frames sent by a remote. SPI
+traffic is counted the way the RF24 library would generate it.
+"""
+import collections
+import time
+
+
+SentFrame = collections.namedtuple("SentFrame", ["timestamp", "channel", "address", "payload"])
+
+# nRF24L01 framing: preamble, address, 9 bit packet control field, CRC.
+PREAMBLE_BYTES = 1
+PACKET_CONTROL_BITS = 9
+# Time for the PLL to settle before each transmission.
+TX_SETTLE_TIME = 130e-6
+
+# SPI transactions each RF24 call makes, after the RF24 library.
+SPI_TRANSACTIONS = {
+    "begin": 25,
+    "setAutoAck": 1,
+    "setPALevel": 2,
+    "setDataRate": 2,
+    "disableCRC": 2,
+    "setAddressWidth": 1,
+    "openWritingPipe": 3,
+    "openReadingPipe": 4,
+    "setChannel": 1,
+    "getChannel": 1,
+    "startListening": 4,
+    "stopListening": 3,
+    "available": 1,
+    "read": 2,
+    "write": 3,
+    "flush_rx": 1,
+}
+# An 8 MHz SPI transaction including chip select, a couple of bytes each.
+SPI_TRANSACTION_TIME = 5e-6
+# begin() waits for the radio to power up.
+POWER_UP_TIME = 5e-3
+
+DATA_RATES = {
+    0: 1000000,  # RF24_1MBPS
+    1: 2000000,  # RF24_2MBPS
+    2: 250000,   # RF24_250KBPS
+}
+
+
+class SimulatedRF24(object):
+    def __init__(self, loopback=False, realtime=False, max_queued=32):
+        """
+        loopback makes transmitted frames receivable. realtime sleeps for
+        each frame's airtime, otherwise a virtual clock advances instead.
+        """
+        self.loopback = loopback
+        self.realtime = realtime
+        self.max_queued = max_queued
+
+        self.frames = []
+        self.airtime = 0.0
+        self.clock = 0.0
+        self.spi_transactions = 0
+        self.on_receive = None
+
+        self._data_rate = DATA_RATES[0]
+        self._crc_length = 2
+        self._address_width = 5
+        self._channel = 0
+        self._listening = False
+        self._writing_pipe = None
+        self._reading_pipes = {}
+        self._ether = collections.defaultdict(collections.deque)
+
+    def now(self):
+        if self.realtime:
+            return time.monotonic()
+        return self.clock
+
+    def frame_airtime(self, payload_length):
+        bits = (PREAMBLE_BYTES + self._address_width + payload_length + self._crc_length) * 8
+        bits += PACKET_CONTROL_BITS
+        return TX_SETTLE_TIME + bits / float(self._data_rate)
+
+    def _spi(self, call):
+        count = SPI_TRANSACTIONS[call]
+        self.spi_transactions += count
+        if not self.realtime:
+            self.clock += count * SPI_TRANSACTION_TIME
+
+    # RF24 interface
+    def begin(self):
+        self._spi("begin")
+        if not self.realtime:
+            self.clock += POWER_UP_TIME
+        self._listening = False
+        return True
+
+    def setAutoAck(self, enable):
+        self._spi("setAutoAck")
+
+    def setPALevel(self, level):
+        self._spi("setPALevel")
+
+    def setDataRate(self, speed):
+        self._spi("setDataRate")
+        self._data_rate = DATA_RATES.get(speed, self._data_rate)
+        return True
+
+    def disableCRC(self):
+        self._spi("disableCRC")
+        self._crc_length = 0
+
+    def setAddressWidth(self, width):
+        self._spi("setAddressWidth")
+        self._address_width = width
+
+    def openWritingPipe(self, address):
+        self._spi("openWritingPipe")
+        self._writing_pipe = bytes(address)
+
+    def openReadingPipe(self, pipe, address):
+        self._spi("openReadingPipe")
+        self._reading_pipes[pipe] = bytes(address)
+
+    def setChannel(self, channel):
+        self._spi("setChannel")
+        self._channel = channel
+
+    def getChannel(self):
+        self._spi("getChannel")
+        return self._channel
+
+    def startListening(self):
+        self._spi("startListening")
+        self._listening = True
+
+    def stopListening(self):
+        self._spi("stopListening")
+        self._listening = False
+
+    def flush_rx(self):
+        self._spi("flush_rx")
+        self._ether[self._channel].clear()
+
+    def available(self):
+        self._spi("available")
+        return self._pending()
+
+    def _pending(self):
+        if not self._listening:
+            return False
+
+        frames = self._ether[self._channel]
+        addresses = self._reading_pipes.values()
+        while frames and frames[0][0] not in addresses:
+            frames.popleft()
+        return bool(frames)
+
+    def read(self, length):
+        self._spi("read")
+        if not self._pending():
+            return b""
+        _, payload = self._ether[self._channel].popleft()
+        return payload[:length]
+
+    def write(self, payload):
+        self._spi("write")
+        payload = bytes(payload)
+        airtime = self.frame_airtime(len(payload))
+        if self.realtime:
+            time.sleep(airtime)
+        else:
+            self.clock += airtime
+        self.airtime += airtime
+        self.frames.append(SentFrame(self.now(), self._channel, self._writing_pipe, payload))
+
+        if self.loopback:
+            self._queue(self._channel, self._writing_pipe, payload)
+        return True
+
+    # Simulation helpers
+    def inject(self, payload, channel=None, address=None):
+        """Queue a frame as if another transmitter had sent it."""
+        if channel is None:
+            channel = self._channel
+        if address is None:
+            address = self._reading_pipes.get(1)
+        self._queue(channel, address, bytes(payload))
+
+    def notify_on_receive(self, callback):
+        """
+        Call callback() when a frame arrives on the channel listened to,
+        as the nRF24 pulls its IRQ pin low.
+        """
+        self.on_receive = callback
+
+    def _queue(self, channel, address, payload):
+        frames = self._ether[channel]
+        frames.append((address, payload))
+        while len(frames) > self.max_queued:
+            frames.popleft()
+        if self.on_receive is not None and self._listening and channel == self._channel:
+            self.on_receive()
+
+    def reset(self):
+        """Forget recorded frames, airtime and SPI transactions."""
+        self.frames = []
+        self.airtime = 0.0
+        self.spi_transactions = 0
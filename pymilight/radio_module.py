@@ -0,0 +1,213 @@
+"""
+One nRF24L01 module and the thread that drives it.
+
+Each module has its own RF24, PL1167 emulation, MiLight radios and
+TransmitScheduler. Work is handed to the module's thread through a queue,
+so several modules can be on air at once while the RF24 of each is only
+ever used from one thread. A module can also receive, or only receive.
+"""
+import functools
+import logging
+import queue
+import time
+from threading import Event, Thread
+
+from pymilight.airtime import AirtimeBudget
+from pymilight.metrics import REGISTRY, Gauge
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+from pymilight.radio import NRF24MiLightRadio, MiLightRadioConfig
+from pymilight.transmit_scheduler import TransmitScheduler
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Remote types there is a packet formatter for. Only these get a radio,
+# the other types in MiLightRadioConfig.ALL_RADIOS can be neither sent to
+# nor parsed.
+FORMATTERS = {
+    "rgb_cct": PyRgbCctPacketFormatter,
+}
+
+
+class RadioModule(Thread):
+    def __init__(self, rf, name="radio0", device_types=None, receive=False, receive_only=False):
+        """
+        device_types limits which remotes this module transmits for, None
+        means all of them. receive_only implies receive.
+        """
+        super(RadioModule, self).__init__(name=name, daemon=True)
+        self.rf = rf
+        self.device_types = device_types
+        self.receive_only = receive_only
+        self.receives = receive or receive_only
+        # Seconds between radio polls when no receive notification is wired
+        # up, see notify_receive(). None only reads when notified. Each
+        # poll gives the radios a chance to hop to their next channel.
+        self.radio_poll_interval = 0.02
+        self.scheduler = TransmitScheduler()
+        # Only used by the thread submitting packets, see admit().
+        self.airtime = AirtimeBudget()
+        self.requests = queue.Queue()
+        # A pymilight.capture.CaptureWriter to record received packets to.
+        self.capture = None
+
+        self.radios = {
+            device_type: NRF24MiLightRadio(rf, radio_config)
+            for device_type, radio_config in MiLightRadioConfig.ALL_RADIOS.items()
+            if device_type in FORMATTERS
+        }
+        # Parsing happens on this thread, so it gets its own formatters.
+        self.parsers = {device_type: cls() for device_type, cls in FORMATTERS.items()}
+
+        self._stopped = Event()
+        self._radio_event = False
+
+        # Removed again by stop().
+        self.metrics = [
+            Gauge(
+                "pymilight_tx_queued_packets", "Packets with repeats left to send",
+                {"module": name}, lambda: len(self.scheduler)
+            ),
+            Gauge(
+                "pymilight_airtime_available_frames", "Frames the airtime budget allows without waiting",
+                {"module": name}, lambda: self.airtime.available()
+            ),
+        ]
+        for metric in self.metrics:
+            REGISTRY.register(metric)
+
+    def handles(self, device_type):
+        if self.receive_only or device_type not in self.parsers:
+            return False
+        return self.device_types is None or device_type in self.device_types
+
+    def begin(self):
+        for radio in self.radios.values():
+            radio.begin()
+        # begin() leaves the last radio configured.
+        self.scheduler.configured = list(self.radios.values())[-1]
+
+    def admit(self, device_type, repeats, minimum):
+        """The repeats to submit a packet with, given the airtime left and the frames queued."""
+        channels = len(MiLightRadioConfig.ALL_RADIOS[device_type].channels)
+        backlog = self.scheduler.queued_repeats * channels
+        return self.airtime.admit(repeats, minimum, channels, backlog)
+
+    def packet_rate(self, device_type, repeats):
+        """Packets per second the airtime budget allows, each sent with repeats."""
+        channels = len(MiLightRadioConfig.ALL_RADIOS[device_type].channels)
+        return self.airtime.rate / (repeats * channels)
+
+    def submit(self, key, device_type, packet, repeats, timeout=None):
+        """Queue repeats copies of packet for the bulb key."""
+        self.requests.put(functools.partial(
+            self.scheduler.add, key, self.radios[device_type], bytes(packet), repeats, timeout
+        ))
+
+    def notify(self, key, callback):
+        """Call callback() on this thread once everything submitted for key is sent."""
+        self.requests.put(functools.partial(self.scheduler.notify, key, callback))
+
+    def notify_radio(self):
+        """Read the radio as soon as possible, e.g. from an IRQ callback."""
+        self.requests.put(self._set_radio_event)
+
+    def notify_receive(self, subscribe):
+        """
+        Read the radio only when a frame arrives instead of polling it, so
+        an idle module sleeps. subscribe(callback) arranges for callback()
+        to be called on every frame, e.g. from the nRF24's IRQ pin. The
+        IRQ only fires for the channel listened to, so the radios stop
+        hopping; remotes send on every channel anyway.
+        """
+        subscribe(self.notify_radio)
+        self.radio_poll_interval = None
+        for radio in self.radios.values():
+            radio.channel_dwell = None
+
+    def on_packet(self, device_type, parsed):
+        """Called on this thread with each packet received. Replaced by the controller."""
+
+    def busy(self):
+        return bool(self.requests.unfinished_tasks or self.scheduler)
+
+    def stop(self):
+        self._stopped.set()
+        self.requests.put(lambda: None)
+        for metric in self.metrics:
+            REGISTRY.unregister(metric)
+
+    def run(self):
+        next_radio_poll = 0
+        # Start listening.
+        self._radio_event = self.receives
+        while not self._stopped.is_set():
+            # Sleep until there is work to do: a submitted packet, a radio
+            # notification or the next scheduled radio poll. Only check
+            # for new work while packets are waiting to be sent.
+            timeout = None
+            if self.scheduler or self._radio_event:
+                timeout = 0
+            elif self.receives and self.radio_poll_interval is not None:
+                timeout = max(0, next_radio_poll - time.monotonic())
+            self.process_requests(timeout)
+
+            # One copy of each queued packet.
+            if self.scheduler:
+                try:
+                    self.scheduler.step()
+                except Exception as err:
+                    # Only the packet that failed is dropped.
+                    LOGGER.critical("%s failed to transmit: %s", self.name, err)
+                # Transmitting stops the radio listening, so listen again
+                # once everything is sent.
+                if not self.scheduler:
+                    self._radio_event = True
+
+            now = time.monotonic()
+            if self.receives and (self._radio_event or (
+                    self.radio_poll_interval is not None and now >= next_radio_poll)):
+                self._radio_event = False
+                next_radio_poll = now + (self.radio_poll_interval or 0)
+                try:
+                    self.receive()
+                except Exception as err:
+                    LOGGER.critical("Error receiveing from radio: %s", err)
+
+        self.flush()
+        if self.capture is not None:
+            self.capture.flush()
+
+    def process_requests(self, timeout=0):
+        try:
+            request = self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            try:
+                request()
+            except Exception as err:
+                LOGGER.critical("%s failed to queue a packet: %s", self.name, err)
+            self.requests.task_done()
+            try:
+                request = self.requests.get(block=False)
+            except queue.Empty:
+                return
+
+    def flush(self):
+        """Send everything submitted so far. Only call when the thread is not running."""
+        self.process_requests()
+        self.scheduler.flush()
+
+    def receive(self):
+        for device_type, parser in self.parsers.items():
+            radio = self.radios[device_type]
+            self.scheduler.configure(radio)
+            while radio.available():
+                packet = radio.read(9)
+                if self.capture is not None and self.capture.device_type == device_type:
+                    self.capture.write(radio.listen_channel, packet)
+                self.on_packet(device_type, parser.parse(packet))
+
+    def _set_radio_event(self):
+        self._radio_event = True
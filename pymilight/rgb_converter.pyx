@@ -1,9 +1,11 @@
 # distutils: language=c++
 # distutils: sources = vendor/RGBConverter/RGBConverter.cpp
+cimport cython
+from cython.view cimport array as cvarray
 
 ctypedef unsigned char byte
 
-cdef extern from "RGBConverter/RGBConverter.h":
+cdef extern from "RGBConverter/RGBConverter.h" nogil:
     cdef cppclass RGBConverter:
         void rgbToHsl(byte r, byte g, byte b, double hsl[])
         void hslToRgb(double h, double s, double l, byte rgb[])
@@ -27,3 +29,72 @@ def hsv_to_rgb(float hue, float saturation, float value):
     cdef RGBConverter converter
     converter.hsvToRgb(hue, saturation, value, rgb)
     return (rgb[0], rgb[1], rgb[2])
+
+
+# Batch versions of the above. They take any (N, 3) buffer, e.g. a NumPy
+# array or memoryview.cast("B", (n, 3)), convert without holding the GIL
+# and write into out, which is allocated if not given. Colours are uint8,
+# hue, saturation, value and lightness doubles.
+
+cdef new_out(Py_ssize_t rows, Py_ssize_t itemsize, format):
+    if rows == 0:
+        # A cython array cannot be empty, an empty slice of a memoryview can.
+        return memoryview(bytearray(3 * itemsize)).cast(format, (1, 3))[:0]
+    return cvarray(shape=(rows, 3), itemsize=itemsize, format=format)
+
+cdef check_shapes(Py_ssize_t rows, Py_ssize_t columns, Py_ssize_t out_rows, Py_ssize_t out_columns):
+    if columns != 3:
+        raise ValueError("Expected an (N, 3) array")
+    if out_rows != rows or out_columns != 3:
+        raise ValueError("out must have shape (%d, 3)" % rows)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rgb_to_hsl_batch(const byte[:, :] rgb, double[:, :] out=None):
+    if out is None:
+        out = new_out(rgb.shape[0], sizeof(double), "d")
+    check_shapes(rgb.shape[0], rgb.shape[1], out.shape[0], out.shape[1])
+    cdef double hsl[3]
+    cdef RGBConverter converter
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(rgb.shape[0]):
+            converter.rgbToHsl(rgb[i, 0], rgb[i, 1], rgb[i, 2], hsl)
+            out[i, 0] = hsl[0]
+            out[i, 1] = hsl[1]
+            out[i, 2] = hsl[2]
+    return out.base
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rgb_to_hsv_batch(const byte[:, :] rgb, double[:, :] out=None):
+    if out is None:
+        out = new_out(rgb.shape[0], sizeof(double), "d")
+    check_shapes(rgb.shape[0], rgb.shape[1], out.shape[0], out.shape[1])
+    cdef double hsv[3]
+    cdef RGBConverter converter
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(rgb.shape[0]):
+            converter.rgbToHsv(rgb[i, 0], rgb[i, 1], rgb[i, 2], hsv)
+            out[i, 0] = hsv[0]
+            out[i, 1] = hsv[1]
+            out[i, 2] = hsv[2]
+    return out.base
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def hsv_to_rgb_batch(const double[:, :] hsv, byte[:, :] out=None):
+    if out is None:
+        out = new_out(hsv.shape[0], sizeof(byte), "B")
+    check_shapes(hsv.shape[0], hsv.shape[1], out.shape[0], out.shape[1])
+    cdef byte rgb[3]
+    cdef RGBConverter converter
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(hsv.shape[0]):
+            converter.hsvToRgb(hsv[i, 0], hsv[i, 1], hsv[i, 2], rgb)
+            out[i, 0] = rgb[0]
+            out[i, 1] = rgb[1]
+            out[i, 2] = rgb[2]
+    return out.base
@@ -22,6 +22,21 @@ FIELD_NAMES = [
 ]
 
 
+# State fields that are persisted, see StateStore.
+PERSISTED_FIELDS = (
+    "_state",
+    "_brightness",
+    "_brightness_color",
+    "_brightness_mode",
+    "_hue",
+    "_saturation",
+    "_mode",
+    "_bulb_mode",
+    "_white_val",
+    "_night_mode",
+)
+
+
 BULB_MODE_WHITE = 0
 BULB_MODE_COLOR = 1
 BULB_MODE_SCENE = 2
@@ -34,6 +49,9 @@ BULB_MODE_NAMES = {
 }
 
 class State:
+    # Installations can have tens of thousands of bulbs, keep them small.
+    _data_fields = PERSISTED_FIELDS + ("_dirty", "_mqtt_dirty")
+    __slots__ = _data_fields + ("_rendered", "_rendered_json")
     _instances = {}
 
     @staticmethod
@@ -62,20 +80,9 @@ class State:
         self._dirty = 1
         self._mqtt_dirty = 0
 
-        self._data_fields = [
-            "_state",
-            "_brightness",
-            "_brightness_color",
-            "_brightness_mode",
-            "_hue",
-            "_saturation",
-            "_mode",
-            "_bulb_mode",
-            "_white_val",
-            "_night_mode",
-            "_dirty",
-            "_mqtt_dirty",
-        ]
+        # apply_state() output, kept until the next change.
+        self._rendered = None
+        self._rendered_json = None
 
     @property
     def state(self):
@@ -218,6 +225,8 @@ class State:
     def set_dirty(self):
         self._dirty = True
         self._mqtt_dirty = True
+        self._rendered = None
+        self._rendered_json = None
 
     def clear_dirty(self):
         self._dirty = False
@@ -226,11 +235,36 @@ class State:
         self._mqtt_dirty = False
 
     def load(self, json_str):
-        data = json.loads(json_str)
+        self.set_fields(json.loads(json_str))
+        self.clear_dirty()
+
+    def get_fields(self):
+        return {key: getattr(self, key) for key in PERSISTED_FIELDS}
+
+    def set_fields(self, data):
         for key in data:
             setattr(self, key, data[key])
-
-        self.clear_dirty()
+        self._rendered = None
+        self._rendered_json = None
+
+    def render(self):
+        """
+        Return the full state as apply_state() would fill it in.
+
+        The dict is cached until the state next changes and must not be
+        modified.
+        """
+        if self._rendered is None:
+            rendered = {}
+            self.apply_state(rendered)
+            self._rendered = rendered
+        return self._rendered
+
+    def render_json(self):
+        """Return render() serialised as JSON bytes, also cached."""
+        if self._rendered_json is None:
+            self._rendered_json = json.dumps(self.render(), separators=(",", ":")).encode("utf-8")
+        return self._rendered_json
 
     def dump(self):
         data = {key: getattr(self, key) for key in self._data_fields}
@@ -310,7 +344,8 @@ class State:
 
         if field == "computed_color":
             if self.bulb_mode == BULB_MODE_COLOR:
-                self.apply_color(partial_state)
+                if "color" not in partial_state:
+                    self.apply_color(partial_state)
             elif self.bulb_mode is not None:
                 self.apply_rgb_color(partial_state, 255, 255, 255)
             return
@@ -0,0 +1,131 @@
+"""
+Append-only persistence for bulb states.
+
+Each change is appended to a journal as one JSON line holding the key and
+only the fields that changed since the state was last written. The journal
+is periodically compacted into a snapshot with one line per bulb in the
+same format, so loading is a sequential read of the snapshot followed by
+the journal, with later lines overriding earlier ones.
+"""
+import json
+import logging
+import os
+
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = "states.snapshot"
+JOURNAL_NAME = "states.journal"
+
+
+class StateJournal(object):
+    DEFAULT_COMPACT_ENTRIES = 1000
+
+    def __init__(self, root, compact_entries=DEFAULT_COMPACT_ENTRIES):
+        self.root = root
+        self.snapshot_path = os.path.join(root, SNAPSHOT_NAME)
+        self.journal_path = os.path.join(root, JOURNAL_NAME)
+        # Compact once the journal holds this many entries.
+        self.compact_entries = compact_entries
+        self.entries = 0
+
+        # The fields of every key as they were last written.
+        self._written = {}
+        self._journal = None
+
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def load(self):
+        """Return {key: fields} for everything in the snapshot and journal."""
+        states = {}
+        self.entries = 0
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                fobj = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with fobj:
+                data = fobj.read()
+            lines = data.split(b"\n")
+            # The last line has no newline if a power cut stopped it short.
+            partial = lines.pop()
+            if partial and path == self.journal_path:
+                LOGGER.warning("Dropping a partial record from %s", path)
+                # Or the next append is written onto the end of it.
+                with open(path, "r+b") as fobj:
+                    fobj.truncate(len(data) - len(partial))
+            for line in lines:
+                try:
+                    device_type, device_id, group_id, fields = json.loads(line)
+                except ValueError:
+                    LOGGER.warning("Skipping corrupt line in %s", path)
+                    continue
+                states.setdefault((device_type, device_id, group_id), {}).update(fields)
+                if path == self.journal_path:
+                    self.entries += 1
+
+        self._written = {key: dict(fields) for key, fields in states.items()}
+        return states
+
+    def append(self, key, fields):
+        """Journal the fields that differ from what was last written for key."""
+        written = self._written.setdefault(key, {})
+        delta = {
+            name: value for name, value in fields.items()
+            if name not in written or written[name] != value
+        }
+        if not delta:
+            return False
+
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a")
+        self._journal.write(json.dumps(list(key) + [delta], separators=(",", ":")))
+        self._journal.write("\n")
+        written.update(delta)
+        self.entries += 1
+        return True
+
+    def sync(self):
+        """Make everything appended so far durable."""
+        if self._journal is None:
+            return
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def compact(self):
+        """Replace the snapshot with the current states and empty the journal."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as fobj:
+            for key, fields in self._written.items():
+                fobj.write(json.dumps(list(key) + [fields], separators=(",", ":")))
+                fobj.write("\n")
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._sync_root()
+
+        # Only safe once the new snapshot is in place.
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w")
+        self.entries = 0
+
+    def close(self):
+        if self._journal is not None:
+            self.sync()
+            self._journal.close()
+            self._journal = None
+
+    def _sync_root(self):
+        # Persist the rename itself.
+        try:
+            fd = os.open(self.root, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -1,16 +1,36 @@
-import json
-import os
+"""
+Bulb states, persisted write-behind.
+
+Changed states are journaled by flush(), which start() runs on a timer so
+commands never wait on the SD card. mark_dirty() takes a copy of the
+fields on the caller's thread, so the writer never reads a State while it
+is being changed. See StateJournal for the file format. Without a
+persist_root states are only kept in memory.
+"""
+import logging
+import threading
 
 from pymilight.state import State
+from pymilight.state_journal import StateJournal
+
+
+LOGGER = logging.getLogger(__name__)
+
 
 class StateStore:
-    def __init__(self, persist_root):
+    DEFAULT_FLUSH_INTERVAL = 5.0
+
+    def __init__(self, persist_root, compact_entries=StateJournal.DEFAULT_COMPACT_ENTRIES):
         self._states = {}
-        self._dirty = []
+        # Key to the fields to write for it, see mark_dirty().
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._writer = None
         self.persist_root = persist_root
-
-        if not os.path.isdir(persist_root):
-            os.makedirs(persist_root)
+        self.journal = None
+        if persist_root is not None:
+            self.journal = StateJournal(persist_root, compact_entries)
 
     def __getitem__(self, key):
         try:
@@ -19,14 +39,62 @@ class StateStore:
             self._states[key] = State()
             return self._states[key]
 
+    def __len__(self):
+        return len(self._states)
+
+    def mark_dirty(self, key):
+        """Queue the state for key, as it is now, to be written by the next flush."""
+        state = self[key]
+        fields = state.get_fields()
+        state.clear_dirty()
+        with self._lock:
+            self._dirty[key] = fields
+
+    def load(self):
+        """Restore the persisted states, replacing any loaded already."""
+        if self.journal is None:
+            return
+        with self._lock:
+            for key, fields in self.journal.load().items():
+                state = State()
+                state.set_fields(fields)
+                state.clear_dirty()
+                self._states[key] = state
+            self._dirty = {}
+
     def flush(self):
-        for key in self._states:
-            if not self._states[key].is_dirty:
-                continue
-
-            path = os.path.join(self.persist_root, "{0}-{1}-{2}.json".format(*key))
-            with open(path, 'w') as fobj:
-                vals = {}
-                self._states[key].apply_state(vals)
-                self._states[key].clear_dirty()
-                json.dump(vals, fobj)
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = {}
+            if self.journal is None:
+                return
+            for key, fields in dirty.items():
+                self.journal.append(key, fields)
+
+            self.journal.sync()
+            if self.journal.entries >= self.journal.compact_entries:
+                self.journal.compact()
+
+    def start(self, interval=DEFAULT_FLUSH_INTERVAL):
+        """Flush every interval seconds from a background thread."""
+        self._stopped.clear()
+        self._writer = threading.Thread(target=self._write_behind, args=(interval,), daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """Stop the background thread and write out anything left."""
+        self._stopped.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        with self._lock:
+            if self.journal is not None:
+                self.journal.close()
+
+    def _write_behind(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception as err:
+                LOGGER.critical("Failed to persist states: %s", err)
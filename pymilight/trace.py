@@ -0,0 +1,135 @@
+"""
+Binary trace of the frames going through the radio.
+
+Every frame transmitted or received is packed into a fixed-size record in
+a preallocated ring buffer, so tracing can stay on all the time. The
+buffer can be dumped to a file on demand or when the process receives a
+signal, and printed with:
+
+    python -m pymilight.trace_dump pymilight-trace.bin
+"""
+import collections
+import itertools
+import logging
+import signal
+import struct
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+TX = 0
+RX = 1
+DIRECTION_NAMES = {TX: "tx", RX: "rx"}
+
+MAX_BYTES = 32
+# timestamp, direction, channel, CRC ok, raw length, decoded length, raw, decoded
+RECORD = struct.Struct("<dBBBBB{0}s{0}s".format(MAX_BYTES))
+HEADER = struct.Struct("<4sHI")
+MAGIC = b"PLTR"
+
+TraceRecord = collections.namedtuple(
+    "TraceRecord", ["timestamp", "direction", "channel", "crc_ok", "raw", "decoded"]
+)
+
+
+class PacketTrace(object):
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.enabled = True
+        self._buffer = bytearray(capacity * RECORD.size)
+        # next() on a count is atomic, so threads never get the same slot.
+        self._counter = itertools.count()
+        self._next = 0
+
+    def __len__(self):
+        return min(self._next, self.capacity)
+
+    def record(self, direction, channel, raw, decoded=b"", crc_ok=True):
+        if not self.enabled:
+            return
+        index = next(self._counter)
+        self._next = index + 1
+        RECORD.pack_into(
+            self._buffer,
+            (index % self.capacity) * RECORD.size,
+            time.time(),
+            direction,
+            channel,
+            crc_ok,
+            min(len(raw), MAX_BYTES),
+            min(len(decoded), MAX_BYTES),
+            bytes(raw),
+            bytes(decoded)
+        )
+
+    def records(self):
+        """The recorded frames, oldest first."""
+        end = self._next
+        for index in range(max(0, end - self.capacity), end):
+            yield unpack_record(self._buffer, (index % self.capacity) * RECORD.size)
+
+    def dump(self, path):
+        """Write the buffer to path, oldest record first. Returns the number written."""
+        end = self._next
+        start = max(0, end - self.capacity)
+        with open(path, "wb") as fobj:
+            fobj.write(HEADER.pack(MAGIC, RECORD.size, end - start))
+            first = start % self.capacity
+            if end - start == self.capacity and first:
+                fobj.write(self._buffer[first * RECORD.size:])
+                fobj.write(self._buffer[:first * RECORD.size])
+            else:
+                fobj.write(self._buffer[first * RECORD.size:(first + end - start) * RECORD.size])
+        return end - start
+
+    def clear(self):
+        self._counter = itertools.count()
+        self._next = 0
+
+
+def unpack_record(buffer, offset=0):
+    timestamp, direction, channel, crc_ok, raw_length, decoded_length, raw, decoded = \
+        RECORD.unpack_from(buffer, offset)
+    return TraceRecord(
+        timestamp,
+        direction,
+        channel,
+        bool(crc_ok),
+        raw[:raw_length],
+        decoded[:decoded_length]
+    )
+
+
+def load(path):
+    with open(path, "rb") as fobj:
+        data = fobj.read()
+    magic, record_size, count = HEADER.unpack_from(data)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError("Not a packet trace: %s" % path)
+    return [unpack_record(data, HEADER.size + index * RECORD.size) for index in range(count)]
+
+
+def install_signal_handler(trace, path, signum=signal.SIGUSR1):
+    """Dump trace to path whenever the process receives signum."""
+    def dump(signum, frame):
+        count = trace.dump(path)
+        LOGGER.warning("Dumped %d traced frames to %s", count, path)
+    signal.signal(signum, dump)
+
+
+def format_record(record):
+    return "{:.6f} {} ch {:>3} {:<3} {} {}".format(
+        record.timestamp,
+        DIRECTION_NAMES.get(record.direction, "?"),
+        record.channel,
+        "ok" if record.crc_ok else "bad",
+        record.raw.hex(),
+        record.decoded.hex()
+    )
+
+
+# Shared by every radio unless it is given its own.
+TRACE = PacketTrace()
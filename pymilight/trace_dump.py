@@ -0,0 +1,21 @@
+"""
+Print a packet trace dumped by pymilight.trace:
+
+    python -m pymilight.trace_dump pymilight-trace.bin
+"""
+import argparse
+
+from pymilight.trace import format_record, load
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Print a packet trace dump")
+    parser.add_argument("path")
+    args = parser.parse_args(args)
+
+    for record in load(args.path):
+        print(format_record(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Fade bulbs to a new brightness, hue or colour temperature.
+
+MiLight bulbs jump straight to the value they are sent, so a transition is
+a series of intermediate values sent over its duration. All fades share a
+budget of packets per second: the more fades are running the longer each
+waits between steps. MiLightController sets the budget to a share of what
+the radios' airtime budgets allow for packets sent with the minimum
+repeats, see pymilight.airtime. A step whose value did not change is
+skipped, and the target value is always sent at the end.
+"""
+import collections
+import time
+
+
+Step = collections.namedtuple("Step", ["key", "op", "value", "final"])
+
+
+class Fade(object):
+    __slots__ = ("key", "op", "start", "end", "started", "duration", "wrap", "sent", "next_step")
+
+    def __init__(self, key, op, start, end, started, duration, wrap=None):
+        self.key = key
+        self.op = op
+        self.start = start
+        self.end = end
+        self.started = started
+        self.duration = duration
+        # Values wrap around at this, e.g. 360 for hue, and take the short way round.
+        self.wrap = wrap
+        self.sent = start
+        self.next_step = started
+
+    def value(self, progress):
+        if progress >= 1:
+            return self.end
+        delta = self.end - self.start
+        if self.wrap is not None:
+            delta = (delta + self.wrap / 2) % self.wrap - self.wrap / 2
+            return int(round(self.start + delta * progress)) % self.wrap
+        return int(round(self.start + delta * progress))
+
+
+# Fraction of the radios' airtime fades may use, the rest is left for commands.
+AIRTIME_SHARE = 0.5
+
+
+class TransitionEngine(object):
+    # Packets per second for all fades together, without a radio to derive it from.
+    DEFAULT_BUDGET = 20
+    # Seconds between the steps of a fade when few are running.
+    MIN_INTERVAL = 0.05
+
+    def __init__(self, budget=DEFAULT_BUDGET, clock=time.monotonic):
+        self.budget = budget
+        self.min_interval = self.MIN_INTERVAL
+        self.clock = clock
+        self.steps = 0
+        self.cancelled = 0
+        self._fades = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._fades)
+
+    def __bool__(self):
+        return bool(self._fades)
+
+    def interval(self):
+        """Seconds between the steps of each fade, so all fades keep within the budget."""
+        return max(self.min_interval, len(self._fades) / float(self.budget))
+
+    def start(self, key, op, start, end, duration, wrap=None):
+        """
+        Fade the bulb key from start to end over duration seconds, sending
+        op packets. Replaces a fade of the same op. Returns the Fade, or
+        None if there is nothing to fade.
+        """
+        self._fades.pop((key, op), None)
+        if start is None or start == end or duration <= 0:
+            return None
+        now = self.clock()
+        fade = Fade(key, op, start, end, now, duration, wrap)
+        self._fades[(key, op)] = fade
+        # The bulb is already at start.
+        fade.next_step = now + self.interval()
+        return fade
+
+    def cancel(self, key):
+        """Stop the fades of the bulb key where they are. Returns the Fades stopped."""
+        fades = [self._fades.pop(fade_key) for fade_key in list(self._fades) if fade_key[0] == key]
+        self.cancelled += len(fades)
+        return fades
+
+    def timeout(self):
+        """Seconds until the next step is due, None without fades."""
+        if not self._fades:
+            return None
+        next_step = min(fade.next_step for fade in self._fades.values())
+        return max(0, next_step - self.clock())
+
+    def due(self):
+        """Return the Steps due now and schedule the next ones."""
+        now = self.clock()
+        interval = self.interval()
+        steps = []
+        for fade_key, fade in list(self._fades.items()):
+            if fade.next_step > now:
+                continue
+            progress = (now - fade.started) / fade.duration
+            value = fade.value(progress)
+            final = progress >= 1
+            if final:
+                del self._fades[fade_key]
+            else:
+                # Finish on time rather than a step late.
+                fade.next_step = min(now + interval, fade.started + fade.duration)
+            if final or value != fade.sent:
+                fade.sent = value
+                steps.append(Step(fade.key, fade.op, value, final))
+        self.steps += len(steps)
+        return steps
@@ -0,0 +1,196 @@
+"""
+Interleave the repeats of queued packets.
+
+Every packet is sent a number of times to make up for lost frames. Sending
+all copies of one packet before starting the next holds every other bulb
+up, so the scheduler sends one copy of each queued packet per round
+instead. Packets for the same bulb are still sent one after the other, so
+a bulb never sees an earlier command after a later one.
+
+Changing remote type means reconfiguring the radio, so packets are sent in
+batches by remote type. The scheduler keeps to the configured type for up
+to batch_window seconds while it has packets, then moves on to the type
+that was served longest ago.
+"""
+import collections
+import time
+
+from pymilight.metrics import REGISTRY
+
+
+REPEATS_DROPPED = REGISTRY.counter(
+    "pymilight_tx_repeats_dropped_total", "Packet repeats dropped because they were past their deadline"
+)
+RECONFIGURATIONS = REGISTRY.counter(
+    "pymilight_radio_reconfigurations_total", "Radio reconfigurations for a different remote type"
+)
+PACKETS_FAILED = REGISTRY.counter(
+    "pymilight_tx_packets_failed_total", "Packets dropped because the radio failed to send them"
+)
+
+
+class Transmission(object):
+    __slots__ = ("radio", "packet", "remaining", "deadline", "callbacks")
+
+    def __init__(self, radio, packet, repeats, deadline):
+        self.radio = radio
+        self.packet = packet
+        self.remaining = repeats
+        self.deadline = deadline
+        self.callbacks = []
+
+
+class TransmitScheduler(object):
+    DEFAULT_BATCH_WINDOW = 0.05
+
+    def __init__(self, clock=time.monotonic, batch_window=DEFAULT_BATCH_WINDOW):
+        self.clock = clock
+        # Seconds to keep sending for one remote type while others wait.
+        self.batch_window = batch_window
+        # The radio whose configuration is loaded, see configure().
+        self.configured = None
+        self.sent = 0
+        self.expired = 0
+        self.failed = 0
+        self.reconfigurations = 0
+        # Copies of all queued packets still to send.
+        self.queued_repeats = 0
+        self._queues = collections.OrderedDict()
+        self._batch_radio = None
+        self._batch_started = 0
+        # When each radio was last picked for a batch.
+        self._served = {}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def __bool__(self):
+        return bool(self._queues)
+
+    def add(self, key, radio, packet, repeats, timeout=None):
+        """
+        Queue repeats copies of packet for the bulb identified by key.
+
+        Copies that are still unsent timeout seconds from now are dropped,
+        though the first copy is always sent.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = self.clock() + timeout
+        transmission = Transmission(radio, bytes(packet), max(1, repeats), deadline)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = collections.deque()
+        queue.append(transmission)
+        self.queued_repeats += transmission.remaining
+        return transmission
+
+    def notify(self, key, callback):
+        """Call callback() once everything queued for key so far is sent."""
+        queue = self._queues.get(key)
+        if not queue:
+            callback()
+        else:
+            queue[-1].callbacks.append(callback)
+
+    def configure(self, radio):
+        if radio is not self.configured:
+            radio.configure()
+            self.configured = radio
+            self.reconfigurations += 1
+            RECONFIGURATIONS.inc()
+
+    def select_radio(self):
+        """The radio to send for in the next step, None if nothing is queued."""
+        pending = collections.OrderedDict()
+        for queue in self._queues.values():
+            pending[queue[0].radio] = True
+        if not pending:
+            return None
+
+        now = self.clock()
+        radio = self._batch_radio
+        if radio in pending and (len(pending) == 1 or now - self._batch_started < self.batch_window):
+            return radio
+
+        others = [other for other in pending if other is not radio]
+        radio = min(others, key=lambda other: self._served.get(other, float("-inf")))
+        self._batch_radio = radio
+        self._batch_started = now
+        self._served[radio] = now
+        return radio
+
+    def step(self):
+        """
+        Send one copy of the next packet for each bulb of the current remote
+        type. Returns the number sent.
+
+        A packet the radio fails to send is dropped, as if sent, and the
+        error raised. Every other packet stays queued.
+        """
+        radio = self.select_radio()
+        if radio is None:
+            return 0
+        try:
+            self.configure(radio)
+        except Exception:
+            for key in list(self._queues):
+                if self._queues[key][0].radio is radio:
+                    self._fail(key)
+            raise
+
+        sent = 0
+        for key in list(self._queues):
+            queue = self._queues[key]
+            transmission = queue[0]
+            if transmission.radio is not radio:
+                continue
+            try:
+                radio.write(transmission.packet)
+            except Exception:
+                self.sent += sent
+                self.queued_repeats -= sent
+                self._fail(key)
+                raise
+            transmission.remaining -= 1
+            sent += 1
+
+            if transmission.remaining > 0 and transmission.deadline is not None \
+                    and self.clock() >= transmission.deadline:
+                self.expired += transmission.remaining
+                self.queued_repeats -= transmission.remaining
+                REPEATS_DROPPED.inc(transmission.remaining)
+                transmission.remaining = 0
+
+            if transmission.remaining == 0:
+                self._pop(key)
+
+        self.sent += sent
+        self.queued_repeats -= sent
+        return sent
+
+    def _pop(self, key):
+        queue = self._queues[key]
+        transmission = queue.popleft()
+        if not queue:
+            del self._queues[key]
+        for callback in transmission.callbacks:
+            callback()
+
+    def _fail(self, key):
+        transmission = self._queues[key][0]
+        self.failed += 1
+        self.queued_repeats -= transmission.remaining
+        PACKETS_FAILED.inc()
+        transmission.remaining = 0
+        self._pop(key)
+
+    def flush(self):
+        """Send everything that is queued."""
+        while self._queues:
+            self.step()
+
+    def clear(self):
+        self._queues.clear()
+        self.queued_repeats = 0
+        self._batch_radio = None
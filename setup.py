@@ -26,6 +26,10 @@ extensions = [
             ('PYMILIGHT_NEED_MINMAX', '1')
         ],
     ),
+    Extension(
+        "pymilight.radio.pl1167_frames",
+        ["pymilight/radio/pl1167_frames.pyx"],
+    ),
 ]
 
 setup(
@@ -1,9 +1,7 @@
 #include <PacketFormatter.h>
 
-static uint8_t* PACKET_BUFFER = new uint8_t[PACKET_FORMATTER_BUFFER_SIZE];
-
 PacketStream::PacketStream()
-    : packetStream(PACKET_BUFFER),
+    : packetStream(NULL),
       numPackets(0),
       packetLength(0),
       currentPacket(0)
@@ -20,11 +18,12 @@ uint8_t* PacketStream::next() {
 }
 
 PacketFormatter::PacketFormatter(const size_t packetLength, const size_t maxPackets)
-  : packetLength(packetLength),
+  : currentPacket(NULL),
+    packetLength(packetLength),
     numPackets(0),
-    currentPacket(NULL),
     held(false)
 {
+  packetStream.packetStream = packetBuffer;
   packetStream.packetLength = packetLength;
 }
 
@@ -64,10 +63,58 @@ void PacketFormatter::enableNightMode() { }
 void PacketFormatter::updateTemperature(uint8_t value) { }
 void PacketFormatter::updateSaturation(uint8_t value) { }
 
-BulbId PacketFormatter::parsePacket(const uint8_t *packet, JsonObject &result, GroupStateStore* stateStore) {
+ParsedPacket::ParsedPacket()
+  : fields(0),
+    state(OFF),
+    command(NULL),
+    hue(0),
+    colorTemp(0),
+    brightness(0),
+    saturation(0),
+    mode(0),
+    buttonId(0),
+    argument(0)
+{ }
+
+void ParsedPacket::toJson(JsonObject& result) const {
+  if (fields & PARSED_STATE) {
+    result["state"] = state == ON ? "ON" : "OFF";
+  }
+  if (fields & PARSED_COMMAND) {
+    result["command"] = command;
+  }
+  if (fields & PARSED_HUE) {
+    result["hue"] = hue;
+  }
+  if (fields & PARSED_COLOR_TEMP) {
+    result["color_temp"] = colorTemp;
+  }
+  if (fields & PARSED_BRIGHTNESS) {
+    result["brightness"] = brightness;
+  }
+  if (fields & PARSED_SATURATION) {
+    result["saturation"] = saturation;
+  }
+  if (fields & PARSED_MODE) {
+    result["mode"] = mode;
+  }
+  if (fields & PARSED_BUTTON) {
+    result["button_id"] = buttonId;
+    result["argument"] = argument;
+  }
+}
+
+BulbId PacketFormatter::decodePacket(const uint8_t *packet, ParsedPacket &result) {
   return DEFAULT_BULB_ID;
 }
 
+BulbId PacketFormatter::parsePacket(const uint8_t *packet, JsonObject &result, GroupStateStore* stateStore) {
+  ParsedPacket parsed;
+  BulbId bulbId = decodePacket(packet, parsed);
+  parsed.toJson(result);
+  return bulbId;
+}
+
 void PacketFormatter::pair() {
   for (size_t i = 0; i < 5; i++) {
     updateStatus(ON);
@@ -117,18 +164,18 @@ void PacketFormatter::pushPacket() {
   }
 
   // Make sure there's enough buffer to add another packet.
-  if ((currentPacket + packetLength) >= PACKET_BUFFER + PACKET_FORMATTER_BUFFER_SIZE) {
+  if ((numPackets + 1) * packetLength > PACKET_FORMATTER_BUFFER_SIZE) {
     Serial.println(F("ERROR: packet buffer full!  Cannot buffer a new packet.  THIS IS A BUG!"));
     return;
   }
 
-  currentPacket = PACKET_BUFFER + (numPackets * packetLength);
+  currentPacket = packetBuffer + (numPackets * packetLength);
   numPackets++;
   initializePacket(currentPacket);
 }
 
 void PacketFormatter::format(uint8_t const* packet, char* buffer) {
-  for (int i = 0; i < packetLength; i++) {
+  for (size_t i = 0; i < packetLength; i++) {
     sprintf_P(buffer, "%02X ", packet[i]);
     buffer += 3;
   }
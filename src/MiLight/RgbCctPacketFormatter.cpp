@@ -63,7 +63,7 @@ void RgbCctPacketFormatter::enableNightMode() {
   command(RGB_CCT_ON | 0x80, arg);
 }
 
-BulbId RgbCctPacketFormatter::parsePacket(const uint8_t *packet, JsonObject& result, GroupStateStore* stateStore) {
+BulbId RgbCctPacketFormatter::decodePacket(const uint8_t *packet, ParsedPacket& result) {
   uint8_t packetCopy[V2_PACKET_LEN];
   memcpy(packetCopy, packet, V2_PACKET_LEN);
   V2RFEncoding::decodeV2Packet(packetCopy);
@@ -79,22 +79,28 @@ BulbId RgbCctPacketFormatter::parsePacket(const uint8_t *packet, JsonObject& res
 
   if (command == RGB_CCT_ON) {
     if ((packetCopy[V2_COMMAND_INDEX] & 0x80) == 0x80) {
-      result["command"] = "night_mode";
+      result.fields |= PARSED_COMMAND;
+      result.command = "night_mode";
     } else if (arg == RGB_CCT_MODE_SPEED_DOWN) {
-      result["command"] = "mode_speed_down";
+      result.fields |= PARSED_COMMAND;
+      result.command = "mode_speed_down";
     } else if (arg == RGB_CCT_MODE_SPEED_UP) {
-      result["command"] = "mode_speed_up";
+      result.fields |= PARSED_COMMAND;
+      result.command = "mode_speed_up";
     } else if (arg < 5) { // Group is not reliably encoded in group byte. Extract from arg byte
-      result["state"] = "ON";
+      result.fields |= PARSED_STATE;
+      result.state = ON;
       bulbId.groupId = arg;
     } else {
-      result["state"] = "OFF";
+      result.fields |= PARSED_STATE;
+      result.state = OFF;
       bulbId.groupId = arg-5;
     }
   } else if (command == RGB_CCT_COLOR) {
     uint8_t rescaledColor = (arg - RGB_CCT_COLOR_OFFSET) % 0x100;
     uint16_t hue = Units::rescale<uint16_t, uint16_t>(rescaledColor, 360, 255.0);
-    result["hue"] = hue;
+    result.fields |= PARSED_HUE;
+    result.hue = hue;
   } else if (command == RGB_CCT_KELVIN) {
     // Packet range is [0x94, 0x92, ..., 0xCC]. Remote sends values outside this
     // range, so normalize.
@@ -110,18 +116,23 @@ BulbId RgbCctPacketFormatter::parsePacket(const uint8_t *packet, JsonObject& res
     temperature = (100 - temperature);
     temperature = constrain(temperature, 0, 100);
 
-    result["color_temp"] = Units::whiteValToMireds(temperature, 100);
+    result.fields |= PARSED_COLOR_TEMP;
+    result.colorTemp = Units::whiteValToMireds(temperature, 100);
   // brightness == saturation
   } else if (command == RGB_CCT_BRIGHTNESS && arg >= (RGB_CCT_BRIGHTNESS_OFFSET - 15)) {
     uint8_t level = constrain(arg - RGB_CCT_BRIGHTNESS_OFFSET, 0, 100);
-    result["brightness"] = Units::rescale<uint8_t, uint8_t>(level, 255, 100);
+    result.fields |= PARSED_BRIGHTNESS;
+    result.brightness = Units::rescale<uint8_t, uint8_t>(level, 255, 100);
   } else if (command == RGB_CCT_SATURATION) {
-    result["saturation"] = constrain(arg - RGB_CCT_SATURATION_OFFSET, 0, 100);
+    result.fields |= PARSED_SATURATION;
+    result.saturation = constrain(arg - RGB_CCT_SATURATION_OFFSET, 0, 100);
   } else if (command == RGB_CCT_MODE) {
-    result["mode"] = arg;
+    result.fields |= PARSED_MODE;
+    result.mode = arg;
   } else {
-    result["button_id"] = command;
-    result["argument"] = arg;
+    result.fields |= PARSED_BUTTON;
+    result.buttonId = command;
+    result.argument = arg;
   }
 
   return bulbId;
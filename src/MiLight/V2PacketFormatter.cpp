@@ -55,9 +55,15 @@ void V2PacketFormatter::finalizePacket(uint8_t* packet) {
   V2RFEncoding::encodeV2Packet(packet);
 }
 
+void V2PacketFormatter::restampPacket(const uint8_t* decoded, uint8_t* packet) {
+  memcpy(packet, decoded, V2_PACKET_LEN);
+  packet[V2_SEQUENCE_INDEX] = sequenceNum++;
+  V2RFEncoding::encodeV2Packet(packet);
+}
+
 void V2PacketFormatter::format(uint8_t const* packet, char* buffer) {
   buffer += sprintf_P(buffer, PSTR("Raw packet: "));
-  for (int i = 0; i < packetLength; i++) {
+  for (size_t i = 0; i < packetLength; i++) {
     buffer += sprintf_P(buffer, PSTR("%02X "), packet[i]);
   }
 
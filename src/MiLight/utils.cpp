@@ -18,14 +18,3 @@ std::string RemoteToString(MiLightRemoteType remote) {
             return "unknown";
     }
 }
-
-bool ParsePacket(PacketFormatter &formatter, const uint8_t *packet, std::string *device_type, int *device_id, int *group_id, std::string *message) {
-    BulbId bulb;
-    JsonObject jobj = json::object();
-    bulb = formatter.parsePacket(packet, jobj, nullptr);
-    (*device_type) = RemoteToString(bulb.deviceType);
-    (*device_id) = bulb.deviceId;
-    (*group_id) = bulb.groupId;
-    (*message) = jobj.dump();
-    return true;
-}
@@ -0,0 +1,11 @@
+"""Helpers shared by the tests."""
+
+
+class FakeClock(object):
+    """A clock that only moves when a test sets now."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
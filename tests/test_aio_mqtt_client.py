@@ -0,0 +1,134 @@
+"""Test the asyncio mqtt client."""
+import asyncio
+import collections
+import socket
+import unittest
+from unittest import mock
+
+from pymilight.aio_mqtt_client import AsyncMqttClient, ThreadsafeQueueWriter
+
+
+CONFIG = {
+    "mqtt_topic_pattern": "milight/:device_id/:device_type/:group_id",
+    "mqtt_update_topic_pattern": "milight/updates/:device_id/:device_type/:group_id",
+    "mqtt_state_topic_pattern": "",
+    "mqtt_host": "localhost",
+    "mqtt_port": 1883,
+}
+
+Message = collections.namedtuple("Message", ["topic", "payload"])
+
+
+@mock.patch("pymilight.aio_mqtt_client.mqtt.Client")
+class AsyncMqttClientTestCase(unittest.TestCase):
+    def test_commands_queued(self, client):
+        async def run():
+            mqtt_client = AsyncMqttClient(CONFIG)
+            mqtt_client.message_callback(None, None, Message("milight/0x10/rgb_cct/2", b'{"state": "ON"}'))
+            return await asyncio.wait_for(mqtt_client.commands.get(), 1)
+
+        self.assertEqual(("rgb_cct", 0x10, 2, {"state": "ON"}), asyncio.run(run()))
+
+    def test_publish_awaitable(self, client):
+        client.return_value.publish.return_value = mock.Mock(rc=0, mid=7)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            mqtt_client = AsyncMqttClient(CONFIG)
+            publish = loop.create_task(mqtt_client.send_update("rgb_cct", 0x10, 2, "{}"))
+            await asyncio.sleep(0)
+            self.assertFalse(publish.done())
+
+            mqtt_client.publish_callback(None, None, 7)
+            await asyncio.wait_for(publish, 1)
+
+            # Already sent by the time publish gets to wait for it.
+            client.return_value.publish.return_value = mock.Mock(rc=0, mid=8)
+            mqtt_client.publish_callback(None, None, 8)
+            await asyncio.wait_for(mqtt_client.send_update("rgb_cct", 0x10, 2, "{}"), 1)
+
+            # No state topic configured.
+            await asyncio.wait_for(mqtt_client.send_state("rgb_cct", 0x10, 2, "{}"), 1)
+
+        asyncio.run(run())
+        client.return_value.publish.assert_called_with("milight/updates/0x10/rgb_cct/2", "{}", retain=False)
+        self.assertEqual(2, client.return_value.publish.call_count)
+
+    def test_publish_pending_on_disconnect(self, client):
+        client.return_value.publish.return_value = mock.Mock(rc=0, mid=7)
+        sock, peer = socket.socketpair()
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            mqtt_client = AsyncMqttClient(CONFIG)
+            mqtt_client.socket_open_callback(client.return_value, None, sock)
+            publish = loop.create_task(mqtt_client.send_update("rgb_cct", 0x10, 2, "{}"))
+            await asyncio.sleep(0)
+            self.assertFalse(publish.done())
+
+            # paho drops the message without calling on_publish.
+            mqtt_client.socket_close_callback(client.return_value, None, sock)
+            await asyncio.wait_for(publish, 1)
+            self.assertEqual({}, mqtt_client._published)
+
+        try:
+            asyncio.run(run())
+        finally:
+            sock.close()
+            peer.close()
+
+    def test_threadsafe_writer(self, client):
+        async def run():
+            states = asyncio.Queue()
+            writer = ThreadsafeQueueWriter(asyncio.get_running_loop(), states)
+            await asyncio.get_running_loop().run_in_executor(None, writer.put, "state")
+            return await asyncio.wait_for(states.get(), 1)
+
+        self.assertEqual("state", asyncio.run(run()))
+
+    def test_reconnect(self, client):
+        paho = client.return_value
+        paho.loop_misc.return_value = 0
+        sockets = []
+
+        def reconnect():
+            # Connecting happens in the executor, not on the event loop.
+            sock, peer = socket.socketpair()
+            sockets.extend((sock, peer))
+            mqtt_client.socket_open_callback(paho, None, sock)
+            mqtt_client.socket_register_write_callback(paho, None, sock)
+
+        async def wait_for(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.005)
+            self.fail("Timed out")
+
+        async def run():
+            nonlocal mqtt_client
+            mqtt_client = AsyncMqttClient(CONFIG)
+            mqtt_client.reconnect_min_delay = 0.01
+            paho.reconnect.side_effect = reconnect
+            await mqtt_client.connect()
+            paho.connect_async.assert_called_with("localhost", 1883, 60)
+            await wait_for(lambda: mqtt_client._misc_task is not None)
+
+            # The broker goes away and refuses the first reconnect.
+            paho.reconnect.side_effect = [ConnectionRefusedError(), None]
+            sock = sockets[0]
+            mqtt_client.socket_unregister_write_callback(paho, None, sock)
+            mqtt_client.socket_close_callback(paho, None, sock)
+            sock.close()
+            self.assertIsNone(mqtt_client._misc_task)
+            await wait_for(lambda: paho.reconnect.call_count == 3)
+            self.assertEqual(2, mqtt_client.reconnects)
+
+            mqtt_client.disconnect()
+            self.assertTrue(paho.disconnect.called)
+            self.assertIsNone(mqtt_client._reconnect_task)
+
+        mqtt_client = None
+        asyncio.run(run())
+        for sock in sockets:
+            sock.close()
@@ -0,0 +1,83 @@
+import queue
+import threading
+import unittest
+
+from pymilight import metrics
+from pymilight.airtime import AirtimeBudget
+from pymilight.milight_control import MiLightController
+from pymilight.radio import SimulatedRF24
+
+from conftest import FakeClock
+
+
+class AirtimeBudgetTestCase(unittest.TestCase):
+    def test_full_repeats_within_burst(self):
+        budget = AirtimeBudget(rate=1000, burst=90, clock=FakeClock())
+
+        self.assertEqual([10, 10, 10], [budget.admit(10, 3, 3) for _ in range(3)])
+        self.assertEqual(0, budget.available())
+
+    def test_minimum_floor(self):
+        budget = AirtimeBudget(rate=1000, burst=60, clock=FakeClock())
+
+        granted = [budget.admit(10, 3, 3) for _ in range(4)]
+
+        self.assertEqual([10, 10, 3, 3], granted)
+        self.assertEqual(14, budget.throttled)
+        # Overdrawn by the minimum, so later packets wait for a refill.
+        self.assertEqual(-18, budget.available())
+        # Never more than asked for.
+        self.assertEqual(1, budget.admit(1, 3, 3))
+
+    def test_refill(self):
+        clock = FakeClock()
+        budget = AirtimeBudget(rate=1000, burst=60, clock=clock)
+        budget.admit(20, 3, 3)
+        budget.admit(20, 3, 3)
+
+        clock.now = 0.015
+        self.assertEqual(6, budget.available())
+        self.assertEqual(3, budget.admit(10, 3, 3))
+
+        clock.now = 10
+        self.assertEqual(60, budget.available())
+        self.assertEqual(10, budget.admit(10, 3, 3))
+
+    def test_backlog(self):
+        budget = AirtimeBudget(rate=1000, burst=90, clock=FakeClock())
+
+        # Frames still queued leave less room than the bucket thinks.
+        self.assertEqual(5, budget.admit(10, 3, 3, backlog=75))
+        self.assertEqual(3, budget.admit(10, 3, 3, backlog=90))
+        self.assertEqual(10, budget.admit(10, 3, 3, backlog=0))
+
+    def test_controller_repeats(self):
+        controller = MiLightController(queue.Queue(), queue.Queue(), threading.Event(), False, rf=SimulatedRF24())
+        controller.begin()
+        clock = FakeClock()
+        module = controller.modules[0]
+        module.airtime = AirtimeBudget(rate=1000, burst=90, clock=clock)
+        before = metrics.REGISTRY.collect()
+
+        for device_id in range(4):
+            controller.process_command(("rgb_cct", device_id, 1, {"state": "ON"}))
+
+        # Everything is still queued for the radio thread.
+        module.process_requests()
+        self.assertEqual(10 + 10 + 10 + 3, module.scheduler.queued_repeats)
+        self.assertEqual(controller.packet_repeat_minimum, controller.current_resend_count)
+
+        controller.flush()
+        self.assertEqual(0, module.scheduler.queued_repeats)
+        clock.now = 1
+        controller.process_command(("rgb_cct", 5, 1, {"state": "ON"}))
+        self.assertEqual(controller.base_resend_count, controller.current_resend_count)
+
+        after = metrics.REGISTRY.collect()
+        self.assertEqual(
+            7, after["pymilight_airtime_repeats_throttled_total"] - before["pymilight_airtime_repeats_throttled_total"]
+        )
+        self.assertEqual(5, after["pymilight_airtime_repeats_count"] - before["pymilight_airtime_repeats_count"])
+        self.assertEqual(
+            3 * 43, after["pymilight_airtime_frames_total"] - before["pymilight_airtime_frames_total"]
+        )
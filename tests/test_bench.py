@@ -0,0 +1,32 @@
+import unittest
+
+from pymilight import bench
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_run(self):
+        args = bench.get_parser().parse_args([
+            "--devices", "2",
+            "--groups", "2",
+            "--rate", "200",
+            "--duration", "0.25",
+            "--virtual-airtime",
+        ])
+        result = bench.run(args)
+
+        self.assertEqual(50, result["messages_sent"])
+        self.assertEqual(50, result["messages_completed"])
+        self.assertEqual(0, result["backlog"])
+        self.assertGreater(result["frames"], 0)
+        self.assertLessEqual(result["latency"]["p50"], result["latency"]["p99"])
+        for name in bench.QUEUES:
+            depth = result["queue_depth"][name]
+            self.assertLessEqual(depth["mean"], depth["max"])
+        # Every sample has a time and one depth per queue.
+        self.assertTrue(all(len(sample) == 1 + len(bench.QUEUES) for sample in result["queue_depth"]["samples"]))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, bench.percentile(values, 50))
+        self.assertEqual(99, bench.percentile(values, 99))
+        self.assertIsNone(bench.percentile([], 50))
@@ -0,0 +1,125 @@
+import contextlib
+import io
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pymilight import capture
+from pymilight.milight_control import MiLightController, create_modules
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+
+
+COMMANDS = [
+    (0x1234, 1, "update_hue", (120,)),
+    (0x1234, 2, "update_status", (True,)),
+    (0x5678, 1, "enable_night_mode", ()),
+    (0x1234, 1, "update_brightness", (50,)),
+    (0x5678, 3, "command", (0x7F, 0x12)),
+]
+
+
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "capture.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_capture(self):
+        formatter = PyRgbCctPacketFormatter()
+        packets = []
+        with capture.CaptureWriter(self.path, clock=lambda: 10.5) as writer:
+            for device_id, group_id, op, args in COMMANDS:
+                formatter.prepare(device_id, group_id)
+                packet = getattr(formatter, op)(*args)
+                writer.write(39, packet)
+                packets.append(bytes(packet))
+        return packets
+
+    def test_columns(self):
+        packets = self.write_capture()
+
+        with capture.Capture(self.path) as captured:
+            self.assertEqual(len(COMMANDS), len(captured))
+            columns = captured.columns()
+            self.assertEqual([10.5] * len(COMMANDS), list(columns["timestamp"]))
+            self.assertEqual([39] * len(COMMANDS), list(columns["channel"]))
+            self.assertEqual([0x1234, 0x1234, 0x5678, 0x1234, 0x5678], list(columns["device_id"]))
+            self.assertEqual(packets[2], captured.raw(2))
+
+            # Row for row the same as parse().
+            formatter = PyRgbCctPacketFormatter()
+            for row, packet in enumerate(captured.packets(chunk=2)):
+                self.assertEqual(formatter.parse(packets[row]), packet[2:6])
+
+    def test_filters(self):
+        self.write_capture()
+
+        with capture.Capture(self.path) as captured:
+            columns = captured.columns()
+            self.assertEqual([0, 1, 3], capture.select(columns, device_id=0x1234))
+            self.assertEqual([0, 3], capture.select(columns, device_id=0x1234, group_id=1))
+            self.assertEqual([0], capture.select(columns, command="hue"))
+            self.assertEqual([2], capture.select(columns, command="night_mode"))
+            self.assertEqual([4], capture.select(columns, command="button_id"))
+            with self.assertRaises(ValueError):
+                capture.select(columns, command="explode")
+
+    def test_append_and_truncated_record(self):
+        self.write_capture()
+        self.write_capture()
+        with open(self.path, "ab") as fobj:
+            fobj.write(b"\x01\x02\x03")
+
+        with capture.Capture(self.path) as captured:
+            self.assertEqual(2 * len(COMMANDS), len(captured))
+
+        # Writing again drops the partial record rather than appending after it.
+        packets = self.write_capture()
+        with capture.Capture(self.path) as captured:
+            self.assertEqual(3 * len(COMMANDS), len(captured))
+            columns = captured.columns()
+            self.assertEqual([39] * len(captured), list(columns["channel"]))
+            self.assertEqual([0x1234, 0x1234, 0x5678, 0x1234, 0x5678] * 3, list(columns["device_id"]))
+            self.assertEqual(packets[-1], captured.raw(len(captured) - 1))
+
+    def test_not_a_capture(self):
+        with open(self.path, "wb") as fobj:
+            fobj.write(b"nope" * 10)
+        with self.assertRaises(ValueError):
+            capture.Capture(self.path)
+
+    def test_main(self):
+        self.write_capture()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            capture.main([self.path, "--device-id", "0x5678", "--command", "night_mode"])
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(1, len(lines))
+        self.assertIn("0x5678 1", lines[0])
+        self.assertIn("command=night_mode", lines[0])
+
+    def test_receive_to_capture(self):
+        modules = create_modules({
+            "radios": [{"backend": "simulator"}],
+            "capture_file": self.path,
+        })
+        modules[0].rf.loopback = True
+        controller = MiLightController(queue.Queue(), queue.Queue(), threading.Event(), False, modules=modules)
+        controller.begin()
+        modules[0].on_packet = lambda device_type, parsed: None
+
+        controller.process_command(("rgb_cct", 0x1234, 2, {"state": "ON"}))
+        controller.flush()
+        modules[0].receive()
+        modules[0].capture.close()
+
+        with capture.Capture(self.path) as captured:
+            packets = list(captured.packets())
+        self.assertTrue(packets)
+        self.assertEqual((0x1234, 2, {"state": "ON"}), packets[0][3:6])
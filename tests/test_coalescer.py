@@ -0,0 +1,110 @@
+import unittest
+
+from pymilight.coalescer import CommandCoalescer
+
+
+class CommandCoalescerTestCase(unittest.TestCase):
+    def coalesce(self, *commands):
+        coalescer = CommandCoalescer()
+        for command in commands:
+            coalescer.add(command)
+        return coalescer.drain()
+
+    def test_last_writer_wins(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 10}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 20, "hue": 30}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 40}),
+        )
+        self.assertEqual([
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 40, "hue": 30}),
+        ], result)
+
+    def test_bulbs_kept_apart(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 10}),
+            ("rgb_cct", 1, 2, {"state": "ON", "brightness": 20}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 30}),
+        )
+        self.assertEqual([
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 30}),
+            ("rgb_cct", 1, 2, {"state": "ON", "brightness": 20}),
+        ], result)
+
+    def test_on_off_order_kept(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 10}),
+            ("rgb_cct", 1, 1, {"state": "OFF"}),
+            ("rgb_cct", 1, 1, {"state": "OFF"}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 30}),
+        )
+        self.assertEqual([
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 10}),
+            ("rgb_cct", 1, 1, {"state": "OFF"}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 30}),
+        ], result)
+
+    def test_ordered_commands_not_merged(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"command": "level_up"}),
+            ("rgb_cct", 1, 1, {"command": "level_up"}),
+        )
+        self.assertEqual(2, len(result))
+
+    def test_mode_replaced(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"state": "ON", "hue": 10, "saturation": 50}),
+            ("rgb_cct", 1, 1, {"state": "ON", "color_temp": 200}),
+            ("rgb_cct", 1, 1, {"state": "ON", "level": 10}),
+            ("rgb_cct", 1, 1, {"state": "ON", "brightness": 50}),
+        )
+        self.assertEqual([
+            ("rgb_cct", 1, 1, {"state": "ON", "color_temp": 200, "brightness": 50}),
+        ], result)
+
+    def test_color_then_hue(self):
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"state": "ON", "hue": 10}),
+            ("rgb_cct", 1, 1, {"state": "ON", "color": {"r": 255, "g": 0, "b": 0}}),
+            ("rgb_cct", 1, 1, {"state": "ON", "hue": 20}),
+        )
+        self.assertEqual([
+            ("rgb_cct", 1, 1, {"state": "ON", "color": {"r": 255, "g": 0, "b": 0}}),
+            ("rgb_cct", 1, 1, {"state": "ON", "hue": 20}),
+        ], result)
+
+    def test_effect_after_brightness(self):
+        night_mode = ("rgb_cct", 1, 1, {"effect": "night_mode"})
+        result = self.coalesce(("rgb_cct", 1, 1, {"brightness": 50}), night_mode)
+        self.assertEqual([("rgb_cct", 1, 1, {"brightness": 50}), night_mode], result)
+
+        result = self.coalesce(("rgb_cct", 1, 1, {"level": 50}), night_mode)
+        self.assertEqual(2, len(result))
+
+        # Brightness after an effect is sent after it either way.
+        result = self.coalesce(night_mode, ("rgb_cct", 1, 1, {"brightness": 50}))
+        self.assertEqual([("rgb_cct", 1, 1, {"effect": "night_mode", "brightness": 50})], result)
+
+    def test_transition_kept_apart(self):
+        fade = ("rgb_cct", 1, 1, {"brightness": 255, "transition": 10})
+        result = self.coalesce(fade, ("rgb_cct", 1, 1, {"hue": 100}))
+        self.assertEqual([fade, ("rgb_cct", 1, 1, {"hue": 100})], result)
+
+        fade = ("rgb_cct", 1, 1, {"hue": 100, "transition": 5})
+        result = self.coalesce(("rgb_cct", 1, 1, {"brightness": 50}), fade)
+        self.assertEqual([("rgb_cct", 1, 1, {"brightness": 50}), fade], result)
+
+        # The same fade time still merges.
+        result = self.coalesce(
+            ("rgb_cct", 1, 1, {"brightness": 50, "transition": 5}),
+            ("rgb_cct", 1, 1, {"hue": 100, "transition": 5}),
+        )
+        self.assertEqual([("rgb_cct", 1, 1, {"brightness": 50, "hue": 100, "transition": 5})], result)
+
+    def test_drain_resets(self):
+        coalescer = CommandCoalescer()
+        coalescer.add(("rgb_cct", 1, 1, {"state": "ON"}))
+        self.assertEqual(1, len(coalescer))
+        coalescer.drain()
+        self.assertEqual(0, len(coalescer))
+        self.assertEqual([], coalescer.drain())
@@ -0,0 +1,131 @@
+import asyncio
+import queue
+import threading
+import unittest
+import urllib.request
+
+from pymilight import metrics
+from pymilight.aio_mqtt_client import ThreadsafeQueueWriter
+from pymilight.milight_control import MiLightController
+from pymilight.radio import SimulatedRF24
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter_gauge(self):
+        registry = metrics.Registry()
+        counter = registry.counter("frames_total", "Frames")
+        counter.inc()
+        counter.inc(2)
+        self.assertIs(counter, registry.counter("frames_total", "Frames"))
+
+        gauge = registry.gauge("depth", "Depth", {"module": "radio0"})
+        gauge.set(5)
+        gauge.dec()
+        registry.gauge("size", "Size", function=lambda: 7)
+
+        self.assertEqual({
+            "depth{module=\"radio0\"}": 4,
+            "frames_total": 3,
+            "size": 7,
+        }, registry.collect())
+
+        with self.assertRaises(ValueError):
+            registry.gauge("frames_total", "Frames")
+
+    def test_histogram(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+
+        self.assertEqual(
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            "latency_seconds_bucket{le=\"0.1\"} 2\n"
+            "latency_seconds_bucket{le=\"1\"} 3\n"
+            "latency_seconds_bucket{le=\"+Inf\"} 4\n"
+            "latency_seconds_sum 2.65\n"
+            "latency_seconds_count 4\n",
+            registry.render()
+        )
+
+    def test_failing_function(self):
+        registry = metrics.Registry()
+        registry.gauge("broken", "Broken", function=lambda: 1 / 0)
+        registry.counter("working", "Working").inc()
+        self.assertEqual("# HELP working Working\n# TYPE working counter\nworking 1\n", registry.render())
+
+    def test_register(self):
+        registry = metrics.Registry()
+        first = registry.register(metrics.Gauge("depth", "Depth", {"module": "radio0"}, lambda: 1))
+        second = registry.register(metrics.Gauge("depth", "Depth", {"module": "radio0"}, lambda: 2))
+        self.assertEqual({"depth{module=\"radio0\"}": 2}, registry.collect())
+
+        # Already replaced, so the second stays.
+        registry.unregister(first)
+        self.assertEqual({"depth{module=\"radio0\"}": 2}, registry.collect())
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter("depth", "Depth", {"module": "radio0"}))
+
+        registry.unregister(second)
+        self.assertEqual({}, registry.collect())
+
+    def test_http_server(self):
+        registry = metrics.Registry()
+        registry.counter("requests_total", "Requests").inc()
+        server = metrics.start_http_server(0, registry=registry)
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_port
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("requests_total 1\n", body)
+
+    def test_controller_metrics(self):
+        inbound = queue.Queue()
+        controller = MiLightController(inbound, queue.Queue(), threading.Event(), False, rf=SimulatedRF24())
+        controller.begin()
+        before = metrics.REGISTRY.collect()
+
+        inbound.put(None)
+        controller.process_command(("rgb_cct", 0x1234, 2, {"state": "ON"}))
+        controller.flush()
+
+        after = metrics.REGISTRY.collect()
+        self.assertEqual(1, after["pymilight_inbound_queue_depth"])
+        self.assertEqual(1, after["pymilight_outbound_queue_depth"])
+        self.assertEqual(1, after["pymilight_commands_total"] - before["pymilight_commands_total"])
+        self.assertEqual(
+            1, after["pymilight_command_latency_seconds_count"] - before["pymilight_command_latency_seconds_count"]
+        )
+        self.assertEqual(controller.current_resend_count, after["pymilight_resend_count"])
+        self.assertEqual(
+            3 * controller.current_resend_count,
+            after["pymilight_tx_frames_total"] - before["pymilight_tx_frames_total"]
+        )
+
+    def test_controller_metrics_removed_by_stop(self):
+        controller = MiLightController(queue.Queue(), queue.Queue(), threading.Event(), False, rf=SimulatedRF24())
+        self.assertIn("pymilight_transitions_active", metrics.REGISTRY.collect())
+
+        controller.stop()
+        controller.modules[0].stop()
+        collected = metrics.REGISTRY.collect()
+        self.assertNotIn("pymilight_transitions_active", collected)
+        self.assertNotIn("pymilight_tx_queued_packets{module=\"radio0\"}", collected)
+
+    def test_asyncio_outbound_queue_depth(self):
+        async def run():
+            outbound = asyncio.Queue()
+            controller = MiLightController(
+                queue.Queue(), ThreadsafeQueueWriter(asyncio.get_running_loop(), outbound),
+                threading.Event(), False, rf=SimulatedRF24()
+            )
+            outbound.put_nowait("state")
+            depth = metrics.REGISTRY.collect()["pymilight_outbound_queue_depth"]
+            controller.stop()
+            return depth
+
+        self.assertEqual(1, asyncio.run(run()))
@@ -1,6 +1,9 @@
+import queue
+import threading
 import unittest
+import unittest.mock
 
-from pymilight.milight_control import MiLightController
+from pymilight.milight_control import MiLightController, create_modules
 from pymilight.packet_formatter import PyRgbCctPacketFormatter
 
 
@@ -59,4 +62,51 @@ class MiLightControllerTestCase(unittest.TestCase):
                 "00dbe1216494bb667e",
                 "00dbe12162cfb866b4",
             ]
-        )
\ No newline at end of file
+        )
+
+class RunLoopTestCase(unittest.TestCase):
+    def setUp(self):
+        self.inbound = queue.Queue()
+        self.outbound = queue.Queue()
+        self.modules = create_modules({"radio_backend": "simulator"})
+        self.controller = MiLightController(
+            self.inbound, self.outbound, threading.Event(), False, modules=self.modules
+        )
+        self.receive = self.modules[0].receive = unittest.mock.Mock()
+        self.controller.start()
+
+    def tearDown(self):
+        self.controller.stop()
+        self.controller.join(1)
+
+    def wait_until(self, condition):
+        deadline = threading.Event()
+        for _ in range(200):
+            if condition():
+                return
+            deadline.wait(0.005)
+        self.fail("Timed out")
+
+    def test_command(self):
+        self.inbound.put(("rgb_cct", 0x1234, 2, {"state": "ON"}))
+        self.inbound.join()
+        self.wait_until(lambda: not self.controller.busy())
+
+        self.assertEqual(("rgb_cct", 0x1234, 2), self.outbound.get(timeout=1)[:3])
+        self.assertEqual(3 * self.controller.current_resend_count, len(self.modules[0].rf.frames))
+
+    def test_idle_until_notified(self):
+        self.wait_until(lambda: self.receive.called)
+        # Listening started, then nothing to do until a frame arrives.
+        threading.Event().wait(0.1)
+        self.assertEqual(1, self.receive.call_count)
+
+        self.controller.notify_radio()
+        self.wait_until(lambda: self.receive.call_count == 2)
+
+    def test_stop(self):
+        self.controller.stop()
+        self.controller.join(1)
+
+        self.assertFalse(self.controller.is_alive())
+        self.assertFalse(self.modules[0].is_alive())
@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+from pymilight.radio import MiLightRadioConfig, NRF24MiLightRadio, SimulatedRF24
+from pymilight.radio.nrf24_milight_radio import DuplicateFilter
+
+from conftest import FakeClock
+
+
+class NRF24MiLightRadioTestCase(unittest.TestCase):
+    def test_write_view(self):
+        rf = mock.MagicMock()
+        radio = NRF24MiLightRadio(rf, MiLightRadioConfig.CONFIG_RGB_CCT)
+
+        formatter = PyRgbCctPacketFormatter()
+        formatter.zero_copy = True
+        formatter.prepare(0x02, 1)
+        packet = formatter.update_status(True)
+
+        self.assertEqual(9, radio.write(packet))
+        self.assertEqual(3, rf.write.call_count)
+        self.assertEqual(
+            [8, 39, 70],
+            [call[0][0] - 2 for call in rf.setChannel.call_args_list][-3:]
+        )
+        self.assertEqual(bytes([9]) + bytes(packet), bytes(radio._out_view[:radio._out_length]))
+
+    def build_receiver(self):
+        rf = SimulatedRF24(loopback=True)
+        radio = NRF24MiLightRadio(rf, MiLightRadioConfig.CONFIG_RGB_CCT)
+        clock = FakeClock()
+        radio.clock = clock
+        radio.begin()
+        return radio, clock
+
+    def receive_all(self, radio, clock):
+        received = []
+        for _ in range(len(MiLightRadioConfig.CONFIG_RGB_CCT.channels)):
+            while radio.available():
+                received.append(bytes(radio.read(9)))
+            clock.now += radio.channel_dwell
+        return received
+
+    def test_hops_channels(self):
+        radio, clock = self.build_receiver()
+        formatter = PyRgbCctPacketFormatter()
+        formatter.prepare(0x02, 1)
+        packet = formatter.update_status(True)
+        radio.write(packet)
+
+        self.assertEqual([bytes(packet)], self.receive_all(radio, clock))
+        stats = radio.channel_stats()
+        self.assertEqual([8, 39, 70], [stat.channel for stat in stats])
+        self.assertEqual([1, 0, 0], [stat.packets for stat in stats])
+        self.assertEqual([0, 1, 1], [stat.duplicates for stat in stats])
+        self.assertAlmostEqual(radio.channel_dwell, stats[0].listened)
+        self.assertAlmostEqual(1 / radio.channel_dwell, stats[0].hit_rate)
+
+    def test_interleaved_remotes(self):
+        radio, clock = self.build_receiver()
+        first = PyRgbCctPacketFormatter()
+        first.prepare(0x02, 1)
+        second = PyRgbCctPacketFormatter()
+        second.prepare(0x03, 1)
+        first_packet = bytes(first.update_status(True))
+        second_packet = bytes(second.update_status(True))
+
+        for packet in (first_packet, second_packet, first_packet, second_packet):
+            radio.write(packet)
+
+        self.assertEqual([first_packet, second_packet], self.receive_all(radio, clock))
+
+
+class DuplicateFilterTestCase(unittest.TestCase):
+    def test_window(self):
+        duplicates = DuplicateFilter(window=1.0)
+        self.assertFalse(duplicates.seen(1, 0.0))
+        self.assertTrue(duplicates.seen(1, 0.5))
+        # Seeing it again restarted the window.
+        self.assertTrue(duplicates.seen(1, 1.4))
+        self.assertFalse(duplicates.seen(1, 2.5))
+
+    def test_maxsize(self):
+        duplicates = DuplicateFilter(window=10, maxsize=2)
+        for packet_id in (1, 2, 3):
+            self.assertFalse(duplicates.seen(packet_id, 0))
+        self.assertEqual(2, len(duplicates))
+        self.assertFalse(duplicates.seen(1, 0))
+        self.assertTrue(duplicates.seen(3, 0))
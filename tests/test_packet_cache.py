@@ -0,0 +1,50 @@
+import unittest
+
+from pymilight.packet_cache import PacketTemplateCache
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+
+
+class PacketTemplateCacheTestCase(unittest.TestCase):
+    def build(self, formatter, cache, op, *args):
+        formatter.prepare(0x1234, 2)
+        return cache.get(formatter, ("rgb_cct", 0x1234, 2, op) + args, getattr(formatter, op), *args)
+
+    def test_matches_uncached(self):
+        commands = [
+            ("update_status", True),
+            ("update_brightness", 40),
+            ("update_hue", 100),
+            ("update_brightness", 40),
+            ("update_status", True),
+            ("pair",),
+            ("update_hue", 100),
+        ] * 3
+
+        cached = PyRgbCctPacketFormatter()
+        cache = PacketTemplateCache()
+        uncached = PyRgbCctPacketFormatter()
+        for command in commands:
+            uncached.prepare(0x1234, 2)
+            expected = getattr(uncached, command[0])(*command[1:])
+            packet = self.build(cached, cache, *command)
+            self.assertEqual(expected.hex(), packet.hex())
+
+        # pair builds five packets so is never cached.
+        self.assertEqual((15, 6, 1024, 3), cache.cache_info())
+
+    def test_lru_eviction(self):
+        formatter = PyRgbCctPacketFormatter()
+        cache = PacketTemplateCache(maxsize=2)
+        self.build(formatter, cache, "update_hue", 1)
+        self.build(formatter, cache, "update_hue", 2)
+        self.build(formatter, cache, "update_hue", 1)
+        self.build(formatter, cache, "update_hue", 3)
+        self.assertEqual(2, len(cache))
+
+        # 2 was least recently used when 3 was added.
+        self.build(formatter, cache, "update_hue", 1)
+        self.build(formatter, cache, "update_hue", 2)
+        self.assertEqual((2, 4), (cache.hits, cache.misses))
+
+        cache.clear()
+        self.assertEqual((0, 0, 2, 0), cache.cache_info())
@@ -0,0 +1,111 @@
+import threading
+import unittest
+
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+
+
+class PacketFormatterTestCase(unittest.TestCase):
+    def test_build_batch(self):
+        commands = [
+            (0x02, 1, "update_status", True),
+            (0x02, 1, "update_hue", 200),
+            (0x1234, 3, "update_brightness", 50),
+            (0x1234, 3, "pair", None),
+            (0x1234, 2, "command", (0x01, 0x0A)),
+        ]
+        formatter = PyRgbCctPacketFormatter()
+        buffer, offsets = PyRgbCctPacketFormatter().build_batch(commands)
+
+        expected = bytearray()
+        for device_id, group_id, op, arg in commands:
+            formatter.prepare(device_id, group_id)
+            if arg is None:
+                expected += getattr(formatter, op)()
+            elif isinstance(arg, tuple):
+                expected += getattr(formatter, op)(*arg)
+            else:
+                expected += getattr(formatter, op)(arg)
+
+        self.assertEqual(expected.hex(), buffer.hex())
+        self.assertEqual([0, 9, 18, 27, 36, 45, 54, 63, 72], offsets)
+
+    def test_build_batch_empty(self):
+        buffer, offsets = PyRgbCctPacketFormatter().build_batch([])
+        self.assertEqual(bytearray(), buffer)
+        self.assertEqual([], offsets)
+
+    def test_build_batch_unknown_op(self):
+        with self.assertRaises(KeyError):
+            PyRgbCctPacketFormatter().build_batch([(0x02, 1, "explode", None)])
+
+    def test_data_view(self):
+        formatter = PyRgbCctPacketFormatter()
+        formatter.prepare(0x02, 1)
+        formatter.update_status(True)
+        formatter.prepare(0x02, 1)
+        expected = formatter.update_status(True)
+
+        formatter = PyRgbCctPacketFormatter()
+        formatter.zero_copy = True
+        formatter.prepare(0x02, 1)
+        formatter.update_status(True)
+        formatter.prepare(0x02, 1)
+        view = formatter.update_status(True)
+
+        self.assertIsInstance(view, memoryview)
+        self.assertTrue(view.readonly)
+        self.assertEqual(expected.hex(), view.hex())
+        with self.assertRaises(TypeError):
+            view[0] = 1
+
+    def test_parse(self):
+        formatter = PyRgbCctPacketFormatter()
+        cases = [
+            ("update_status", (True,), 2, {"state": "ON"}),
+            ("update_status", (False,), 2, {"state": "OFF"}),
+            ("enable_night_mode", (), 2, {"command": "night_mode"}),
+            ("update_hue", (120,), 2, {"hue": 120}),
+            ("update_brightness", (100,), 2, {"brightness": 255}),
+            ("update_saturation", (40,), 2, {"saturation": 40}),
+            ("update_temperature", (100,), 2, {"color_temp": 370}),
+            ("update_mode", (3,), 2, {"mode": 3}),
+            ("command", (0x7F, 0x12), 2, {"button_id": 0x7F, "argument": 0x12}),
+        ]
+        for op, args, group_id, expected in cases:
+            formatter.prepare(0x1234, group_id)
+            packet = getattr(formatter, op)(*args)
+            self.assertEqual(("rgb_cct", 0x1234, group_id, expected), formatter.parse(packet), op)
+
+    def test_parse_short_packet(self):
+        with self.assertRaises(ValueError):
+            PyRgbCctPacketFormatter().parse(bytes(4))
+
+    def test_concurrent_build_batch(self):
+        # Each thread formats for its own bulbs with its own formatter while
+        # the others do the same, the GIL is released while building.
+        def commands(thread):
+            return [
+                (0x1000 + thread, index % 4 + 1, op, arg)
+                for index in range(64)
+                for op, arg in (("update_hue", thread * 40), ("update_brightness", 50),
+                                ("update_status", True), ("pair", None))
+            ]
+
+        def build(thread, results):
+            formatter = PyRgbCctPacketFormatter()
+            for _ in range(100):
+                results.append(formatter.build_batch(commands(thread))[0])
+
+        expected = []
+        for thread in range(8):
+            expected.append([])
+            build(thread, expected[-1])
+
+        results = [[] for _ in range(8)]
+        threads = [threading.Thread(target=build, args=(thread, results[thread])) for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(expected, results)
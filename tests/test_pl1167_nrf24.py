@@ -0,0 +1,174 @@
+import importlib
+import random
+import sys
+import types
+import unittest
+from unittest import mock
+
+from pymilight.radio import SimulatedRF24, pl1167_nrf24
+
+
+def reference_crc(data):
+    state = 0
+    for cur_byte in data:
+        for _ in range(8):
+            if (cur_byte ^ state) & 0x01:
+                state = (state >> 1) ^ pl1167_nrf24.CRC_POLY
+            else:
+                state = state >> 1
+            cur_byte = cur_byte >> 1
+    return state
+
+
+def reference_reverse(data):
+    result = 0
+    for _ in range(8):
+        result <<= 1
+        result |= data & 1
+        data >>= 1
+    return result
+
+
+class FrameHelpersMixin(object):
+    def setUp(self):
+        self.random = random.Random(42)
+        self.packets = [
+            bytes(self.random.randrange(256) for _ in range(self.random.randrange(1, 12)))
+            for _ in range(200)
+        ]
+
+    def test_calc_crc(self):
+        for packet in self.packets:
+            self.assertEqual(reference_crc(packet), self.module.calc_crc(packet))
+        self.assertEqual(0, self.module.calc_crc(b""))
+
+    def test_encode_frame(self):
+        out = bytearray(pl1167_nrf24.MAX_FRAME_LENGTH)
+        for packet in self.packets:
+            crc = reference_crc(packet)
+            expected = bytes(reference_reverse(value) for value in packet) + bytes([
+                reference_reverse(crc & 0xFF),
+                reference_reverse(crc >> 8),
+            ])
+            length = self.module.encode_frame(packet, True, out)
+            self.assertEqual(expected, out[:length])
+
+            length = self.module.encode_frame(memoryview(bytearray(packet)), False, out)
+            self.assertEqual(expected[:-2], out[:length])
+
+    def test_decode_frame(self):
+        frame = bytearray(pl1167_nrf24.MAX_FRAME_LENGTH)
+        out = bytearray(pl1167_nrf24.MAX_FRAME_LENGTH)
+        for packet in self.packets:
+            length = self.module.encode_frame(packet, True, frame)
+            self.assertEqual(len(packet), self.module.decode_frame(bytes(frame[:length]), True, out))
+            self.assertEqual(packet, out[:len(packet)])
+
+            frame[0] ^= 0x01
+            self.assertEqual(-1, self.module.decode_frame(bytes(frame[:length]), True, out))
+
+        self.assertEqual(-1, self.module.decode_frame(b"\x01", True, out))
+
+    def test_frame_too_long(self):
+        with self.assertRaises(ValueError):
+            self.module.encode_frame(bytes(31), True, bytearray(32))
+
+
+class FrameHelpersTestCase(FrameHelpersMixin, unittest.TestCase):
+    module = pl1167_nrf24
+
+
+class PythonFrameHelpersTestCase(FrameHelpersMixin, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with mock.patch.dict(sys.modules, {"pymilight.radio.pl1167_frames": None}):
+            module = importlib.reload(pl1167_nrf24)
+            cls.module = types.SimpleNamespace(
+                calc_crc=module.calc_crc,
+                encode_frame=module.encode_frame,
+                decode_frame=module.decode_frame,
+            )
+        importlib.reload(pl1167_nrf24)
+
+    def test_fallback_used(self):
+        self.assertEqual("pymilight.radio.pl1167_nrf24", self.module.calc_crc.__module__)
+
+
+class PL1167TestCase(unittest.TestCase):
+    def test_transmit_receive(self):
+        rf = mock.MagicMock()
+        pl1167 = pl1167_nrf24.PL1167_nRF24(rf)
+        pl1167.setCRC(True)
+        pl1167.setMaxPacketLength(10)
+
+        packet = bytearray(b"\x09\x00\xdb\xe1\x21\x66\xd1\xba\x66\xcc")
+        pl1167.writeFIFO(memoryview(packet))
+        pl1167.transmit(8)
+        frame = rf.write.call_args[0][0]
+
+        rf.read.return_value = frame
+        self.assertEqual(10, pl1167.internal_receive())
+        self.assertEqual(packet, pl1167.readFIFO(10))
+
+
+class ReopeningPL1167(pl1167_nrf24.PL1167_nRF24):
+    """Opens the radio again after every read, as internal_receive used to."""
+
+    def receive(self, channel):
+        self._listening = False
+        return super(ReopeningPL1167, self).receive(channel)
+
+    def internal_receive(self):
+        length = super(ReopeningPL1167, self).internal_receive()
+        self.open()
+        return length
+
+
+class BackToBackReceiveTestCase(unittest.TestCase):
+    FRAMES = 30
+    CHANNEL = 9
+
+    def receive_rate(self, cls):
+        """Frames per second of simulated SPI time, and SPI transactions per frame."""
+        rf = SimulatedRF24(max_queued=self.FRAMES)
+        pl1167 = cls(rf)
+        pl1167.open()
+        pl1167.setCRC(True)
+        pl1167.setSyncword(0x147A, 0x258B)
+        pl1167.setMaxPacketLength(10)
+        pl1167.receive(self.CHANNEL)
+
+        packet = bytes([9]) + bytes(range(9))
+        frame = bytearray(pl1167_nrf24.MAX_FRAME_LENGTH)
+        length = pl1167_nrf24.encode_frame(packet, True, frame)
+        for _ in range(self.FRAMES):
+            rf.inject(frame[:length])
+
+        rf.reset()
+        start = rf.clock
+        for _ in range(self.FRAMES):
+            self.assertEqual(len(packet), pl1167.receive(self.CHANNEL))
+            self.assertEqual(packet, pl1167.readFIFO(len(packet)))
+        return self.FRAMES / (rf.clock - start), rf.spi_transactions / float(self.FRAMES)
+
+    def test_frames_per_second(self):
+        rate, transactions = self.receive_rate(pl1167_nrf24.PL1167_nRF24)
+        reopen_rate, reopen_transactions = self.receive_rate(ReopeningPL1167)
+
+        # available() and read() are all a good frame takes.
+        self.assertEqual(3, transactions)
+        self.assertGreater(reopen_transactions, 40)
+        self.assertGreater(rate, 50000)
+        self.assertLess(reopen_rate, 250)
+
+    def test_bad_frame_flushes(self):
+        rf = SimulatedRF24()
+        pl1167 = pl1167_nrf24.PL1167_nRF24(rf)
+        pl1167.open()
+        pl1167.setCRC(True)
+        pl1167.receive(self.CHANNEL)
+
+        rf.inject(b"\x01\x02\x03\x04")
+        rf.inject(b"\x05\x06\x07\x08")
+        self.assertEqual(0, pl1167.receive(self.CHANNEL))
+        self.assertFalse(rf.available())
@@ -0,0 +1,123 @@
+import queue
+import threading
+import unittest
+import unittest.mock
+
+from pymilight.milight_control import MiLightController, create_modules
+from pymilight.radio import SimulatedRF24
+from pymilight.radio_module import FORMATTERS, RadioModule
+
+
+def build_controller(modules):
+    return MiLightController(queue.Queue(), queue.Queue(), threading.Event(), False, modules=modules)
+
+
+class RadioModuleTestCase(unittest.TestCase):
+    def test_create_modules(self):
+        modules = create_modules({
+            "radios": [
+                {"backend": "simulator", "device_types": ["rgb_cct"]},
+                {"backend": "simulator", "name": "second"},
+                {"backend": "simulator", "receive_only": True},
+            ]
+        })
+
+        self.assertEqual(["radio0", "second", "radio2"], [module.name for module in modules])
+        self.assertEqual([True, True, False], [module.handles("rgb_cct") for module in modules])
+        self.assertEqual([False, False, True], [module.receives for module in modules])
+
+    def test_default_module_receives(self):
+        modules = create_modules({"radio_backend": "simulator"})
+        self.assertEqual(1, len(modules))
+        self.assertTrue(modules[0].receives)
+
+    def test_sharding(self):
+        modules = [RadioModule(SimulatedRF24()) for _ in range(2)]
+        controller = build_controller(modules)
+        controller.begin()
+
+        for device_id in (0x10, 0x11, 0x12):
+            controller.process_command(("rgb_cct", device_id, 1, {"state": "ON"}))
+        controller.flush()
+
+        self.assertIs(modules[0], controller.module_for("rgb_cct", 0x10))
+        self.assertIs(modules[1], controller.module_for("rgb_cct", 0x11))
+        self.assertEqual(2 * len(modules[1].rf.frames), len(modules[0].rf.frames))
+
+    def test_receive_only_not_sharded(self):
+        listener = RadioModule(SimulatedRF24(), receive_only=True)
+        sender = RadioModule(SimulatedRF24())
+        controller = build_controller([listener, sender])
+
+        self.assertIs(sender, controller.module_for("rgb_cct", 0x10))
+        self.assertIs(sender, controller.module_for("rgb_cct", 0x11))
+        self.assertEqual(sender.radios, controller.radios)
+
+        only_listening = build_controller([RadioModule(SimulatedRF24(), receive_only=True)])
+        with self.assertRaises(Exception):
+            only_listening.module_for("rgb_cct", 0x10)
+
+    def test_thread(self):
+        module = RadioModule(SimulatedRF24())
+        module.begin()
+        module.radio_poll_interval = None
+        module.start()
+        sent = threading.Event()
+
+        module.submit("bulb", "rgb_cct", bytes(9), 3)
+        module.notify("bulb", sent.set)
+        self.assertTrue(sent.wait(1))
+        module.stop()
+        module.join(1)
+
+        self.assertFalse(module.is_alive())
+        self.assertFalse(module.busy())
+        # Three repeats on three channels.
+        self.assertEqual(9, len(module.rf.frames))
+
+    def test_receive(self):
+        module = RadioModule(SimulatedRF24(loopback=True), receive=True)
+        controller = build_controller([module])
+        controller.begin()
+        module.on_packet = unittest.mock.Mock()
+
+        controller.process_command(("rgb_cct", 0x1234, 2, {"state": "ON"}))
+        controller.flush()
+        module.receive()
+
+        device_type, parsed = module.on_packet.call_args[0]
+        self.assertEqual("rgb_cct", device_type)
+        self.assertEqual(("rgb_cct", 0x1234, 2), parsed[:3])
+
+    def test_receive_notifications(self):
+        module = create_modules({"radio_backend": "simulator"})[0]
+        controller = build_controller([module])
+        controller.begin()
+        received = threading.Event()
+        module.on_packet = lambda device_type, parsed: received.set()
+        module.start()
+
+        # A packet from another transmitter.
+        sender = RadioModule(SimulatedRF24())
+        sending = build_controller([sender])
+        sending.begin()
+        sending.process_command(("rgb_cct", 0x1234, 2, {"state": "ON"}))
+        sending.flush()
+        module.rf.inject(sender.rf.frames[0].payload)
+
+        self.assertTrue(received.wait(1))
+        self.assertIsNone(module.radio_poll_interval)
+        module.stop()
+        module.join(1)
+
+    def test_radio_per_remote_type(self):
+        module = RadioModule(SimulatedRF24())
+        controller = build_controller([module])
+
+        # Only remote types with a packet formatter get a radio to begin().
+        self.assertEqual(set(FORMATTERS), set(module.radios))
+        self.assertEqual(set(FORMATTERS), set(module.parsers))
+        self.assertTrue(module.handles("rgb_cct"))
+        self.assertFalse(module.handles("cct"))
+        with self.assertRaisesRegex(Exception, "No packet formatter for cct"):
+            controller.set_current_radio("cct")
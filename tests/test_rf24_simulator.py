@@ -0,0 +1,69 @@
+import queue
+import threading
+import unittest
+
+from pymilight.milight_control import MiLightController
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+from pymilight.radio import MiLightRadioConfig, NRF24MiLightRadio, SimulatedRF24
+from pymilight.radio.rf24_simulator import TX_SETTLE_TIME
+
+
+class SimulatedRF24TestCase(unittest.TestCase):
+    def test_records_frames(self):
+        rf = SimulatedRF24()
+        rf.begin()
+        rf.openWritingPipe(b"\x01\x02\x03\x04\x05")
+        rf.setChannel(10)
+        rf.write(b"\x00" * 12)
+        rf.setChannel(20)
+        rf.write(b"\x00" * 12)
+
+        self.assertEqual([10, 20], [frame.channel for frame in rf.frames])
+        self.assertEqual(b"\x01\x02\x03\x04\x05", rf.frames[0].address)
+        # 1 byte preamble, 5 address, 12 payload, 2 CRC and 9 control bits at 1 Mbps.
+        airtime = TX_SETTLE_TIME + (20 * 8 + 9) / 1e6
+        self.assertAlmostEqual(airtime, rf.frame_airtime(12))
+        self.assertAlmostEqual(2 * airtime, rf.airtime)
+        self.assertAlmostEqual(rf.frames[1].timestamp, rf.clock)
+
+    def test_loopback(self):
+        rf = SimulatedRF24(loopback=True)
+        radio = NRF24MiLightRadio(rf, MiLightRadioConfig.CONFIG_RGB_CCT)
+        radio.begin()
+
+        formatter = PyRgbCctPacketFormatter()
+        formatter.prepare(0x1234, 2)
+        packet = formatter.update_brightness(50)
+        radio.write(packet)
+
+        self.assertTrue(radio.available())
+        self.assertEqual(packet, radio.read(9))
+        self.assertEqual(
+            ("rgb_cct", 0x1234, 2, {"brightness": 128}),
+            formatter.parse(bytearray(packet))
+        )
+
+    def test_ignores_other_address(self):
+        rf = SimulatedRF24(loopback=True)
+        rf.openReadingPipe(1, b"\x01\x02\x03\x04\x05")
+        rf.openWritingPipe(b"\x05\x04\x03\x02\x01")
+        rf.write(b"\x00")
+        rf.inject(b"\x01")
+        rf.startListening()
+        self.assertTrue(rf.available())
+        self.assertEqual(b"\x01", rf.read(1))
+        self.assertFalse(rf.available())
+
+    def test_controller(self):
+        rf = SimulatedRF24()
+        controller = MiLightController(queue.Queue(), queue.Queue(), threading.Event(), False, rf=rf)
+        controller.begin()
+        rf.reset()
+
+        controller.process_command(("rgb_cct", 0x1234, 2, {"state": "ON", "brightness": 255}))
+        controller.flush()
+
+        # Two packets, each sent on three channels per repeat.
+        self.assertEqual(0, len(rf.frames) % 3)
+        self.assertGreaterEqual(len(rf.frames), 2 * 3 * controller.packet_repeat_minimum)
+        self.assertEqual({10, 41, 72}, set(frame.channel for frame in rf.frames))
@@ -1,7 +1,15 @@
 import json
 import unittest
 
-from pymilight.rgb_converter import hsv_to_rgb, rgb_to_hsv
+from pymilight.rgb_converter import (
+    hsv_to_rgb, hsv_to_rgb_batch, rgb_to_hsl, rgb_to_hsl_batch, rgb_to_hsv, rgb_to_hsv_batch
+)
+
+COLORS = [(255, 255, 255), (255, 0, 0), (0, 255, 0), (0, 10, 255), (12, 34, 56)]
+
+
+def colors_array(colors):
+    return memoryview(bytes(value for color in colors for value in color)).cast("B", (len(colors), 3))
 
 
 class RgbConverterTestCase(unittest.TestCase):
@@ -37,4 +45,41 @@ class RgbConverterTestCase(unittest.TestCase):
         self.assertEqual((0, 255, 0), rgb)
 
         rgb = hsv_to_rgb(0.66013071895, 1, 1)
-        self.assertEqual((0, 9, 255), rgb)
\ No newline at end of file
+        self.assertEqual((0, 9, 255), rgb)
+
+    def test_batch(self):
+        rgb = colors_array(COLORS)
+
+        hsv = memoryview(rgb_to_hsv_batch(rgb))
+        self.assertEqual((len(COLORS), 3), hsv.shape)
+        self.assertEqual([rgb_to_hsv(*color) for color in COLORS], hsv.tolist())
+        self.assertEqual(
+            [rgb_to_hsl(*color) for color in COLORS], memoryview(rgb_to_hsl_batch(rgb)).tolist()
+        )
+        self.assertEqual(
+            [list(hsv_to_rgb(*row)) for row in hsv.tolist()], memoryview(hsv_to_rgb_batch(hsv)).tolist()
+        )
+
+    def test_batch_empty(self):
+        empty = memoryview(bytes(3)).cast("B", (1, 3))[:0]
+
+        for convert in (rgb_to_hsv_batch, rgb_to_hsl_batch):
+            result = memoryview(convert(empty))
+            self.assertEqual((0, 3), result.shape)
+            self.assertEqual("d", result.format)
+        result = memoryview(hsv_to_rgb_batch(memoryview(rgb_to_hsv_batch(empty))))
+        self.assertEqual((0, 3), result.shape)
+        self.assertEqual("B", result.format)
+
+    def test_batch_out(self):
+        hsv = rgb_to_hsv_batch(colors_array(COLORS))
+        buffer = bytearray(3 * len(COLORS))
+        out = memoryview(buffer).cast("B", (len(COLORS), 3))
+
+        self.assertIs(out, hsv_to_rgb_batch(hsv, out))
+        self.assertEqual(colors_array([hsv_to_rgb(*row) for row in memoryview(hsv).tolist()]).tobytes(), buffer)
+
+        with self.assertRaises(ValueError):
+            hsv_to_rgb_batch(hsv, memoryview(bytearray(3)).cast("B", (1, 3)))
+        with self.assertRaises(ValueError):
+            rgb_to_hsv_batch(memoryview(bytes(8)).cast("B", (2, 4)))
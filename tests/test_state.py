@@ -28,6 +28,12 @@ class MiLightStateTestCase(unittest.TestCase):
         state2.load(dumped)
         self.assertTrue(state2.state)
 
+    def test_slots(self):
+        state = State()
+        self.assertFalse(hasattr(state, "__dict__"))
+        with self.assertRaises(AttributeError):
+            state.unknown_field = 1
+
     def test_apply_state1(self):
         state = State()
         state.state = True
@@ -97,4 +103,30 @@ class MiLightStateTestCase(unittest.TestCase):
             "effect": 'white_mode',
             "color_temp": 370,
             "kelvin": 2700
-        }, result)
\ No newline at end of file
+        }, result)
+
+    def test_render_cached(self):
+        state = State()
+        state.state = True
+        state.bulb_mode = BULB_MODE_COLOR
+        state.hue = 200
+
+        rendered = state.render()
+        expected = {}
+        state.apply_state(expected)
+        self.assertEqual(expected, rendered)
+        self.assertIs(rendered, state.render())
+        self.assertEqual(expected, json.loads(state.render_json().decode("utf-8")))
+        self.assertIs(state.render_json(), state.render_json())
+
+        state.state = False
+        self.assertEqual("OFF", state.render()["state"])
+        self.assertEqual("OFF", json.loads(state.render_json().decode("utf-8"))["state"])
+
+    def test_render_after_load(self):
+        state = State()
+        state.state = True
+        self.assertEqual("ON", state.render()["state"])
+
+        state.set_fields({"_state": False})
+        self.assertEqual("OFF", state.render()["state"])
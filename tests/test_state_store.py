@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pymilight.state_journal import JOURNAL_NAME, SNAPSHOT_NAME
+from pymilight.state_store import StateStore
+
+
+KEY = ("rgb_cct", 0x1234, 1)
+
+
+class StateStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_lines(self, name):
+        with open(os.path.join(self.root, name)) as fobj:
+            return [json.loads(line) for line in fobj]
+
+    def test_load_round_trip(self):
+        store = StateStore(self.root)
+        store[KEY].patch({"state": "ON", "brightness": 50, "hue": 120})
+        store.mark_dirty(KEY)
+        store.close()
+
+        loaded = StateStore(self.root)
+        loaded.load()
+        self.assertEqual(store[KEY].get_fields(), loaded[KEY].get_fields())
+        self.assertFalse(loaded[KEY].is_dirty)
+
+    def test_journal_holds_deltas(self):
+        store = StateStore(self.root)
+        store[KEY].patch({"state": "ON", "brightness": 50})
+        store.mark_dirty(KEY)
+        store.flush()
+        store[KEY].patch({"brightness": 20})
+        store.mark_dirty(KEY)
+        store.flush()
+        # Nothing changed, nothing written.
+        store.mark_dirty(KEY)
+        store.flush()
+
+        lines = self.read_lines(JOURNAL_NAME)
+        self.assertEqual(2, len(lines))
+        self.assertEqual(["rgb_cct", 0x1234, 1, {"_brightness": store[KEY].brightness}], lines[1])
+
+    def test_only_dirty_keys_written(self):
+        store = StateStore(self.root)
+        store[KEY].state = True
+        store[("rgb_cct", 0x1234, 2)].state = True
+        store.mark_dirty(KEY)
+        store.flush()
+
+        lines = self.read_lines(JOURNAL_NAME)
+        self.assertEqual([KEY], [tuple(line[:3]) for line in lines])
+
+    def test_compaction(self):
+        store = StateStore(self.root, compact_entries=3)
+        for brightness in (10, 20, 30):
+            store[KEY].patch({"brightness": brightness})
+            store.mark_dirty(KEY)
+            store.flush()
+
+        self.assertEqual([], self.read_lines(JOURNAL_NAME))
+        snapshot = self.read_lines(SNAPSHOT_NAME)
+        self.assertEqual(1, len(snapshot))
+        self.assertEqual(store[KEY].get_fields(), snapshot[0][3])
+
+        store[KEY].state = False
+        store.mark_dirty(KEY)
+        store.close()
+
+        loaded = StateStore(self.root)
+        loaded.load()
+        self.assertEqual(store[KEY].get_fields(), loaded[KEY].get_fields())
+
+    def test_truncated_journal(self):
+        store = StateStore(self.root)
+        store[KEY].state = True
+        store.mark_dirty(KEY)
+        store.close()
+        with open(os.path.join(self.root, JOURNAL_NAME), "a") as fobj:
+            fobj.write('["rgb_cct",4660,1,{"_sta')
+
+        loaded = StateStore(self.root)
+        loaded.load()
+        self.assertTrue(loaded[KEY].state)
+
+    def test_append_after_truncated_journal(self):
+        other = ("rgb_cct", 1, 3)
+        store = StateStore(self.root)
+        store[KEY].state = True
+        store.mark_dirty(KEY)
+        store.flush()
+        store[KEY].patch({"brightness": 20})
+        store.mark_dirty(KEY)
+        store.close()
+        path = os.path.join(self.root, JOURNAL_NAME)
+        with open(path, "r+b") as fobj:
+            fobj.truncate(os.path.getsize(path) - 5)
+
+        restarted = StateStore(self.root)
+        restarted.load()
+        self.assertTrue(restarted[KEY].state)
+        restarted[other].patch({"state": "ON", "brightness": 70})
+        restarted.mark_dirty(other)
+        restarted.close()
+
+        loaded = StateStore(self.root)
+        loaded.load()
+        self.assertTrue(loaded[KEY].state)
+        self.assertEqual(restarted[other].get_fields(), loaded[other].get_fields())
+        self.assertEqual(2, len(self.read_lines(JOURNAL_NAME)))
+
+    def test_write_behind(self):
+        store = StateStore(self.root)
+        store.start(interval=0.01)
+        store[KEY].state = True
+        store.mark_dirty(KEY)
+        store.close()
+        self.assertEqual(1, len(self.read_lines(JOURNAL_NAME)))
+
+    def test_fields_taken_at_mark_dirty(self):
+        store = StateStore(self.root)
+        store[KEY].patch({"state": "ON", "brightness": 50})
+        marked = store[KEY].get_fields()
+        store.mark_dirty(KEY)
+        # Not marked, so left for the next flush after it is.
+        store[KEY].patch({"brightness": 20})
+        store.flush()
+
+        lines = self.read_lines(JOURNAL_NAME)
+        self.assertEqual([list(KEY) + [marked]], lines)
+
+    def test_mark_dirty_while_flushing(self):
+        store = StateStore(self.root)
+        store.start(interval=0.001)
+        for brightness in range(500):
+            key = ("rgb_cct", 0x1234, brightness % 8)
+            store[key].patch({"brightness": brightness % 100})
+            store.mark_dirty(key)
+        store.close()
+
+        loaded = StateStore(self.root)
+        loaded.load()
+        for group_id in range(8):
+            key = ("rgb_cct", 0x1234, group_id)
+            self.assertEqual(store[key].get_fields(), loaded[key].get_fields())
+
+    def test_in_memory(self):
+        store = StateStore(None)
+        store.load()
+        store[KEY].state = True
+        store.mark_dirty(KEY)
+        store.close()
+        self.assertTrue(store[KEY].state)
+        self.assertEqual([], os.listdir(self.root))
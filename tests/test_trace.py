@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pymilight import trace
+from pymilight.radio import SimulatedRF24
+from pymilight.radio.pl1167_nrf24 import PL1167_nRF24
+
+
+class PacketTraceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_record(self):
+        packet_trace = trace.PacketTrace(4)
+        packet_trace.record(trace.TX, 9, b"\x01\x02", bytearray(b"\x03"))
+        packet_trace.record(trace.RX, 40, b"\x04", crc_ok=False)
+
+        records = list(packet_trace.records())
+        self.assertEqual(2, len(packet_trace))
+        self.assertEqual(
+            [(trace.TX, 9, True, b"\x01\x02", b"\x03"), (trace.RX, 40, False, b"\x04", b"")],
+            [record[1:] for record in records]
+        )
+        self.assertLessEqual(records[0].timestamp, records[1].timestamp)
+
+    def test_wraps(self):
+        packet_trace = trace.PacketTrace(3)
+        for value in range(7):
+            packet_trace.record(trace.TX, value, bytes([value]))
+
+        self.assertEqual(3, len(packet_trace))
+        self.assertEqual([4, 5, 6], [record.channel for record in packet_trace.records()])
+
+    def test_truncates(self):
+        packet_trace = trace.PacketTrace(1)
+        packet_trace.record(trace.RX, 0, bytes(range(40)))
+        self.assertEqual(bytes(range(trace.MAX_BYTES)), next(packet_trace.records()).raw)
+
+    def test_dump_load(self):
+        path = os.path.join(self.root, "trace.bin")
+        for count in (2, 3, 5):
+            packet_trace = trace.PacketTrace(3)
+            for value in range(count):
+                packet_trace.record(trace.TX, value, bytes([value]))
+
+            self.assertEqual(min(count, 3), packet_trace.dump(path))
+            self.assertEqual(list(packet_trace.records()), trace.load(path))
+
+    def test_disabled(self):
+        packet_trace = trace.PacketTrace(3)
+        packet_trace.enabled = False
+        packet_trace.record(trace.TX, 0, b"\x00")
+        self.assertEqual(0, len(packet_trace))
+
+    def test_pl1167_traced(self):
+        packet_trace = trace.PacketTrace()
+        rf = SimulatedRF24(loopback=True)
+        pl1167 = PL1167_nRF24(rf, packet_trace)
+        pl1167.open()
+        pl1167.setCRC(True)
+        pl1167.setMaxPacketLength(10)
+
+        packet = bytes([9]) + bytes(range(9))
+        pl1167.writeFIFO(packet)
+        pl1167.transmit(9)
+        self.assertEqual(len(packet), pl1167.receive(9))
+
+        sent, received = packet_trace.records()
+        self.assertEqual((trace.TX, 9, packet), (sent.direction, sent.channel, sent.decoded))
+        self.assertEqual((trace.RX, 9, packet), (received.direction, received.channel, received.decoded))
+        self.assertEqual(sent.raw, received.raw)
+        self.assertEqual(rf.frames[0].payload, sent.raw)
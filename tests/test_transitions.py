@@ -0,0 +1,150 @@
+import queue
+import threading
+import unittest
+
+from pymilight.milight_control import MiLightController
+from pymilight.packet_formatter import PyRgbCctPacketFormatter
+from pymilight.radio import SimulatedRF24
+from pymilight.radio_module import RadioModule
+from pymilight.transitions import TransitionEngine
+
+from conftest import FakeClock
+
+
+def run(engine, clock, until):
+    steps = []
+    while clock.now <= until:
+        steps.extend(engine.due())
+        clock.now = round(clock.now + 0.01, 6)
+    return steps
+
+
+class TransitionEngineTestCase(unittest.TestCase):
+    def test_fade(self):
+        clock = FakeClock()
+        engine = TransitionEngine(clock=clock)
+        engine.start("bulb", "update_brightness", 0, 100, 1.0)
+
+        steps = run(engine, clock, 1.5)
+
+        values = [step.value for step in steps]
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(100, values[-1])
+        self.assertEqual([False] * (len(steps) - 1) + [True], [step.final for step in steps])
+        # About one step per minimum interval.
+        self.assertTrue(18 <= len(steps) <= 20, len(steps))
+        self.assertFalse(engine)
+
+    def test_nothing_to_fade(self):
+        engine = TransitionEngine()
+        self.assertIsNone(engine.start("bulb", "update_brightness", None, 100, 1.0))
+        self.assertIsNone(engine.start("bulb", "update_brightness", 100, 100, 1.0))
+        self.assertIsNone(engine.start("bulb", "update_brightness", 0, 100, 0))
+        self.assertIsNone(engine.timeout())
+
+    def test_budget(self):
+        clock = FakeClock()
+        engine = TransitionEngine(budget=20, clock=clock)
+        for bulb in range(10):
+            engine.start(bulb, "update_brightness", 0, 100, 2.0)
+        self.assertAlmostEqual(0.5, engine.interval())
+
+        steps = run(engine, clock, 2.5)
+
+        # 10 fades sharing 20 packets a second get 2 steps a second each.
+        self.assertLessEqual(len(steps), 20 * 2.0 + 10)
+        self.assertEqual(10, len([step for step in steps if step.final]))
+
+    def test_skips_unchanged_values(self):
+        clock = FakeClock()
+        engine = TransitionEngine(clock=clock)
+        engine.start("bulb", "update_brightness", 10, 12, 1.0)
+
+        # The target is sent again at the end, with the usual repeats.
+        self.assertEqual([11, 12, 12], [step.value for step in run(engine, clock, 1.5)])
+
+    def test_hue_takes_short_way_round(self):
+        clock = FakeClock()
+        engine = TransitionEngine(clock=clock)
+        engine.start("bulb", "update_hue", 350, 10, 1.0, wrap=360)
+
+        values = [step.value for step in run(engine, clock, 1.5)]
+        self.assertTrue(all(value >= 350 or value <= 10 for value in values), values)
+        self.assertEqual(10, values[-1])
+
+    def test_cancel(self):
+        clock = FakeClock()
+        engine = TransitionEngine(clock=clock)
+        engine.start("bulb", "update_brightness", 0, 100, 1.0)
+        engine.start("bulb", "update_hue", 0, 100, 1.0)
+        engine.start("other", "update_hue", 0, 100, 1.0)
+        run(engine, clock, 0.5)
+
+        fades = engine.cancel("bulb")
+
+        self.assertEqual(2, len(fades))
+        self.assertTrue(0 < fades[0].sent < 100)
+        self.assertEqual(1, len(engine))
+
+
+class ControllerTransitionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.controller = MiLightController(
+            queue.Queue(), queue.Queue(), threading.Event(), False,
+            modules=[RadioModule(SimulatedRF24())]
+        )
+        self.controller.transitions = TransitionEngine(clock=self.clock)
+        self.controller.begin()
+        self.written = []
+        self.controller.write = lambda packet, repeats=None: self.written.append((bytes(packet), repeats))
+        self.parser = PyRgbCctPacketFormatter()
+
+    def sent_fields(self):
+        return [(self.parser.parse(packet)[3], repeats) for packet, repeats in self.written]
+
+    def test_fade_brightness(self):
+        key = ("rgb_cct", 0x1234, 1)
+        self.controller.process_command(key + ({"state": "ON", "brightness": 0},))
+        self.written.clear()
+
+        self.controller.process_command(key + ({"state": "ON", "brightness": 255, "transition": 1},))
+        # Only turned on straight away, the state has the target.
+        self.assertEqual([{"state": "ON"}], [fields for fields, _ in self.sent_fields()])
+        self.assertEqual(100, self.controller.store[key].brightness)
+
+        while self.controller.transitions:
+            self.clock.now += 0.01
+            self.controller.step_transitions()
+
+        fades = self.sent_fields()[1:]
+        brightness = [fields["brightness"] for fields, _ in fades]
+        self.assertEqual(brightness, sorted(brightness))
+        self.assertEqual(255, brightness[-1])
+        # Steps use the fewest repeats, the final value the usual count.
+        self.assertEqual(self.controller.packet_repeat_minimum, fades[0][1])
+        self.assertIsNone(fades[-1][1])
+
+    def test_new_command_stops_fade(self):
+        key = ("rgb_cct", 0x1234, 1)
+        self.controller.process_command(key + ({"state": "ON", "hue": 0},))
+        self.controller.process_command(key + ({"state": "ON", "hue": 100, "transition": 1},))
+        self.clock.now = 0.5
+        self.controller.step_transitions()
+
+        self.controller.process_command(key + ({"state": "ON", "saturation": 50},))
+
+        self.assertFalse(self.controller.transitions)
+        # Where the fade got to, give or take the state's rounding.
+        self.assertAlmostEqual(50, self.controller.store[key].hue, delta=1)
+
+    def test_budget_from_airtime(self):
+        module = self.controller.modules[0]
+        # Half of 2000 frames/s, each step 3 repeats on 3 channels.
+        self.assertAlmostEqual(0.5 * module.airtime.rate / 9, self.controller.transitions.budget)
+
+        module.airtime.rate = 900
+        self.controller.packet_repeat_minimum = 5
+        self.controller.fade_airtime_share = 0.25
+        self.controller.update_transition_budget()
+        self.assertAlmostEqual(15, self.controller.transitions.budget)
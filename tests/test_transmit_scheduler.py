@@ -0,0 +1,161 @@
+import unittest
+import unittest.mock
+
+from pymilight.transmit_scheduler import TransmitScheduler
+
+from conftest import FakeClock
+
+
+class RecordingRadio(object):
+    def __init__(self, sent, clock=None):
+        self.sent = sent
+        self.clock = clock
+        self.configured = 0
+
+    def configure(self):
+        self.configured += 1
+
+    def write(self, packet):
+        self.sent.append(packet)
+        if self.clock is not None:
+            self.clock.now += 0.001
+
+
+class TransmitSchedulerTestCase(unittest.TestCase):
+    def test_round_robin(self):
+        sent = []
+        radio = RecordingRadio(sent)
+        scheduler = TransmitScheduler()
+        scheduler.add("a", radio, b"a1", 2)
+        scheduler.add("a", radio, b"a2", 2)
+        scheduler.add("b", radio, b"b1", 3)
+        self.assertEqual(3, len(scheduler))
+
+        scheduler.flush()
+
+        # Bulbs take turns, each bulb's packets stay in order.
+        self.assertEqual([b"a1", b"b1", b"a1", b"b1", b"a2", b"b1", b"a2"], sent)
+        self.assertFalse(scheduler)
+        self.assertEqual(7, scheduler.sent)
+
+    def test_first_copies_go_first(self):
+        sent = []
+        radio = RecordingRadio(sent)
+        scheduler = TransmitScheduler()
+        for key in range(5):
+            scheduler.add(key, radio, bytes([key]), 10)
+
+        scheduler.step()
+        self.assertEqual([bytes([key]) for key in range(5)], sent)
+
+    def test_deadline(self):
+        clock = FakeClock()
+        sent = []
+        radio = RecordingRadio(sent, clock)
+        scheduler = TransmitScheduler(clock)
+        scheduler.add("a", radio, b"a1", 10, timeout=0.0035)
+        scheduler.add("b", radio, b"b1", 1, timeout=0)
+        self.assertEqual(11, scheduler.queued_repeats)
+
+        scheduler.flush()
+
+        self.assertEqual([b"a1", b"b1", b"a1", b"a1"], sent)
+        self.assertEqual(7, scheduler.expired)
+        self.assertEqual(0, scheduler.queued_repeats)
+
+    def test_notify(self):
+        sent = []
+        radio = RecordingRadio(sent)
+        scheduler = TransmitScheduler()
+        callback = unittest.mock.Mock()
+
+        scheduler.notify("a", callback)
+        callback.assert_called_once_with()
+
+        callback.reset_mock()
+        scheduler.add("a", radio, b"a1", 1)
+        scheduler.add("a", radio, b"a2", 2)
+        scheduler.notify("a", callback)
+        scheduler.step()
+        scheduler.step()
+        callback.assert_not_called()
+        scheduler.step()
+        callback.assert_called_once_with()
+
+    def test_write_failure(self):
+        sent = []
+
+        class FailingRadio(RecordingRadio):
+            def write(self, packet):
+                if packet == b"bad":
+                    raise IOError("SPI error")
+                super(FailingRadio, self).write(packet)
+
+        radio = FailingRadio(sent)
+        scheduler = TransmitScheduler()
+        callback = unittest.mock.Mock()
+        scheduler.add("a", radio, b"a1", 2)
+        scheduler.add("b", radio, b"bad", 3)
+        scheduler.add("b", radio, b"b2", 1)
+        scheduler.add("c", radio, b"c1", 2)
+        scheduler.notify("b", callback)
+
+        with self.assertRaises(IOError):
+            scheduler.step()
+        # Only the packet that failed is dropped.
+        self.assertEqual(1, scheduler.failed)
+        self.assertEqual(1 + 1 + 2, scheduler.queued_repeats)
+
+        scheduler.flush()
+        self.assertEqual([b"a1", b"a1", b"b2", b"c1", b"c1"], sent)
+        self.assertEqual(0, scheduler.queued_repeats)
+        callback.assert_called_once_with()
+
+    def test_configures_on_radio_change(self):
+        sent = []
+        first = RecordingRadio(sent)
+        second = RecordingRadio(sent)
+        # No batching, remote types take turns every step.
+        scheduler = TransmitScheduler(batch_window=0)
+        scheduler.add("a", first, b"a", 2)
+        scheduler.add("b", second, b"b", 1)
+
+        scheduler.flush()
+
+        self.assertEqual(2, first.configured)
+        self.assertEqual(1, second.configured)
+
+    def test_batches_by_radio(self):
+        sent = []
+        first = RecordingRadio(sent)
+        second = RecordingRadio(sent)
+        scheduler = TransmitScheduler(FakeClock())
+        for key in range(4):
+            scheduler.add(key, (first, second)[key % 2], bytes([key]), 3)
+
+        scheduler.flush()
+
+        # All of the first type's repeats, then all of the second's.
+        self.assertEqual([b"\x00", b"\x02"] * 3 + [b"\x01", b"\x03"] * 3, sent)
+        self.assertEqual(1, first.configured)
+        self.assertEqual(1, second.configured)
+        self.assertEqual(2, scheduler.reconfigurations)
+
+    def test_batch_window(self):
+        clock = FakeClock()
+        sent = []
+        first = RecordingRadio(sent, clock)
+        second = RecordingRadio(sent, clock)
+        third = RecordingRadio(sent, clock)
+        scheduler = TransmitScheduler(clock, batch_window=0.0025)
+        scheduler.add("a", first, b"a", 10)
+        scheduler.add("b", second, b"b", 2)
+        scheduler.add("c", third, b"c", 1)
+
+        scheduler.flush()
+
+        # Each type gets the radio for the window, longest waiting first.
+        self.assertEqual(
+            [b"a", b"a", b"a", b"b", b"b", b"c", b"a", b"a", b"a", b"a", b"a", b"a", b"a"], sent
+        )
+        self.assertEqual(2, first.configured)